@@ -0,0 +1,66 @@
+"""
+Mide cuanto cuesta cada sesion nueva del chat: RSS y tiempo de `get_langchain_agent` por
+sesion agregada, armando `--sessions` agentes (cada uno con su propia vista mensual sintetica)
+en el mismo proceso, como los guarda la app en `st.session_state`.
+
+- `shared`: como corre la app, el LLM, las herramientas y el prompt se comparten
+  (`get_shared_agent`) y cada sesion solo agrega su memoria y sus datos.
+- `isolated`: se limpian los compartidos antes de cada agente, asi cada sesion arma su propio
+  LLM, herramientas y prompt (como era antes).
+
+Cada modo corre en su propio proceso. No se llama a OpenAI (la key es de mentira), pero
+tiktoken necesita tener su encoding descargado o en cache para contar los tokens del prompt.
+
+    python agent_memory_report.py --sessions 200
+"""
+import argparse
+import gc
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from process_movements import build_movements_dataframe, process_movements_dataframe
+from synthetic_movements import generate_movements
+
+def rss_mb():
+    # /proc/self/statm: la segunda columna son las paginas residentes (RSS actual, no el peak)
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+def build_sessions(n_sessions, mode, n_movements = 2000, open_api_key = 'sk-agent-memory-report'):
+    from langchain_agent import clear_shared_agents, get_langchain_agent
+
+    views = [process_movements_dataframe(build_movements_dataframe(generate_movements(n_movements, seed = seed)))
+             for seed in range(n_sessions)]
+    gc.collect()
+    sessions, build_seconds, rss = [], [], [rss_mb()]
+    for view in views:
+        if mode == 'isolated':
+            clear_shared_agents()
+        start = time.perf_counter()
+        sessions.append(get_langchain_agent(view, open_api_key, streaming = True))
+        build_seconds.append(time.perf_counter() - start)
+        rss.append(rss_mb())
+    return sessions, build_seconds, rss
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type = int, default = 100)
+    parser.add_argument('--movements', type = int, default = 2000, help = 'movimientos sinteticos por sesion')
+    parser.add_argument('--mode', choices = ['shared', 'isolated'])
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        sessions, build_seconds, rss = build_sessions(args.sessions, args.mode, args.movements)
+        # la primera sesion paga los imports de langchain (y en `shared` los compartidos), se informa aparte
+        added_mb = [after - before for before, after in zip(rss[1:-1], rss[2:])]
+        print(f'{args.mode:<9} primera sesion: {build_seconds[0] * 1000:.0f}ms +{rss[1] - rss[0]:.1f}MB | '
+              f'por sesion agregada: {statistics.median(build_seconds[1:]) * 1000:.1f}ms (mediana), '
+              f'{(rss[-1] - rss[1]) / max(len(sessions) - 1, 1):.2f}MB (promedio, max {max(added_mb, default = 0):.1f}MB) | '
+              f'rss final {rss[-1]:.0f}MB con {len(sessions)} sesiones')
+    else:
+        for mode in ('shared', 'isolated'):
+            subprocess.run([sys.executable, __file__, '--sessions', str(args.sessions), '--movements', str(args.movements),
+                            '--mode', mode], check = True)
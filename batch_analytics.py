@@ -0,0 +1,198 @@
+"""
+Calculo offline de los dataframes analiticos de muchos usuarios: lee un manifiesto (una linea
+JSON por usuario con `user_id`, `link_tokens`, `since` y `until`), reparte los usuarios en un
+pool de procesos y deja por usuario en `--output/<user_id>/`:
+
+- `final_view_monthly.parquet`: la vista mensual (lo mismo que `get_analytical_dataframes`),
+  con `year_month` como columna.
+- `movements.parquet`: los movimientos categorizados.
+- `_SUCCESS`: JSON con filas, meses y segundos; se escribe al final, asi que al volver a
+  correr el mismo comando se saltan los usuarios que ya lo tienen (`--force` los recalcula).
+
+Un usuario falla completo si falla un link o alguna de sus cuentas; queda en `_ERROR` y se
+reintenta en la siguiente corrida. Con `--replay` no se usa api.fintoc.com sino un
+`ReplayServer` local (ver fintoc_replay.py), y sin `--manifest` se arma uno con `--users`
+usuarios sobre los links de sus fixtures.
+
+    python batch_analytics.py --manifest users.jsonl --output out/ --secret-key sk_live_... --processes 8
+    python batch_analytics.py --replay --replay-profile fast --users 50 --output /tmp/batch --processes 4
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from metrics import METRICS
+
+SUCCESS_MARKER = '_SUCCESS'
+ERROR_MARKER = '_ERROR'
+
+# cada worker del pool arma su cliente de Fintoc una sola vez (ver `_init_worker`)
+_worker = {}
+
+def load_manifest(path):
+    """
+    Lee el manifiesto (JSON lines); `since` y `until` son opcionales y se completan con los
+    valores por defecto de la linea de comandos.
+    """
+    users = []
+    with open(path) as manifest_file:
+        for line_number, line in enumerate(manifest_file, start = 1):
+            if not line.strip():
+                continue
+            user = json.loads(line)
+            if 'user_id' not in user or not user.get('link_tokens'):
+                raise ValueError(f'{path}:{line_number}: cada usuario necesita user_id y link_tokens')
+            users.append(user)
+    user_ids = [str(user['user_id']) for user in users]
+    if len(set(user_ids)) != len(user_ids):
+        raise ValueError(f'{path}: hay user_id repetidos')
+    return users
+
+def user_output_dir(output_dir, user_id):
+    return os.path.join(output_dir, str(user_id))
+
+def is_done(output_dir, user_id):
+    return os.path.exists(os.path.join(user_output_dir(output_dir, user_id), SUCCESS_MARKER))
+
+def _write_json(path, record):
+    with open(path + '.tmp', 'w') as json_file:
+        json.dump(record, json_file, default = str)
+    os.replace(path + '.tmp', path)
+
+def _write_parquet(df, path):
+    # se escribe a un archivo temporal para no dejar parquets a medias si el proceso muere
+    df.to_parquet(path + '.tmp', index = False)
+    os.replace(path + '.tmp', path)
+
+def _init_worker(fintoc_secret_key, api_base_url, movement_store_path, fetch_workers):
+    from movement_store import MovementStore
+    from process_movements import make_fintoc_client
+
+    _worker.update(fintoc_client = make_fintoc_client(fintoc_secret_key, api_base_url),
+                   movement_store = MovementStore(movement_store_path) if movement_store_path else None,
+                   fetch_workers = fetch_workers)
+
+def process_user(user, output_dir, since, until):
+    """
+    Descarga y procesa los movimientos de un usuario y escribe sus parquets. Corre dentro de un
+    worker del pool; retorna un resumen (con `error` si fallo) en vez de lanzar la excepcion.
+    """
+    from process_movements import get_dataframe_movements_for_link_tokens, process_movements_dataframe
+
+    user_id = str(user['user_id'])
+    user_dir = user_output_dir(output_dir, user_id)
+    os.makedirs(user_dir, exist_ok = True)
+    summary = dict(user_id = user_id, pid = os.getpid(), rows = 0, months = 0, error = None)
+    start = time.perf_counter()
+    try:
+        movements_df = get_dataframe_movements_for_link_tokens(user['link_tokens'],
+                                                               since = user.get('since', since),
+                                                               until = user.get('until', until),
+                                                               fintoc_client = _worker['fintoc_client'],
+                                                               max_workers = _worker['fetch_workers'],
+                                                               movement_store = _worker['movement_store'])
+        failed_accounts = movements_df.attrs['failed_accounts']
+        if failed_accounts:
+            raise RuntimeError(f'fallaron {len(failed_accounts)} cuentas: {failed_accounts}')
+        final_view_monthly = process_movements_dataframe(movements_df)
+        _write_parquet(movements_df, os.path.join(user_dir, 'movements.parquet'))
+        # la vista mensual esta indexada por year_month, que se escribe como columna
+        _write_parquet(final_view_monthly.reset_index(), os.path.join(user_dir, 'final_view_monthly.parquet'))
+        summary.update(rows = len(movements_df), months = len(final_view_monthly))
+    except Exception as e:
+        summary['error'] = repr(e)
+    summary['seconds'] = time.perf_counter() - start
+    if summary['error'] is None:
+        _write_json(os.path.join(user_dir, SUCCESS_MARKER), summary)
+        if os.path.exists(os.path.join(user_dir, ERROR_MARKER)):
+            os.remove(os.path.join(user_dir, ERROR_MARKER))
+    else:
+        _write_json(os.path.join(user_dir, ERROR_MARKER), summary)
+    return summary
+
+def run_batch(users, output_dir, fintoc_secret_key, since, until, processes = None, api_base_url = None,
+              movement_store_path = None, fetch_workers = None, force = False, on_result = None):
+    """
+    Procesa en un pool de `processes` procesos los usuarios que no esten terminados (todos con
+    `force`) y retorna el resumen de cada uno. `on_result(summary, done, total)` se llama al
+    terminar cada usuario.
+    """
+    import pandas as pd
+
+    from process_movements import FETCH_MAX_WORKERS
+
+    # sin pyarrow/fastparquet fallarian todos los usuarios recien despues de descargarlos
+    pd.io.parquet.get_engine('auto')
+    pending = [user for user in users if force or not is_done(output_dir, user['user_id'])]
+    METRICS.event('batch_start', users = len(users), pending = len(pending), processes = processes)
+    summaries = []
+    if not pending:
+        return summaries
+    with ProcessPoolExecutor(max_workers = processes, initializer = _init_worker,
+                             initargs = (fintoc_secret_key, api_base_url, movement_store_path, fetch_workers or FETCH_MAX_WORKERS)) as executor:
+        futures = [executor.submit(process_user, user, output_dir, since, until) for user in pending]
+        for done, future in enumerate(as_completed(futures), start = 1):
+            summary = future.result()
+            METRICS.inc('batch_users_total', status = 'ok' if summary['error'] is None else 'error')
+            METRICS.event('batch_user', **summary)
+            summaries.append(summary)
+            if on_result is not None:
+                on_result(summary, done, len(pending))
+    return summaries
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--manifest', help = 'JSON lines con user_id, link_tokens y opcionalmente since/until')
+    parser.add_argument('--output', required = True)
+    parser.add_argument('--secret-key', default = os.environ.get('FINTOC_SECRET_KEY'))
+    parser.add_argument('--api-base-url', help = 'p.ej. la url de un `fintoc_replay.py serve`')
+    parser.add_argument('--since', default = '2022-01-01')
+    parser.add_argument('--until', default = '2023-07-01')
+    parser.add_argument('--processes', type = int, default = os.cpu_count())
+    parser.add_argument('--fetch-workers', type = int, help = 'llamadas simultaneas a Fintoc por proceso')
+    parser.add_argument('--movement-store', help = 'archivo SQLite de movimientos compartido por los procesos')
+    parser.add_argument('--force', action = 'store_true', help = 'recalcula tambien los usuarios ya terminados')
+    parser.add_argument('--replay', action = 'store_true', help = 'usa un servidor local de Fintoc (fintoc_replay.py)')
+    parser.add_argument('--replay-fixtures', help = 'por defecto se usan movimientos sinteticos')
+    parser.add_argument('--replay-profile', default = 'fast')
+    parser.add_argument('--users', type = int, default = 20, help = 'usuarios del manifiesto sintetico (con --replay y sin --manifest)')
+    args = parser.parse_args()
+
+    if not args.replay and (args.manifest is None or args.secret_key is None):
+        parser.error('se necesita --manifest y --secret-key (o FINTOC_SECRET_KEY), o bien --replay')
+
+    def report(summary, done, total):
+        elapsed = time.perf_counter() - start
+        status = 'ok' if summary['error'] is None else f"error {summary['error']}"
+        print(f"[{done}/{total}] {summary['user_id']} {summary['rows']} filas {summary['seconds']:.2f}s {status} "
+              f"({done / elapsed * 60:.1f} usuarios/min)")
+
+    with contextlib.ExitStack() as stack:
+        if args.replay:
+            from fintoc_replay import ReplayServer, load_fixtures, synthetic_fixtures
+
+            fixtures = load_fixtures(args.replay_fixtures) if args.replay_fixtures else synthetic_fixtures()
+            args.api_base_url = stack.enter_context(ReplayServer(fixtures, profile = args.replay_profile)).base_url
+            args.secret_key = args.secret_key or 'sk_test_replay'
+        if args.manifest is not None:
+            users = load_manifest(args.manifest)
+        else:
+            users = [dict(user_id = f'user_{n:04d}', link_tokens = list(fixtures['links'])) for n in range(args.users)]
+        os.makedirs(args.output, exist_ok = True)
+        start = time.perf_counter()
+        summaries = run_batch(users, args.output, args.secret_key, args.since, args.until, args.processes, args.api_base_url,
+                              args.movement_store, args.fetch_workers, args.force, on_result = report)
+
+    elapsed = time.perf_counter() - start
+    failed = [summary for summary in summaries if summary['error'] is not None]
+    skipped = len(users) - len(summaries)
+    print(f'{len(summaries) - len(failed)} usuarios procesados, {len(failed)} fallidos, {skipped} ya terminados; '
+          f'{elapsed:.1f}s ({(len(summaries) - len(failed)) / elapsed * 60 if elapsed else 0:.1f} usuarios/min, '
+          f'{sum(summary["rows"] for summary in summaries) / elapsed if elapsed else 0:.0f} filas/s)')
+    if failed:
+        print('Fallidos (se reintentan al volver a correr): ' + ', '.join(summary['user_id'] for summary in failed))
+        sys.exit(1)
@@ -0,0 +1,212 @@
+"""
+Mide por separado cada etapa de `process_movements_dataframe` (lo que hace
+`get_analytical_dataframes` despues del fetch) sobre movimientos sinteticos: tiempo (el mejor
+de `--repeat` corridas) y peak de memoria asignada en la etapa (tracemalloc, en una corrida
+aparte para no inflar los tiempos).
+Cada corrida se agrega a `--results` (una linea JSON por tamaño) y se compara con la ultima
+corrida guardada con los mismos parametros; con `--check` termina con error si alguna etapa
+empeora mas que `--threshold`. La etapa `legacy_pivots_merge` es la linea base de `pivots` +
+`merge`: la vista mensual armada como antes del cubo mensual.
+
+    python benchmark.py --movements 1000 100000 1000000
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+from process_movements import (add_flow_columns, build_movements_dataframe, categorize_movements, categorize_product_movements,
+                               fix_mirror_transfers, fix_own_account_transfers, get_income_and_savings, get_monthly_views,
+                               merge_monthly_views)
+from synthetic_movements import generate_movements
+
+# diferencias absolutas menores a esto se consideran ruido y no cuentan como regresion
+MIN_REGRESSION_DELTA = dict(seconds = 0.005, peak_mb = 1.0)
+
+def _categorize(state):
+    state['movements_df']['category'] = categorize_movements(state['movements_df'])
+
+def _product(state):
+    state['movements_df']['product'] = categorize_product_movements(state['movements_df'])
+    add_flow_columns(state['movements_df'])
+
+def _income_savings(state):
+    state['income_df'], state['savings_df'] = get_income_and_savings(state['movements_df'])
+
+def _pivots(state):
+    state['monthly_views'] = get_monthly_views(state['movements_df'])
+
+def _merge(state):
+    state['final_view_monthly'] = merge_monthly_views(state['monthly_views'], state['income_df'], state['savings_df'])
+
+# linea base: la vista mensual como se armaba antes del cubo (user-007), una copia filtrada y
+# ordenada de los movimientos por vista, un pivot por cada una y merges por year_month
+def _legacy_pivoted_data(df):
+    res = df.groupby(['year_month', 'category'], observed=True).amount.sum().reset_index().pivot_table(index=['year_month'],
+                                                                columns='category',
+                                                                values='amount',
+                                                                aggfunc='first',
+                                                                observed=True).reset_index().fillna(0)
+    res['Total'] = res.sum(numeric_only = True, axis=1)
+    return res
+
+def _legacy_rolling_median(df):
+    numerics = ['int16', 'int32', 'int64', 'float16', 'float32', 'float64']
+    estimated_rolling = max(min(4, round(len(df)/4)*3), 1)
+    selected_df = df.select_dtypes(include=numerics)
+    result_df = selected_df.rolling(estimated_rolling).median().fillna(0)
+    result_df.columns = [col + '_rolling_median' for col in selected_df.columns]
+    return df.join(result_df)
+
+def legacy_final_view_monthly(movements_df, final_df_income, final_df_savings):
+    """
+    `final_view_monthly` por el camino anterior al cubo mensual, para comparar tiempo, memoria y resultado.
+    """
+    columns = ['amount', 'year_month', 'post_date', 'description', 'category', 'product', 'flow']
+    is_in = movements_df.flow == 'IN'
+    is_own_transfer = movements_df.category.isin(['Transferencias entre cuentas propias'])
+    df_ingress = movements_df[is_in & ~is_own_transfer][columns].sort_values(by=['category', 'flow'])
+    df_egress = movements_df[~is_in & ~is_own_transfer][columns].sort_values(by=['category', 'flow'])
+    df_spendings = movements_df[~is_in & ~movements_df.category.isin(['Transferencias entre cuentas propias', 'Inversiones', 'Créditos'])][columns].sort_values(by=['category', 'flow'])
+    df_loans = movements_df[~is_in & movements_df.category.isin(['Créditos', 'Pago de Tarjeta de Crédito'])][columns].sort_values(by=['category', 'flow'])
+
+    final_df_loans = _legacy_rolling_median(_legacy_pivoted_data(df_loans))
+    final_df_spendings = _legacy_rolling_median(_legacy_pivoted_data(df_spendings))
+    final_df_ingress = _legacy_rolling_median(_legacy_pivoted_data(df_ingress))
+    final_df_egress = _legacy_rolling_median(_legacy_pivoted_data(df_egress))
+
+    final_view_monthly = final_df_ingress[['year_month', 'Total']]\
+        .merge(final_df_egress[['year_month', 'Total']], on = 'year_month')\
+        .merge(final_df_spendings[['year_month', 'Total', 'Total_rolling_median']], on = 'year_month')\
+        .merge(final_df_savings[['year_month', 'median_amount']], on = 'year_month')\
+        .merge(final_df_income[['year_month', 'median_amount']], on = 'year_month')\
+        .merge(final_df_loans[['year_month', 'Créditos_rolling_median']], on = 'year_month')\
+        .merge(final_df_spendings[['year_month', 'Pago de Tarjeta de Crédito_rolling_median']], on = 'year_month')
+    final_view_monthly.columns = ['year_month', 'ingress', 'egress', 'spendings', 'spendings_median', 'savings_median',
+                                  'income_median', 'loan_monthly_payments_median', 'credit_card_usage_median']
+    final_view_monthly = final_view_monthly.fillna(0).astype(int)
+    final_view_monthly['year_month'] = final_view_monthly['year_month'].astype(str)
+    return final_view_monthly.set_index('year_month')
+
+def _legacy_pivots_merge(state):
+    state['legacy_final_view_monthly'] = legacy_final_view_monthly(state['movements_df'], state['income_df'], state['savings_df'])
+
+# cada etapa recibe y completa el mismo `state`, en el orden del pipeline
+BENCHMARK_STAGES = [
+    ('build', lambda state: state.update(movements_df = build_movements_dataframe(state['columns']))),
+    ('categorize', _categorize),
+    ('product', _product),
+    ('own_account', lambda state: fix_own_account_transfers(state['movements_df'])),
+    ('mirrors', lambda state: fix_mirror_transfers(state['movements_df'])),
+    ('income_savings', _income_savings),
+    ('pivots', _pivots),
+    ('merge', _merge),
+    # no es parte del pipeline: se compara contra `pivots` + `merge`
+    ('legacy_pivots_merge', _legacy_pivots_merge),
+]
+
+def run_stages(columns, trace_memory = False):
+    """
+    Corre todas las etapas sobre `columns` y retorna, por etapa, los segundos o (con
+    `trace_memory`) el peak de MB asignados durante la etapa.
+    """
+    state = dict(columns = columns)
+    results = {}
+    for name, stage in BENCHMARK_STAGES:
+        if trace_memory:
+            tracemalloc.start()
+            stage(state)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[name] = peak / 1024 ** 2
+        else:
+            start = time.perf_counter()
+            stage(state)
+            results[name] = time.perf_counter() - start
+    return results
+
+def benchmark(n_movements, n_links = 2, n_accounts = 3, seed = 0, repeat = 3):
+    columns = generate_movements(n_movements, n_links, n_accounts, seed = seed)
+    timings = [run_stages(columns) for _ in range(repeat)]
+    peaks = run_stages(columns, trace_memory = True)
+    return {name: dict(seconds = min(timing[name] for timing in timings), peak_mb = peaks[name])
+            for name, _ in BENCHMARK_STAGES}
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True, check = True,
+                              cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_previous_run(path, params):
+    """
+    Ultima corrida guardada en `path` con los mismos `params`, o None.
+    """
+    previous = None
+    try:
+        with open(path) as results_file:
+            for line in results_file:
+                record = json.loads(line)
+                if record['params'] == params:
+                    previous = record
+    except FileNotFoundError:
+        pass
+    return previous
+
+def compare_runs(stages, previous_stages, threshold):
+    """
+    Imprime cada etapa con su cambio respecto a la corrida anterior y retorna las etapas cuyo
+    tiempo o memoria empeoro mas que `threshold` (fraccion) y mas que `MIN_REGRESSION_DELTA`.
+    """
+    regressions = []
+    for name, current in stages.items():
+        line = f"  {name:<20} {current['seconds'] * 1000:>10.1f}ms {current['peak_mb']:>9.1f}MB"
+        previous = (previous_stages or {}).get(name)
+        if previous is not None:
+            changes = {metric: (current[metric] - previous[metric]) / previous[metric] if previous[metric] else 0.0
+                       for metric in ('seconds', 'peak_mb')}
+            line += f"   time {changes['seconds']:+.0%}  mem {changes['peak_mb']:+.0%}"
+            if any(change > threshold and current[metric] - previous[metric] > MIN_REGRESSION_DELTA[metric]
+                   for metric, change in changes.items()):
+                regressions.append(name)
+                line += '  <-- regresion'
+        print(line)
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--movements', type = int, nargs = '+', default = [1_000, 100_000, 1_000_000])
+    parser.add_argument('--links', type = int, default = 2)
+    parser.add_argument('--accounts', type = int, default = 3)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--results', default = 'benchmark_results.jsonl')
+    parser.add_argument('--threshold', type = float, default = 0.2)
+    parser.add_argument('--check', action = 'store_true', help = 'termina con error si hay regresiones')
+    args = parser.parse_args()
+
+    regressions = []
+    for n_movements in args.movements:
+        params = dict(movements = n_movements, links = args.links, accounts = args.accounts, seed = args.seed)
+        previous = load_previous_run(args.results, params)
+        stages = benchmark(n_movements, args.links, args.accounts, args.seed, args.repeat)
+        print(f"movements={n_movements}" + (f" (vs {previous['revision']} {previous['timestamp']})" if previous else ''))
+        regressions += [f'{n_movements}:{name}' for name in compare_runs(stages, previous and previous['stages'], args.threshold)]
+        with open(args.results, 'a') as results_file:
+            results_file.write(json.dumps(dict(timestamp = time.strftime('%Y-%m-%dT%H:%M:%S'),
+                                               revision = _git_revision(),
+                                               python = platform.python_version(),
+                                               pandas = pd.__version__,
+                                               params = params,
+                                               stages = stages)) + '\n')
+    if regressions:
+        print('Regresiones: ' + ', '.join(regressions))
+        if args.check:
+            sys.exit(1)
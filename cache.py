@@ -0,0 +1,188 @@
+"""
+Cache en memoria compartido por todas las sesiones de Streamlit del proceso, con expiracion
+por tiempo (TTL), limite de tamaño (se descarta la entrada usada hace mas tiempo) e
+invalidacion explicita por tag. Incluye ademas el cache de respuestas del agente, con un
+segundo nivel opcional en disco.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import closing
+
+import pandas as pd
+
+def fingerprint(*parts):
+    """
+    Hash estable de `parts` (cualquier valor serializable a JSON) para usar como llave.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+class TTLCache:
+    def __init__(self, maxsize = 128, ttl = 3600, clock = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _is_expired(self, entry):
+        return self.ttl is not None and self._clock() - entry['created_at'] > self.ttl
+
+    def get(self, key, default = None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry):
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry['value']
+
+    def set(self, key, value, tags = ()):
+        with self._lock:
+            self._entries[key] = dict(value = value, tags = set(tags), created_at = self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last = False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute, tags = ()):
+        """
+        Retorna el valor guardado en `key` o lo calcula con `compute()` y lo guarda.
+        El calculo se hace fuera del lock, dos sesiones pueden calcular la misma llave a la vez.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.set(key, value, tags = tags)
+        return value
+
+    def invalidate(self, key = None, tag = None):
+        """
+        Elimina la entrada `key` y/o todas las entradas marcadas con `tag`. Retorna cuantas se eliminaron.
+        """
+        with self._lock:
+            keys = [k for k, entry in self._entries.items() if k == key or (tag is not None and tag in entry['tags'])]
+            for k in keys:
+                del self._entries[k]
+            return len(keys)
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return dict(size = len(self._entries),
+                        hits = self.hits,
+                        misses = self.misses,
+                        evictions = self.evictions,
+                        hit_rate = self.hits / requests if requests else 0.0)
+
+def dataframe_fingerprint(df):
+    """
+    Hash del contenido de un DataFrame (valores, indice y columnas).
+    """
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df, index = True).values.tobytes())
+    digest.update(json.dumps([str(column) for column in df.columns]).encode('utf-8'))
+    return digest.hexdigest()
+
+def normalize_prompt(prompt):
+    """
+    Normaliza una pregunta para que variaciones triviales compartan respuesta:
+    minusculas, sin tildes, sin signos de puntuacion y con espacios simples.
+    """
+    prompt = unicodedata.normalize('NFKD', prompt.lower())
+    prompt = ''.join(char for char in prompt if not unicodedata.combining(char))
+    prompt = re.sub(r'[^\w\s]', ' ', prompt)
+    return ' '.join(prompt.split())
+
+class DiskLRUCache:
+    """
+    Cache en SQLite de valores de texto, limitado a `maxsize` entradas (se descartan las usadas
+    hace mas tiempo). Sobrevive reinicios del proceso.
+    """
+    def __init__(self, path, maxsize = 10_000):
+        self.path = path
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        with self._lock, closing(sqlite3.connect(self.path)) as connection, connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, last_access REAL)')
+
+    def get(self, key, default = None):
+        with self._lock, closing(sqlite3.connect(self.path)) as connection, connection:
+            row = connection.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return default
+            connection.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+            return row[0]
+
+    def set(self, key, value):
+        with self._lock, closing(sqlite3.connect(self.path)) as connection, connection:
+            connection.execute('INSERT OR REPLACE INTO entries (key, value, last_access) VALUES (?, ?, ?)', (key, value, time.time()))
+            connection.execute('''
+                DELETE FROM entries WHERE key IN (
+                    SELECT key FROM entries ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )''', (self.maxsize,))
+
+class ResponseCache:
+    """
+    Cache de respuestas del agente por (datos del usuario, pregunta normalizada, ultimos turnos
+    de la conversacion). Primero busca en memoria y, si se configura `disk_cache`, en disco.
+    """
+    def __init__(self, memory_cache = None, disk_cache = None, context_turns = 2):
+        self.memory_cache = memory_cache if memory_cache is not None else TTLCache(maxsize = 1024, ttl = 24 * 60 * 60)
+        self.disk_cache = disk_cache
+        self.context_turns = context_turns
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def make_key(self, data_fingerprint, prompt, context = ()):
+        """
+        `context` son los turnos anteriores como pares (pregunta, respuesta); solo se usan los
+        ultimos `context_turns`.
+        """
+        recent_context = [[normalize_prompt(question), answer] for question, answer in list(context)[-self.context_turns:]] if self.context_turns else []
+        return fingerprint(data_fingerprint, normalize_prompt(prompt), recent_context)
+
+    def get(self, key):
+        response = self.memory_cache.get(key)
+        if response is not None:
+            with self._lock:
+                self.memory_hits += 1
+            return response
+        if self.disk_cache is not None:
+            response = self.disk_cache.get(key)
+            if response is not None:
+                self.memory_cache.set(key, response)
+                with self._lock:
+                    self.disk_hits += 1
+                return response
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, response):
+        self.memory_cache.set(key, response)
+        if self.disk_cache is not None:
+            self.disk_cache.set(key, response)
+
+    def stats(self):
+        with self._lock:
+            requests = self.memory_hits + self.disk_hits + self.misses
+            return dict(memory_hits = self.memory_hits,
+                        disk_hits = self.disk_hits,
+                        misses = self.misses,
+                        hit_rate = (self.memory_hits + self.disk_hits) / requests if requests else 0.0)
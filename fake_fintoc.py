@@ -0,0 +1,119 @@
+"""
+Cliente local que imita la interfaz del SDK de Fintoc usada en process_movements
+(links.get -> link.accounts.all -> account.movements.all) con latencia inyectada,
+para medir el fetch sin credenciales reales.
+
+    python fake_fintoc.py --links 3 --accounts 2 --latency 0.2
+"""
+import argparse
+import datetime as dt
+import random
+import time
+from types import SimpleNamespace
+
+DESCRIPTIONS = [
+    'TRANSF A JUAN PEREZ',
+    'COMPRA SUPERMERCADO LIDER',
+    'PAGO TAR CRED',
+    'REMUNERACION',
+    'DAP 00123',
+    'GIRO ATM',
+    'COMISION MANTENCION',
+    'PAGO CUOTA CREDITO',
+]
+
+class FakeMovementsManager:
+    def __init__(self, movements, latency, page_size):
+        self._movements = movements
+        self._latency = latency
+        self._page_size = page_size
+
+    def all(self, since = None, until = None):
+        for start in range(0, len(self._movements), self._page_size):
+            time.sleep(self._latency)
+            for movement in self._movements[start:start + self._page_size]:
+                if since is not None and str(movement.post_date) < since:
+                    continue
+                if until is not None and str(movement.post_date) > until:
+                    continue
+                yield movement
+
+class FakeAccountsManager:
+    def __init__(self, accounts, latency):
+        self._accounts = accounts
+        self._latency = latency
+
+    def all(self):
+        time.sleep(self._latency)
+        return iter(self._accounts)
+
+class FakeLinksManager:
+    def __init__(self, links, latency):
+        self._links = links
+        self._latency = latency
+
+    def get(self, link_token):
+        time.sleep(self._latency)
+        return self._links[link_token]
+
+class FakeFintoc:
+    """
+    Genera `n_links` links con `n_accounts` cuentas y `n_movements` movimientos cada una.
+    Cada llamada (link, listado de cuentas, pagina de movimientos) duerme `latency` segundos.
+    Los link tokens disponibles quedan en `link_tokens`.
+    """
+    def __init__(self, n_links = 3, n_accounts = 2, n_movements = 300, latency = 0.1, page_size = 300, seed = 0):
+        rnd = random.Random(seed)
+        links = {}
+        for link_number in range(n_links):
+            holder_id = str(rnd.randint(10_000_000, 25_000_000))
+            link = SimpleNamespace(id = f'link_{link_number}',
+                                   institution = SimpleNamespace(name = f'Banco {link_number}'),
+                                   holder_id = holder_id)
+            accounts = []
+            for account_number in range(n_accounts):
+                movements = []
+                for movement_number in range(n_movements):
+                    post_date = dt.date(2022, 1, 1) + dt.timedelta(days = rnd.randint(0, 545))
+                    movements.append(SimpleNamespace(id = f'mov_{link_number}_{account_number}_{movement_number}',
+                                                     description = rnd.choice(DESCRIPTIONS),
+                                                     amount = rnd.choice([-1, 1]) * rnd.randint(1, 500) * 1000,
+                                                     currency = 'CLP',
+                                                     post_date = post_date,
+                                                     transaction_date = post_date,
+                                                     type = rnd.choice(['transfer', 'other']),
+                                                     recipient_account = None,
+                                                     comment = None))
+                accounts.append(SimpleNamespace(number = f'{link_number:03d}{account_number:05d}',
+                                                type = rnd.choice(['checking_account', 'sight_account']),
+                                                holder_id = holder_id,
+                                                holder_name = 'Juan Perez',
+                                                movements = FakeMovementsManager(movements, latency, page_size)))
+            link.accounts = FakeAccountsManager(accounts, latency)
+            links[f'link_token_{link_number}'] = link
+        self.link_tokens = list(links)
+        self.links = FakeLinksManager(links, latency)
+
+if __name__ == '__main__':
+    from process_movements import get_dataframe_movements_for_link_tokens
+
+    parser = argparse.ArgumentParser(description = 'Compara el fetch secuencial contra el concurrente usando un Fintoc falso.')
+    parser.add_argument('--links', type = int, default = 3)
+    parser.add_argument('--accounts', type = int, default = 2)
+    parser.add_argument('--movements', type = int, default = 900)
+    parser.add_argument('--page-size', type = int, default = 300)
+    parser.add_argument('--latency', type = float, default = 0.1)
+    parser.add_argument('--workers', type = int, nargs = '+', default = [1, 4, 8])
+    args = parser.parse_args()
+
+    fintoc_client = FakeFintoc(args.links, args.accounts, args.movements, args.latency, args.page_size)
+    # el orden y el manejo de cuentas que fallan se prueban en tests/test_concurrent_fetch.py
+    for workers in args.workers:
+        start = time.perf_counter()
+        movements_df = get_dataframe_movements_for_link_tokens(fintoc_client.link_tokens,
+                                                               since = '2022-01-01',
+                                                               until = '2023-07-01',
+                                                               fintoc_client = fintoc_client,
+                                                               max_workers = workers)
+        elapsed = time.perf_counter() - start
+        print(f'workers={workers:<3} rows={len(movements_df):<8} {elapsed:.2f}s')
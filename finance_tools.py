@@ -0,0 +1,214 @@
+"""
+Consultas deterministicas sobre la vista mensual (`final_view_monthly`) para el agente: totales,
+promedios, tendencias, comparacion de meses, tasa de ahorro y carga financiera. Los indicadores
+se precalculan una sola vez al construir el agente (`build_metrics_index`), asi las preguntas
+tipicas no necesitan generar ni ejecutar codigo pandas con el LLM.
+"""
+import contextlib
+import contextvars
+import re
+
+import numpy as np
+
+COLUMN_LABELS = {
+    'ingress': 'ingresos',
+    'egress': 'egresos',
+    'spendings': 'gastos',
+    'spendings_median': 'gasto típico',
+    'savings_median': 'ahorro típico',
+    'income_median': 'renta típica',
+    'loan_monthly_payments_median': 'pago típico de créditos',
+    'credit_card_usage_median': 'uso típico de tarjeta de crédito',
+}
+
+COLUMN_ALIASES = {
+    'ingresos': 'ingress',
+    'ingreso': 'ingress',
+    'egresos': 'egress',
+    'egreso': 'egress',
+    'gastos': 'spendings',
+    'gasto': 'spendings',
+    'ahorro': 'savings_median',
+    'ahorros': 'savings_median',
+    'renta': 'income_median',
+    'sueldo': 'income_median',
+    'creditos': 'loan_monthly_payments_median',
+    'créditos': 'loan_monthly_payments_median',
+    'deudas': 'loan_monthly_payments_median',
+    'tarjeta': 'credit_card_usage_median',
+}
+
+YEAR_MONTH_PATTERN = re.compile(r'\b(\d{4})-?(\d{2})\b')
+
+def build_metrics_index(df):
+    """
+    Precalcula por columna de `df` (indexado por year_month) los valores por mes, total, promedio,
+    mediana, primer y ultimo valor y pendiente mensual, mas la tasa de ahorro y la carga
+    financiera (pago de creditos sobre renta) por mes.
+    """
+    df = df.sort_index()
+    months = [str(year_month) for year_month in df.index]
+    columns = {}
+    for column in df.columns:
+        values = df[column].astype(float).to_numpy()
+        slope = float(np.polyfit(np.arange(len(values)), values, 1)[0]) if len(values) > 1 else 0.0
+        columns[column] = dict(by_month = dict(zip(months, values.tolist())),
+                               total = float(values.sum()),
+                               mean = float(values.mean()) if len(values) else 0.0,
+                               median = float(np.median(values)) if len(values) else 0.0,
+                               first = float(values[0]) if len(values) else 0.0,
+                               last = float(values[-1]) if len(values) else 0.0,
+                               slope = slope)
+    income = df['income_median'].astype(float) if 'income_median' in df.columns else None
+    ratios = {}
+    for name, numerator in (('savings_rate', 'savings_median'), ('debt_to_income', 'loan_monthly_payments_median')):
+        if income is None or numerator not in df.columns:
+            continue
+        ratio = (df[numerator].astype(float) / income.replace(0, np.nan))
+        ratios[name] = {str(year_month): (None if np.isnan(value) else float(value)) for year_month, value in ratio.items()}
+    return dict(months = months, columns = columns, ratios = ratios)
+
+def format_amount(amount):
+    sign = '-' if amount < 0 else ''
+    return f'{sign}${abs(amount):,.0f}'.replace(',', '.')
+
+def format_month(year_month):
+    return f'{year_month[:4]}-{year_month[4:]}'
+
+def _parse_query(query, metrics):
+    """
+    Extrae de la consulta la columna (por nombre o alias en español) y los meses YYYYMM mencionados.
+    """
+    text = query.lower()
+    column = None
+    for candidate in sorted(list(metrics['columns']) + list(COLUMN_ALIASES), key = len, reverse = True):
+        if candidate in text:
+            column = COLUMN_ALIASES.get(candidate, candidate)
+            break
+    months = [year + month for year, month in YEAR_MONTH_PATTERN.findall(query)]
+    return column, months
+
+def _select_months(metrics, months):
+    if len(months) >= 2:
+        start, end = sorted(months[:2])
+        return [month for month in metrics['months'] if start <= month <= end]
+    if len(months) == 1:
+        return [month for month in metrics['months'] if month == months[0]]
+    return metrics['months']
+
+def _unknown_column_message(metrics):
+    return 'No reconozco la columna, usa una de: ' + ', '.join(metrics['columns'])
+
+def period_total(metrics, query):
+    column, months = _parse_query(query, metrics)
+    if column not in metrics['columns']:
+        return _unknown_column_message(metrics)
+    selected = _select_months(metrics, months)
+    if not selected:
+        return 'No hay datos para ese periodo.'
+    total = sum(metrics['columns'][column]['by_month'][month] for month in selected)
+    return f"Total de {COLUMN_LABELS.get(column, column)} entre {format_month(selected[0])} y {format_month(selected[-1])}: {format_amount(total)}"
+
+def period_average(metrics, query):
+    column, months = _parse_query(query, metrics)
+    if column not in metrics['columns']:
+        return _unknown_column_message(metrics)
+    selected = _select_months(metrics, months)
+    if not selected:
+        return 'No hay datos para ese periodo.'
+    values = [metrics['columns'][column]['by_month'][month] for month in selected]
+    return (f"Promedio mensual de {COLUMN_LABELS.get(column, column)} entre {format_month(selected[0])} y {format_month(selected[-1])}: "
+            f"{format_amount(sum(values) / len(values))} (mediana {format_amount(float(np.median(values)))})")
+
+def trend(metrics, query):
+    column, _ = _parse_query(query, metrics)
+    if column not in metrics['columns']:
+        return _unknown_column_message(metrics)
+    stats = metrics['columns'][column]
+    direction = 'al alza' if stats['slope'] > 0 else 'a la baja' if stats['slope'] < 0 else 'estable'
+    return (f"Tendencia de {COLUMN_LABELS.get(column, column)}: {direction}, {format_amount(stats['slope'])} por mes "
+            f"(de {format_amount(stats['first'])} en {format_month(metrics['months'][0])} a {format_amount(stats['last'])} en {format_month(metrics['months'][-1])})")
+
+def compare_months(metrics, query):
+    column, months = _parse_query(query, metrics)
+    if column not in metrics['columns']:
+        return _unknown_column_message(metrics)
+    if len(months) < 2:
+        months = metrics['months'][-2:]
+    by_month = metrics['columns'][column]['by_month']
+    missing = [month for month in months[:2] if month not in by_month]
+    if missing:
+        return f"No hay datos para {', '.join(format_month(month) for month in missing)}."
+    first, second = by_month[months[0]], by_month[months[1]]
+    change = f' ({(second - first) / first:+.1%})' if first else ''
+    return (f"{COLUMN_LABELS.get(column, column).capitalize()}: {format_amount(first)} en {format_month(months[0])} vs "
+            f"{format_amount(second)} en {format_month(months[1])}, diferencia {format_amount(second - first)}{change}")
+
+def _ratio(metrics, name, label, query):
+    ratios = metrics['ratios'].get(name)
+    if not ratios:
+        return f'No hay datos suficientes para calcular {label}.'
+    _, months = _parse_query(query, metrics)
+    month = months[0] if months else metrics['months'][-1]
+    if ratios.get(month) is None:
+        return f'No hay datos de renta para calcular {label} en {format_month(month)}.'
+    available = [value for value in ratios.values() if value is not None]
+    return (f"{label.capitalize()} en {format_month(month)}: {ratios[month]:.1%} "
+            f"(promedio del periodo {sum(available) / len(available):.1%})")
+
+def savings_rate(metrics, query):
+    return _ratio(metrics, 'savings_rate', 'tasa de ahorro (ahorro típico / renta típica)', query)
+
+def debt_to_income(metrics, query):
+    return _ratio(metrics, 'debt_to_income', 'carga financiera (pago de créditos / renta típica)', query)
+
+# indice de la sesion que esta usando las herramientas compartidas, ver `use_finance_data`
+_finance_data = contextvars.ContextVar('finance_data')
+
+@contextlib.contextmanager
+def use_finance_data(metrics):
+    """
+    Deja `metrics` (de `build_metrics_index`) como los datos de las herramientas creadas sin
+    `df` mientras dure el bloque, p.ej. durante el turno de una sesion.
+    """
+    token = _finance_data.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _finance_data.reset(token)
+
+def get_finance_tools(df = None):
+    """
+    Tools de LangChain sobre `df` (la vista mensual), con los indicadores precalculados una vez.
+    Sin `df` las tools no quedan atadas a un usuario y leen los datos de `use_finance_data`,
+    asi una sola lista de tools sirve para todas las sesiones del proceso.
+    """
+    # langchain se importa recien aca, el resto del modulo (p.ej. para insights.py) no lo necesita
+    from langchain.agents import Tool
+
+    if df is not None:
+        metrics = build_metrics_index(df)
+        get_metrics = lambda: metrics
+    else:
+        get_metrics = _finance_data.get
+    columns_help = ', '.join(f'{column} ({label})' for column, label in COLUMN_LABELS.items())
+    return [
+        Tool(name = 'PeriodTotal',
+             func = lambda query: period_total(get_metrics(), query),
+             description = f'Total de una columna en un periodo. Input: "<columna> [YYYYMM] [YYYYMM]". Columnas: {columns_help}'),
+        Tool(name = 'PeriodAverage',
+             func = lambda query: period_average(get_metrics(), query),
+             description = 'Promedio y mediana mensual de una columna en un periodo. Input: "<columna> [YYYYMM] [YYYYMM]"'),
+        Tool(name = 'Trend',
+             func = lambda query: trend(get_metrics(), query),
+             description = 'Tendencia (cambio promedio por mes) de una columna en todo el historial. Input: "<columna>"'),
+        Tool(name = 'CompareMonths',
+             func = lambda query: compare_months(get_metrics(), query),
+             description = 'Compara una columna entre dos meses (por defecto los dos ultimos). Input: "<columna> YYYYMM YYYYMM"'),
+        Tool(name = 'SavingsRate',
+             func = lambda query: savings_rate(get_metrics(), query),
+             description = 'Tasa de ahorro (ahorro típico / renta típica) de un mes (por defecto el ultimo). Input: "[YYYYMM]"'),
+        Tool(name = 'DebtToIncome',
+             func = lambda query: debt_to_income(get_metrics(), query),
+             description = 'Carga financiera (pago típico de créditos / renta típica) de un mes (por defecto el ultimo). Input: "[YYYYMM]"'),
+    ]
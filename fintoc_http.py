@@ -0,0 +1,192 @@
+"""
+Capa HTTP compartida por todo el proceso para las llamadas a Fintoc (las del SDK y las de la
+app a link_intents / links/exchange):
+
+- un solo `httpx.Client` con pool de conexiones (`get_http_client`), que tambien usa el SDK,
+  asi las sesiones reutilizan las conexiones TLS en vez de abrir una por request.
+- un `TokenBucket` compartido que limita los requests por segundo de todas las sesiones.
+- `RetryingTransport`: reintenta los 429, 5xx y errores de conexion con backoff exponencial
+  con jitter, respetando `Retry-After`.
+
+Los reintentos, las esperas del limitador y las conexiones nuevas / reutilizadas se cuentan
+en `METRICS` (`http_retries_total`, `http_rate_limit_wait_seconds_total`, `http_connections_total`).
+"""
+import email.utils
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from metrics import METRICS
+
+# requests por segundo (sostenido) y rafaga permitida, para todo el proceso
+FINTOC_RATE_LIMIT = float(os.environ.get('FINTOC_RATE_LIMIT', 10))
+FINTOC_RATE_BURST = int(os.environ.get('FINTOC_RATE_BURST', 20))
+
+FINTOC_MAX_RETRIES = 4
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# segundos: base del backoff exponencial y maximo de una espera (incluido Retry-After)
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+HTTP_LIMITS = httpx.Limits(max_connections = 20, max_keepalive_connections = 20, keepalive_expiry = 60)
+HTTP_TIMEOUT = httpx.Timeout(30.0, connect = 10.0)
+
+class TokenBucket:
+    """
+    Limitador de tasa: `rate` tokens por segundo con a lo mas `burst` acumulados. `acquire`
+    bloquea hasta que haya un token y retorna los segundos que espero.
+    """
+    def __init__(self, rate = FINTOC_RATE_LIMIT, burst = FINTOC_RATE_BURST, clock = time.monotonic, sleep = time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        # descuenta el token de inmediato (puede quedar negativo) y retorna cuanto hay que esperar por el
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(-self._tokens / self.rate, 0.0)
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+def parse_retry_after(value, now = None):
+    """
+    Segundos que pide esperar un header `Retry-After` (en segundos o como fecha HTTP), o None.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - (time.time() if now is None else now), 0.0)
+
+def backoff_delay(attempt, base = BACKOFF_BASE, maximum = BACKOFF_MAX, rng = random.random):
+    """
+    Espera antes del reintento `attempt` (desde 0): "full jitter" sobre `base * 2**attempt`.
+    """
+    return rng() * min(maximum, base * 2 ** attempt)
+
+def _is_idempotent(request):
+    return request.method in ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE') or 'Idempotency-Key' in request.headers
+
+class RetryingTransport(httpx.BaseTransport):
+    """
+    Transporte de httpx que pasa cada intento por el `limiter` y reintenta hasta `max_retries`
+    veces los status de `RETRY_STATUSES` y los errores de conexion. Los POST sin
+    `Idempotency-Key` solo se reintentan si no llegaron al servidor (429 o error al conectar).
+    """
+    def __init__(self, transport = None, limiter = None, max_retries = FINTOC_MAX_RETRIES, sleep = time.sleep, rng = random.random):
+        self._transport = transport if transport is not None else httpx.HTTPTransport(limits = HTTP_LIMITS)
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self._sleep = sleep
+        self._rng = rng
+
+    def _send(self, request):
+        if self.limiter is not None:
+            waited = self.limiter.acquire()
+            if waited > 0:
+                METRICS.inc('http_rate_limit_wait_seconds_total', waited)
+        new_connection = []
+        caller_trace = request.extensions.get('trace')
+
+        def trace(event_name, info):
+            if event_name == 'connection.connect_tcp.started':
+                new_connection.append(True)
+            if caller_trace is not None:
+                caller_trace(event_name, info)
+
+        request.extensions['trace'] = trace
+        try:
+            return self._transport.handle_request(request)
+        finally:
+            if caller_trace is None:
+                request.extensions.pop('trace', None)
+            else:
+                request.extensions['trace'] = caller_trace
+            METRICS.inc('http_connections_total', reused = 'false' if new_connection else 'true')
+
+    def handle_request(self, request):
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self._send(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                if last_attempt:
+                    raise
+                reason, delay = type(e).__name__, backoff_delay(attempt, rng = self._rng)
+            except (httpx.ReadError, httpx.ReadTimeout, httpx.RemoteProtocolError) as e:
+                if last_attempt or not _is_idempotent(request):
+                    raise
+                reason, delay = type(e).__name__, backoff_delay(attempt, rng = self._rng)
+            else:
+                if (last_attempt or response.status_code not in RETRY_STATUSES
+                        or (response.status_code != 429 and not _is_idempotent(request))):
+                    return response
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                response.close()
+                reason, delay = str(response.status_code), backoff_delay(attempt, rng = self._rng)
+                if retry_after is not None:
+                    delay = max(delay, min(retry_after, BACKOFF_MAX))
+            METRICS.inc('http_retries_total', reason = reason)
+            METRICS.event('http_retry', method = request.method, path = request.url.path, reason = reason,
+                          attempt = attempt + 1, delay = round(delay, 3))
+            self._sleep(delay)
+
+    def close(self):
+        self._transport.close()
+
+def make_http_client(transport = None, limiter = None, max_retries = FINTOC_MAX_RETRIES):
+    """
+    Cliente httpx con reintentos y limitador sobre `transport` (por defecto un pool de conexiones).
+    """
+    return httpx.Client(transport = RetryingTransport(transport, limiter = limiter, max_retries = max_retries),
+                        timeout = HTTP_TIMEOUT)
+
+_shared = dict(client = None, limiter = TokenBucket())
+_shared_lock = threading.RLock()
+
+def install_http_client(client):
+    """
+    Deja `client` como el cliente compartido del proceso, tambien para el SDK de Fintoc (su
+    cliente httpx es un atributo de clase compartido por todas las instancias de `Fintoc`).
+    Retorna el cliente anterior.
+    """
+    import fintoc.client
+
+    with _shared_lock:
+        previous_client = fintoc.client.Client._client
+        _shared['client'] = client
+        fintoc.client.Client._client = client
+    return previous_client
+
+def get_http_client():
+    """
+    Cliente httpx compartido por todo el proceso (pool de conexiones, limitador y reintentos).
+    """
+    with _shared_lock:
+        if _shared['client'] is None:
+            install_http_client(make_http_client(limiter = _shared['limiter']))
+        return _shared['client']
+
+def get_rate_limiter():
+    return _shared['limiter']
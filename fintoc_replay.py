@@ -0,0 +1,400 @@
+"""
+Grabacion y reproduccion de la API de Fintoc para probar el fetch sin depender de
+api.fintoc.com:
+
+- `RecordingTransport` es un transporte de httpx que deja en un archivo de fixtures las
+  respuestas reales (links, cuentas y movimientos) que pide el SDK de Fintoc.
+- `ReplayServer` es un servidor HTTP local que responde como la API de Fintoc desde esos
+  fixtures (o desde movimientos sinteticos), con latencia, tamaño de pagina y tasa de errores
+  configurables (`REPLAY_PROFILES`). Para usarlo desde la app basta con apuntar el secret
+  `FINTOC_API_BASE_URL` a su url; el widget de Fintoc (js) sigue siendo el real.
+
+    python fintoc_replay.py record --secret-key sk_live_... --link-tokens <token> --fixtures fixtures.json
+    python fintoc_replay.py serve --fixtures fixtures.json --profile typical --port 8765
+    python fintoc_replay.py loadtest --profile typical --sessions 8
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import httpx
+import numpy as np
+
+from fintoc_http import get_rate_limiter, install_http_client, make_http_client
+
+# latency: segundos base por request; jitter: media de la cola exponencial que se suma;
+# page_size: movimientos por pagina; error_rate: fraccion de requests que fallan (500 o 429)
+REPLAY_PROFILES = {
+    'instant': dict(latency = 0.0, jitter = 0.0, page_size = 300, error_rate = 0.0),
+    'fast': dict(latency = 0.05, jitter = 0.02, page_size = 300, error_rate = 0.0),
+    'typical': dict(latency = 0.3, jitter = 0.2, page_size = 300, error_rate = 0.01),
+    'slow': dict(latency = 1.0, jitter = 0.8, page_size = 100, error_rate = 0.02),
+    'flaky': dict(latency = 0.3, jitter = 0.3, page_size = 300, error_rate = 0.1),
+}
+
+LINK_PATH = re.compile(r'^/v1/links/(?P<link_token>[^/]+)$')
+ACCOUNTS_PATH = re.compile(r'^/v1/accounts$')
+MOVEMENTS_PATH = re.compile(r'^/v1/accounts/(?P<account_id>[^/]+)/movements$')
+EXCHANGE_PATH = re.compile(r'^/v1/links/exchange$')
+LINK_INTENTS_PATH = re.compile(r'^/v1/link_intents$')
+
+def empty_fixtures():
+    return dict(links = {}, accounts = {}, movements = {})
+
+def load_fixtures(path):
+    with open(path) as fixtures_file:
+        return json.load(fixtures_file)
+
+def save_fixtures(fixtures, path):
+    with open(path, 'w') as fixtures_file:
+        json.dump(fixtures, fixtures_file, ensure_ascii = False)
+
+def token_key(link_token, fixtures = None):
+    """
+    Llave con la que se guarda un link token en los fixtures: un hash, para no dejar tokens
+    reales en disco. Si el token ya es una llave de `fixtures` (p.ej. el que entrega el
+    exchange reproducido) se usa tal cual.
+    """
+    if fixtures is not None and link_token in fixtures['links']:
+        return link_token
+    return 'link_token_' + hashlib.sha256(link_token.encode('utf-8')).hexdigest()[:24]
+
+class RecordingTransport(httpx.BaseTransport):
+    """
+    Transporte de httpx que envia los requests al transporte real y guarda en `fixtures` las
+    respuestas exitosas de links, cuentas y movimientos (las paginas de movimientos se juntan
+    por cuenta).
+    """
+    def __init__(self, fixtures = None, transport = None):
+        self.fixtures = fixtures if fixtures is not None else empty_fixtures()
+        self._transport = transport if transport is not None else httpx.HTTPTransport()
+        self._lock = threading.Lock()
+
+    def handle_request(self, request):
+        response = self._transport.handle_request(request)
+        if request.method == 'GET' and response.status_code == 200:
+            response.read()
+            self._record(request.url.path, dict(request.url.params), response.json())
+        return response
+
+    def _record(self, path, params, body):
+        with self._lock:
+            if EXCHANGE_PATH.match(path):
+                return
+            if match := LINK_PATH.match(path):
+                key = token_key(match['link_token'])
+                self.fixtures['links'][key] = dict(body, link_token = key)
+            elif ACCOUNTS_PATH.match(path) and 'link_token' in params:
+                self.fixtures['accounts'][token_key(params['link_token'])] = body
+            elif (match := MOVEMENTS_PATH.match(path)) and 'link_token' in params:
+                account_movements = self.fixtures['movements'].setdefault(token_key(params['link_token']), {}).setdefault(match['account_id'], [])
+                known_ids = {movement['id'] for movement in account_movements}
+                account_movements.extend(movement for movement in body if movement['id'] not in known_ids)
+
+    def close(self):
+        self._transport.close()
+
+def install_transport(transport):
+    """
+    Hace que el SDK de Fintoc use `transport` en todos sus requests, pasando por el limitador
+    y los reintentos de `fintoc_http`. Retorna el cliente anterior.
+    """
+    return install_http_client(make_http_client(transport, limiter = get_rate_limiter()))
+
+def _to_fintoc_date(value):
+    return f'{np.datetime_as_string(value, unit = "D")}T00:00:00Z'
+
+def synthetic_fixtures(n_links = 2, n_accounts = 3, n_movements = 3000, seed = 0):
+    """
+    Fixtures con movimientos sinteticos (`synthetic_movements.generate_movements`) en el formato de
+    la API: `n_movements` por link, repartidos en `n_accounts` cuentas.
+    """
+    from synthetic_movements import generate_movements
+
+    fixtures = empty_fixtures()
+    for link_number in range(n_links):
+        columns = generate_movements(n_movements, n_links = 1, n_accounts = n_accounts, seed = seed + link_number)
+        key = f'link_token_{seed}_{link_number}'
+        link_id = columns['link_id'][0]
+        holder_id = columns['link_holder_id'][0]
+        accounts = {}
+        for row in range(len(columns['id'])):
+            account_id = f"acc_{link_id}_{columns['account_number'][row]}"
+            if account_id not in accounts:
+                accounts[account_id] = dict(id = account_id,
+                                            object = 'account',
+                                            name = columns['account_type'][row],
+                                            official_name = columns['account_type'][row],
+                                            number = columns['account_number'][row],
+                                            holder_id = columns['account_holder_id'][row],
+                                            holder_name = columns['account_holder_name'][row],
+                                            type = columns['account_type'][row],
+                                            currency = 'CLP',
+                                            balance = dict(available = 0, current = 0, limit = 0))
+                fixtures['movements'].setdefault(key, {})[account_id] = []
+            recipient_id = columns['recipient_account_holder_id'][row]
+            fixtures['movements'][key][account_id].append(dict(
+                id = columns['id'][row],
+                object = 'movement',
+                amount = int(columns['amount'][row]),
+                currency = columns['currency'][row],
+                description = columns['description'][row],
+                post_date = _to_fintoc_date(columns['post_date'][row]),
+                transaction_date = _to_fintoc_date(columns['transaction_date'][row]),
+                type = columns['type'][row],
+                recipient_account = None if recipient_id is None else dict(holder_id = recipient_id,
+                                                                           holder_name = columns['recipient_account_holder_name'][row],
+                                                                           number = None,
+                                                                           institution = None),
+                sender_account = None,
+                comment = columns['comment'][row],
+                reference_id = None,
+                pending = False))
+        fixtures['accounts'][key] = list(accounts.values())
+        fixtures['links'][key] = dict(id = link_id,
+                                      object = 'link',
+                                      link_token = key,
+                                      holder_id = holder_id,
+                                      holder_type = 'individual',
+                                      institution = dict(id = f'cl_banco_{link_number}', name = columns['link_institution_name'][0], country = 'cl'),
+                                      mode = 'test',
+                                      active = True,
+                                      status = 'active',
+                                      accounts = list(accounts.values()))
+    return fixtures
+
+class _ReplayRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.replay.handle(self)
+
+    def do_POST(self):
+        self.server.replay.handle(self)
+
+    def log_message(self, format, *args):
+        pass
+
+class ReplayServer:
+    """
+    Servidor local que imita los endpoints de Fintoc que usa la app (link intents, exchange,
+    links, cuentas y movimientos paginados con el header `Link`), respondiendo desde `fixtures`.
+    Cada request espera `latency` + una cola exponencial de media `jitter` y falla con
+    probabilidad `error_rate`. Las latencias y estados de cada request quedan en `stats()`.
+
+        with ReplayServer(synthetic_fixtures(), profile = 'typical') as server:
+            make_fintoc_client('sk_test', server.base_url)
+    """
+    def __init__(self, fixtures, profile = 'fast', host = '127.0.0.1', port = 0, seed = 0, **overrides):
+        self.fixtures = fixtures
+        self.profile = dict(REPLAY_PROFILES[profile], **overrides)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _ReplayRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.replay = self
+        self._thread = None
+        self._exchanges = 0
+        self.request_latencies = []
+        self.status_counts = {}
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target = self._httpd.serve_forever, name = 'fintoc-replay', daemon = True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _draw(self):
+        with self._lock:
+            jitter = self._random.expovariate(1 / self.profile['jitter']) if self.profile['jitter'] else 0.0
+            return self.profile['latency'] + jitter, self._random.random() < self.profile['error_rate'], self._random.random()
+
+    def handle(self, handler):
+        start = time.perf_counter()
+        url = urlsplit(handler.path)
+        params = dict(parse_qsl(url.query))
+        if handler.headers.get('Content-Length'):
+            handler.rfile.read(int(handler.headers['Content-Length']))
+        latency, fails, error_kind = self._draw()
+        time.sleep(latency)
+
+        if not handler.headers.get('Authorization'):
+            status, body, headers = 401, dict(error = dict(type = 'authentication_error', message = 'Missing API key')), {}
+        elif fails and error_kind < 0.5:
+            status, body, headers = 429, dict(error = dict(type = 'api_error', message = 'Too many requests')), {'Retry-After': '1'}
+        elif fails:
+            status, body, headers = 500, dict(error = dict(type = 'api_error', message = 'Injected error')), {}
+        else:
+            status, body, headers = self._route(handler, url.path, params)
+
+        payload = json.dumps(body).encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(payload)
+        with self._lock:
+            self.request_latencies.append(time.perf_counter() - start)
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def _not_found(self, what):
+        return 404, dict(error = dict(type = 'invalid_request_error', message = f'{what} not found')), {}
+
+    def _route(self, handler, path, params):
+        if handler.command == 'POST':
+            if LINK_INTENTS_PATH.match(path):
+                return 201, dict(id = f'li_{uuid.uuid4().hex}', object = 'link_intent', widget_token = f'li_{uuid.uuid4().hex}_sec_replay'), {}
+            return self._not_found(path)
+
+        if EXCHANGE_PATH.match(path):
+            # cada exchange entrega el siguiente link de los fixtures
+            link_keys = list(self.fixtures['links'])
+            if not link_keys:
+                return self._not_found('link')
+            with self._lock:
+                key = link_keys[self._exchanges % len(link_keys)]
+                self._exchanges += 1
+            return 200, self.fixtures['links'][key], {}
+        if match := LINK_PATH.match(path):
+            link = self.fixtures['links'].get(token_key(match['link_token'], self.fixtures))
+            return (200, link, {}) if link is not None else self._not_found('link')
+
+        if 'link_token' not in params:
+            return 400, dict(error = dict(type = 'invalid_request_error', message = 'Missing link_token')), {}
+        key = token_key(params['link_token'], self.fixtures)
+        if ACCOUNTS_PATH.match(path):
+            accounts = self.fixtures['accounts'].get(key)
+            return (200, accounts, {}) if accounts is not None else self._not_found('link')
+        if match := MOVEMENTS_PATH.match(path):
+            movements = self.fixtures['movements'].get(key, {}).get(match['account_id'])
+            if movements is None:
+                return self._not_found('account')
+            since, until = params.get('since'), params.get('until')
+            movements = [movement for movement in movements
+                         if (since is None or movement['post_date'][:10] >= since[:10])
+                         and (until is None or movement['post_date'][:10] <= until[:10])]
+            page_size = self.profile['page_size']
+            page = int(params.get('page', 1))
+            headers = {}
+            if page * page_size < len(movements):
+                next_url = f"http://{handler.headers['Host']}{path}?{urlencode(dict(params, page = page + 1))}"
+                headers['Link'] = f'<{next_url}>; rel="next"'
+            return 200, movements[(page - 1) * page_size:page * page_size], headers
+        return self._not_found(path)
+
+    def stats(self):
+        with self._lock:
+            latencies = np.array(self.request_latencies)
+            status_counts = dict(self.status_counts)
+        percentiles = dict(zip(('p50', 'p95', 'p99'), np.percentile(latencies, [50, 95, 99]))) if len(latencies) else {}
+        return dict(requests = len(latencies), status_counts = status_counts, **percentiles)
+
+def run_load_test(base_url, link_tokens, sessions, since, until, max_workers = None):
+    """
+    Simula `sessions` sesiones concurrentes, cada una descargando los movimientos de todos los
+    `link_tokens` con su propio cliente de Fintoc. Retorna por sesion los segundos, filas,
+    cuentas fallidas y el error si la sesion fallo completa.
+    """
+    from process_movements import FETCH_MAX_WORKERS, get_dataframe_movements_for_link_tokens, make_fintoc_client
+
+    def run_session(session_number):
+        fintoc_client = make_fintoc_client(f'sk_test_replay_{session_number}', base_url)
+        start = time.perf_counter()
+        try:
+            movements_df = get_dataframe_movements_for_link_tokens(link_tokens, since, until, fintoc_client,
+                                                                   max_workers = max_workers or FETCH_MAX_WORKERS)
+        except Exception as e:
+            # un error al pedir un link o sus cuentas hace fallar la sesion completa
+            return dict(seconds = time.perf_counter() - start, rows = 0, failed_accounts = 0, error = repr(e))
+        return dict(seconds = time.perf_counter() - start,
+                    rows = len(movements_df),
+                    failed_accounts = len(movements_df.attrs['failed_accounts']),
+                    error = None)
+
+    with ThreadPoolExecutor(max_workers = sessions) as executor:
+        return list(executor.map(run_session, range(sessions)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest = 'command', required = True)
+
+    record_parser = subparsers.add_parser('record', help = 'descarga links reales y los guarda como fixtures')
+    record_parser.add_argument('--secret-key', required = True)
+    record_parser.add_argument('--link-tokens', nargs = '+', required = True)
+    record_parser.add_argument('--fixtures', required = True)
+    record_parser.add_argument('--since', default = '2022-01-01')
+    record_parser.add_argument('--until', default = '2023-07-01')
+
+    for name, help_text in (('serve', 'levanta el servidor local hasta Ctrl-C'), ('loadtest', 'mide el fetch con sesiones concurrentes')):
+        subparser = subparsers.add_parser(name, help = help_text)
+        subparser.add_argument('--fixtures', help = 'por defecto se usan movimientos sinteticos')
+        subparser.add_argument('--profile', choices = list(REPLAY_PROFILES), default = 'typical')
+        subparser.add_argument('--page-size', type = int)
+        subparser.add_argument('--error-rate', type = float)
+        subparser.add_argument('--links', type = int, default = 2)
+        subparser.add_argument('--accounts', type = int, default = 3)
+        subparser.add_argument('--movements', type = int, default = 3000, help = 'movimientos sinteticos por link')
+        subparser.add_argument('--port', type = int, default = 8765 if name == 'serve' else 0)
+    loadtest_parser = subparsers.choices['loadtest']
+    loadtest_parser.add_argument('--sessions', type = int, nargs = '+', default = [1, 4, 8])
+    loadtest_parser.add_argument('--workers', type = int)
+    loadtest_parser.add_argument('--since', default = '2022-01-01')
+    loadtest_parser.add_argument('--until', default = '2023-07-01')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        from process_movements import get_dataframe_movements_for_link_tokens, make_fintoc_client
+
+        transport = RecordingTransport()
+        install_transport(transport)
+        movements_df = get_dataframe_movements_for_link_tokens(args.link_tokens, args.since, args.until, make_fintoc_client(args.secret_key))
+        save_fixtures(transport.fixtures, args.fixtures)
+        print(f'{len(movements_df)} movimientos de {len(transport.fixtures["links"])} links guardados en {args.fixtures}')
+    else:
+        fixtures = load_fixtures(args.fixtures) if args.fixtures else synthetic_fixtures(args.links, args.accounts, args.movements)
+        overrides = {name: value for name, value in (('page_size', args.page_size), ('error_rate', args.error_rate)) if value is not None}
+        server = ReplayServer(fixtures, profile = args.profile, port = args.port, **overrides)
+        with server:
+            if args.command == 'serve':
+                print(f'Fintoc replay ({args.profile}) en {server.base_url}, link tokens: {", ".join(fixtures["links"])}')
+                with contextlib.suppress(KeyboardInterrupt):
+                    threading.Event().wait()
+            else:
+                for sessions in args.sessions:
+                    start = time.perf_counter()
+                    results = run_load_test(server.base_url, list(fixtures['links']), sessions, args.since, args.until, args.workers)
+                    elapsed = time.perf_counter() - start
+                    seconds = np.array([result['seconds'] for result in results])
+                    rows = sum(result['rows'] for result in results)
+                    p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+                    print(f'sessions={sessions:<3} {rows / elapsed:>9.0f} rows/s  session p50={p50:.2f}s p95={p95:.2f}s p99={p99:.2f}s max={seconds.max():.2f}s  '
+                          f'failed_accounts={sum(result["failed_accounts"] for result in results)} '
+                          f'failed_sessions={sum(result["error"] is not None for result in results)}')
+                request_stats = server.stats()
+                print(f"requests={request_stats['requests']} p50={request_stats['p50'] * 1000:.0f}ms p95={request_stats['p95'] * 1000:.0f}ms "
+                      f"p99={request_stats['p99'] * 1000:.0f}ms status={request_stats['status_counts']}")
@@ -0,0 +1,82 @@
+"""
+Presupuesto de arranque en frio de memorybot.py: importa en un interprete nuevo solo los imports
+de nivel superior de la app (los que se pagan antes de dibujar la primera pagina) y termina con
+error si tardan mas que `--budget` segundos (el mejor de `--repeat` corridas) o si alguno arrastra
+un modulo que debe cargarse recien al usarse (`DEFERRED_MODULES`).
+
+    python import_budget.py --budget 2.5
+"""
+import argparse
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(REPO_DIR, 'memorybot.py')
+
+# se cargan al obtener los datos (process_movements) o al crear el agente (langchain_agent)
+DEFERRED_MODULES = ('langchain', 'openai', 'pandasai', 'plotly', 'fintoc', 'thefuzz', 'process_movements', 'langchain_agent', 'finance_tools', 'insights')
+
+# segundos permitidos para los imports de nivel superior
+IMPORT_BUDGET = 2.5
+
+IMPORT_TIME_PATTERN = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+def get_top_level_imports(path = APP_PATH):
+    """
+    Sentencias `import` / `from ... import` de nivel superior del script (no las de dentro de funciones o ifs).
+    """
+    with open(path) as app_file:
+        tree = ast.parse(app_file.read())
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+def measure_imports(imports, importtime = False):
+    """
+    Ejecuta `imports` en un interprete nuevo y retorna los segundos, los modulos cargados y
+    (con `importtime`) el tiempo acumulado de cada paquete de primer nivel.
+    """
+    code = '\n'.join(['import json, sys, time', 'start = time.perf_counter()'] + imports +
+                     ['print(json.dumps(dict(seconds = time.perf_counter() - start, modules = sorted(sys.modules))))'])
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    process = subprocess.run(command, capture_output = True, text = True, cwd = REPO_DIR)
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1] if process.stderr.strip() else 'import failed')
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    packages = {}
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        # la indentacion indica el nivel, solo interesan los imports directos
+        if match and len(match[3]) == 1:
+            packages[match[4]] = int(match[2]) / 1e6
+    result['packages'] = packages
+    return result
+
+def find_deferred(modules):
+    return sorted({module.split('.')[0] for module in modules if module.split('.')[0] in DEFERRED_MODULES})
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type = float, default = IMPORT_BUDGET, help = 'segundos permitidos para los imports de nivel superior')
+    parser.add_argument('--repeat', type = int, default = 3)
+    args = parser.parse_args()
+
+    imports = get_top_level_imports()
+    try:
+        runs = [measure_imports(imports) for _ in range(args.repeat)]
+    except RuntimeError as e:
+        print(f'No se pudieron importar las dependencias de memorybot.py: {e}')
+        sys.exit(2)
+    seconds = min(run['seconds'] for run in runs)
+    deferred = find_deferred(runs[0]['modules'])
+    print(f'imports de nivel superior: {seconds:.2f}s (presupuesto {args.budget:.2f}s), {len(runs[0]["modules"])} modulos')
+
+    if seconds > args.budget or deferred:
+        if deferred:
+            print('Modulos que deberian cargarse recien al usarse: ' + ', '.join(deferred))
+        slowest = sorted(measure_imports(imports, importtime = True)['packages'].items(), key = lambda item: item[1], reverse = True)[:10]
+        for package, package_seconds in slowest:
+            print(f'  {package:<30} {package_seconds:.2f}s')
+        sys.exit(1)
@@ -0,0 +1,108 @@
+"""
+Insights que se muestran apenas esta lista la vista mensual (`final_view_monthly`), sin pasar
+por el agente: alzas de renta (`analyze_income_raise_events`), principales categorias de gasto,
+tendencia del ahorro y carga financiera. Se calculan de forma deterministica
+(`compute_insights`) y, si hay un LLM configurado, se redactan en paralelo con una llamada por
+insight (`narrate_insights`); si una llamada falla queda el texto deterministico.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from finance_tools import build_metrics_index, format_amount, format_month
+from metrics import METRICS
+
+# meses (los ultimos) para la tendencia del ahorro
+SAVINGS_TREND_MONTHS = 6
+# las alzas de renta menores a esta fraccion de la renta tipica se consideran ruido
+INCOME_EVENT_MIN_FRACTION = 0.03
+TOP_SPENDING_CATEGORIES = 3
+NARRATIVE_MAX_WORKERS = 4
+
+NARRATIVE_PROMPT = '''Eres un asesor financiero chileno cercano. Reescribe el siguiente dato sobre las finanzas de un usuario
+en una o dos oraciones breves, en segunda persona, sin inventar cifras y agregando un consejo concreto si aplica.
+Dato: {text}'''
+
+def _income_insight(df, metrics):
+    income = metrics['columns'].get('income_median')
+    if income is None or income['last'] <= 0:
+        return None
+    events = [event for event in df.attrs.get('income_events', [])
+              if abs(event['raise_event_amount']) >= INCOME_EVENT_MIN_FRACTION * max(event['median_amount'], 1)]
+    if not events:
+        return dict(kind = 'income', value = income['last'],
+                    text = f"Tu renta típica es de {format_amount(income['last'])} al mes y se ha mantenido estable.")
+    event = events[-1]
+    direction = 'subió' if event['raise_event_amount'] > 0 else 'bajó'
+    return dict(kind = 'income', value = event['raise_event_amount'],
+                text = (f"Tu renta típica {direction} {format_amount(abs(event['raise_event_amount']))} en {format_month(event['year_month'])}, "
+                        f"hoy es de {format_amount(income['last'])} al mes."))
+
+def _spending_insight(df, metrics):
+    categories = [(category, amount) for category, amount in df.attrs.get('spending_categories', {}).items() if category != 'Otros' and amount > 0]
+    if not categories:
+        return None
+    top = categories[:TOP_SPENDING_CATEGORIES]
+    return dict(kind = 'spending', value = top,
+                text = 'Tus mayores gastos de los últimos meses son ' + ', '.join(f'{category} ({format_amount(amount)} al mes)' for category, amount in top) + '.')
+
+def _savings_insight(df, metrics):
+    savings = metrics['columns'].get('savings_median')
+    if savings is None:
+        return None
+    values = np.array([savings['by_month'][month] for month in metrics['months'][-SAVINGS_TREND_MONTHS:]])
+    slope = float(np.polyfit(np.arange(len(values)), values, 1)[0]) if len(values) > 1 else 0.0
+    direction = 'al alza' if slope > 0 else 'a la baja' if slope < 0 else 'estable'
+    rate = metrics['ratios'].get('savings_rate', {}).get(metrics['months'][-1])
+    rate_text = f' ({rate:.0%} de tu renta)' if rate is not None else ''
+    if savings['last'] <= 0:
+        return dict(kind = 'savings', value = 0.0, text = 'No encontramos ahorro o inversiones recientes en tus cuentas.')
+    return dict(kind = 'savings', value = slope,
+                text = f"Tu ahorro típico es de {format_amount(savings['last'])} al mes{rate_text} y su tendencia en los últimos meses va {direction}.")
+
+def _debt_insight(df, metrics):
+    loans = metrics['columns'].get('loan_monthly_payments_median')
+    credit_card = metrics['columns'].get('credit_card_usage_median')
+    if loans is None or (loans['last'] <= 0 and (credit_card is None or credit_card['last'] <= 0)):
+        return None
+    ratio = metrics['ratios'].get('debt_to_income', {}).get(metrics['months'][-1])
+    text = f"Pagas {format_amount(loans['last'])} al mes en créditos"
+    if ratio is not None:
+        text += f' ({ratio:.0%} de tu renta)'
+    if credit_card is not None and credit_card['last'] > 0:
+        text += f" y usas {format_amount(credit_card['last'])} al mes de tu tarjeta de crédito"
+    return dict(kind = 'debt', value = ratio, text = text + '.')
+
+INSIGHT_BUILDERS = [_income_insight, _spending_insight, _savings_insight, _debt_insight]
+
+def compute_insights(final_view_monthly):
+    """
+    Insights deterministicos de la vista mensual: una lista de dicts con `kind`, `text` y `value`.
+    """
+    if len(final_view_monthly) == 0:
+        return []
+    metrics = build_metrics_index(final_view_monthly)
+    insights = [builder(final_view_monthly, metrics) for builder in INSIGHT_BUILDERS]
+    return [insight for insight in insights if insight is not None]
+
+def narrate_insights(insights, narrate, max_workers = NARRATIVE_MAX_WORKERS):
+    """
+    Redacta los insights en paralelo con `narrate(prompt) -> texto` (p.ej. una llamada al LLM) y
+    retorna copias con `narrative`. Si una llamada falla ese insight queda sin `narrative`.
+    """
+    def narrate_insight(insight):
+        start = time.perf_counter()
+        try:
+            narrative = narrate(NARRATIVE_PROMPT.format(text = insight['text'])).strip()
+        except Exception as e:
+            METRICS.event('insight_narrative_failed', kind = insight['kind'], error = repr(e))
+            return dict(insight)
+        METRICS.event('insight_narrative', kind = insight['kind'], seconds = round(time.perf_counter() - start, 3))
+        return dict(insight, narrative = narrative)
+
+    if not insights:
+        return []
+    with METRICS.span('insights_narrative', insights = len(insights)):
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            return list(executor.map(narrate_insight, insights))
@@ -0,0 +1,144 @@
+"""
+Ejecucion en segundo plano de tareas largas (obtener y procesar la informacion bancaria) para no
+bloquear el script de Streamlit. Cada tarea reporta su avance por etapas y se puede cancelar.
+"""
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, stages):
+        self.id = uuid.uuid4().hex
+        self.status = Job.PENDING
+        self.stages = {stage: dict(done = 0, total = None) for stage in stages}
+        self.current_stage = None
+        self.result = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def report(self, stage, done, total = None):
+        """
+        Callback de avance que se le pasa a la tarea. Si se pidio cancelar, lanza `JobCancelled`
+        para que la tarea se detenga en su siguiente reporte.
+        """
+        if self._cancel_event.is_set():
+            raise JobCancelled(self.id)
+        with self._lock:
+            self.current_stage = stage
+            self.stages.setdefault(stage, dict(done = 0, total = None))
+            self.stages[stage] = dict(done = done, total = total)
+
+    def __call__(self, stage, done, total = None):
+        self.report(stage, done, total)
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.status in (Job.DONE, Job.FAILED, Job.CANCELLED)
+
+    def progress(self):
+        """
+        Fraccion de etapas completadas (las etapas sin total cuentan como completas si tienen avance).
+        """
+        with self._lock:
+            completed = 0.0
+            for stage in self.stages.values():
+                if stage['total']:
+                    completed += min(stage['done'] / stage['total'], 1)
+                elif stage['done']:
+                    completed += 1
+            return completed / len(self.stages) if self.stages else 0.0
+
+# segundos que un job terminado sigue en el registro esperando que su sesion lo retire
+FINISHED_JOB_TTL = 10 * 60
+MAX_JOBS = 256
+
+class JobRunner:
+    """
+    Registro de jobs del proceso. Los jobs terminados se retiran con `pop` o, si su sesion no
+    lo hace (se cerro, se recargo o el job fue reemplazado), pasados `finished_ttl` segundos;
+    ademas se guardan a lo mas `max_jobs` (se descartan primero los terminados mas antiguos),
+    asi los resultados abandonados no quedan en memoria.
+    """
+    def __init__(self, max_workers = 4, finished_ttl = FINISHED_JOB_TTL, max_jobs = MAX_JOBS, clock = time.time):
+        self._executor = ThreadPoolExecutor(max_workers = max_workers, thread_name_prefix = 'job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.finished_ttl = finished_ttl
+        self.max_jobs = max_jobs
+        self._clock = clock
+
+    def _evict(self):
+        # se llama con self._lock tomado
+        now = self._clock()
+        finished = sorted((job for job in self._jobs.values() if job.finished and job.finished_at is not None), key = lambda job: job.finished_at)
+        for job in finished:
+            if now - job.finished_at > self.finished_ttl or len(self._jobs) > self.max_jobs:
+                del self._jobs[job.id]
+
+    def submit(self, func, stages = ()):
+        """
+        Ejecuta `func(report)` en segundo plano, donde `report(stage, done, total)` es el callback
+        de avance: el mismo `Job`, asi la tarea puede revisar `report.cancelled` antes de un
+        efecto que no pasa por un reporte (p.ej. escribir en un cache). Retorna el id del job.
+        """
+        job = Job(stages)
+        with self._lock:
+            self._evict()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, func)
+        return job.id
+
+    def _run(self, job, func):
+        job.started_at = time.time()
+        job.status = Job.RUNNING
+        try:
+            if job.cancelled:
+                raise JobCancelled(job.id)
+            job.result = func(job)
+            job.status = Job.DONE
+        except JobCancelled:
+            job.status = Job.CANCELLED
+        except Exception as e:
+            job.error = e
+            job.status = Job.FAILED
+            traceback.print_exc()
+        finally:
+            job.finished_at = self._clock()
+
+    def get(self, job_id):
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+
+    def pop(self, job_id):
+        """
+        Retira un job terminado del registro y lo retorna.
+        """
+        with self._lock:
+            return self._jobs.pop(job_id, None)
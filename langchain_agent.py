@@ -1,69 +1,315 @@
-from pandasai import PandasAI
-from langchain.agents import Tool
-from langchain.agents import load_tools
-from langchain.agents import AgentType
-from langchain.memory import ConversationBufferMemory
-from langchain.chat_models import ChatOpenAI
+from langchain.memory import ConversationSummaryBufferMemory
 from prompt import PREFIX
-from langchain.utilities import SerpAPIWrapper
-from langchain.agents import initialize_agent
-
-import pandasai.llm.openai as pandasai_oa
-
-def get_langchain_agent(df, open_api_key):
-
-    llm = ChatOpenAI(temperature=0.01,
-                openai_api_key=open_api_key, 
-                model_name='gpt-3.5-turbo', 
-                verbose=True) 
-
-    
-    tools = load_tools(
-        ["llm-math", "human"], 
-        llm=llm
-    )
-
-    data_analyst_agent = PandasAI(pandasai_oa.OpenAI(api_token=open_api_key))
-
-    def f_data_analyst_agent(prompt):
-        try:
-            return data_analyst_agent.run(df, prompt)
-        except Exception as e:
-            return f"Please try again with another question, I cant answer that because of '{e}'"
-        
-    data_analyst_agent_tool = Tool(
-        name='AskFinanceDataQuestion',
-        func=f_data_analyst_agent,
-        description='''Make a question to an financial data analyst about the financial data of the user/person. For this tool you must formulate closed-ended questions encompassing all the necessary context.
-        The data analyst has access to a pandas dataframe which has financial records of the person helping you with the following columns:
-            - year_month (index)
-            - ingress
-            - egress
-            - spendings
-            - spendings_median
-            - savings_median
-            - income_median
-            - loan_monthly_payments_median
-            - credit_card_usage_median
-        '''
-    )
-    #tools.append(data_analyst_agent_tool)
+from metrics import METRICS
+from langchain.callbacks.base import BaseCallbackHandler
+from pydantic import Field
+
+import functools
+import re
+import time
+from typing import Any, Dict, List
+
+# tokens maximos del historial que se reenvia en cada turno, lo mas antiguo se resume
+MEMORY_MAX_TOKEN_LIMIT = 1000
+AGENT_MAX_ITERATIONS = 5
+
+# el resumen del usuario es una variable del prompt, asi el mismo prompt sirve para todas las sesiones
+SYSTEM_MESSAGE = PREFIX + '\nTODAY: Jul 4rd, 2023\n{user_brief}'
+AGENT_INPUT_VARIABLES = ['input', 'chat_history', 'user_brief', 'agent_scratchpad']
+
+class TokenBudgetMemory(ConversationSummaryBufferMemory):
+    """
+    Memoria con presupuesto de tokens: guarda los ultimos turnos textuales mientras quepan en
+    `max_token_limit` y resume los anteriores en un resumen acumulado. Los tokens se cuentan
+    localmente con el tokenizador del LLM y por cada turno se registra en `turn_prompt_tokens`
+    cuanto pesa cada parte (mensaje de sistema fijo + historial + pregunta); `run_agent` completa
+    `prompt_tokens` con lo que realmente se envio al LLM (ver `MetricsCallbackHandler`).
+    """
+    fixed_prompt_tokens: int = 0
+    turn_prompt_tokens: List[Dict[str, int]] = Field(default_factory=list)
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        variables = super().load_memory_variables(inputs)
+        history = variables[self.memory_key]
+        history_tokens = self.llm.get_num_tokens_from_messages(history) if self.return_messages else self.llm.get_num_tokens(history)
+        input_tokens = self.llm.get_num_tokens(str(inputs.get('input', '')))
+        self.turn_prompt_tokens.append(dict(fixed_prompt_tokens = self.fixed_prompt_tokens,
+                                            history_tokens = history_tokens,
+                                            input_tokens = input_tokens,
+                                            prompt_tokens = self.fixed_prompt_tokens + history_tokens + input_tokens))
+        return variables
+
+# el agente conversacional responde con un bloque JSON {"action": "Final Answer", "action_input": "..."}
+FINAL_ANSWER_PATTERN = re.compile(r'"action"\s*:\s*"Final Answer"\s*,\s*"action_input"\s*:\s*"')
+CLOSING_QUOTE_PATTERN = re.compile(r'(?<!\\)"')
+
+def extract_partial_final_answer(text):
+    """
+    Retorna lo que va de la respuesta final dentro de la salida (posiblemente incompleta) del
+    LLM, o None si la salida no es (todavia) una respuesta final.
+    """
+    match = FINAL_ANSWER_PATTERN.search(text)
+    if match is None:
+        return None
+    answer = text[match.end():]
+    closing_quote = CLOSING_QUOTE_PATTERN.search(answer)
+    if closing_quote is not None:
+        answer = answer[:closing_quote.start()]
+    return answer.rstrip('\\').replace('\\n', '\n').replace('\\"', '"')
+
+class StreamingAnswerHandler(BaseCallbackHandler):
+    """
+    Callback que va entregando la respuesta final a medida que llegan los tokens (`on_answer(texto)`)
+    y los pasos intermedios del agente (`on_step(texto)`), y mide la latencia del turno.
+    Se crea justo antes de `agent.run` y se llama `finish()` al terminar.
+    """
+    def __init__(self, on_answer = None, on_step = None, clock = time.perf_counter):
+        self.on_answer = on_answer
+        self.on_step = on_step
+        self.clock = clock
+        self.started_at = clock()
+        self.first_token_at = None
+        self.first_answer_token_at = None
+        self.finished_at = None
+        self.llm_calls = 0
+        self._buffer = ''
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.llm_calls += 1
+        self._buffer = ''
+
+    def on_llm_new_token(self, token, **kwargs):
+        now = self.clock()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self._buffer += token
+        answer = extract_partial_final_answer(self._buffer)
+        if answer:
+            if self.first_answer_token_at is None:
+                self.first_answer_token_at = now
+            if self.on_answer is not None:
+                self.on_answer(answer)
+
+    def on_agent_action(self, action, **kwargs):
+        if self.on_step is not None:
+            self.on_step(f'🔧 {action.tool}: {action.tool_input}')
+
+    def on_tool_end(self, output, **kwargs):
+        if self.on_step is not None:
+            self.on_step(f'📎 {output}')
+
+    def finish(self):
+        self.finished_at = self.clock()
+
+    def metrics(self):
+        def elapsed(at):
+            return at - self.started_at if at is not None else None
+        return dict(time_to_first_token = elapsed(self.first_token_at),
+                    time_to_first_answer_token = elapsed(self.first_answer_token_at),
+                    total_latency = elapsed(self.finished_at),
+                    llm_calls = self.llm_calls)
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Callback que cuenta en `METRICS` las llamadas al LLM, los tokens y el uso de herramientas.
+    Con streaming la API no informa el uso: los tokens de respuesta se cuentan al llegar y los
+    del prompt con `count_tokens(mensajes)` (p.ej. `llm.get_num_tokens_from_messages`) sobre los
+    mensajes ya formateados (herramientas, instrucciones de formato y scratchpad incluidos).
+    Los tokens del prompt de cada llamada quedan en `prompt_tokens`.
+    """
+    def __init__(self, metrics = METRICS, count_tokens = None):
+        self.metrics = metrics
+        self.count_tokens = count_tokens
+        self.prompt_tokens = []
+        self._streamed_tokens = 0
+        self._counted_prompt_tokens = None
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.metrics.inc('llm_calls_total')
+        self._streamed_tokens = 0
+        self._counted_prompt_tokens = None
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.on_llm_start(serialized, [], **kwargs)
+        if self.count_tokens is not None:
+            self._counted_prompt_tokens = sum(self.count_tokens(prompt_messages) for prompt_messages in messages)
+
+    def on_llm_new_token(self, token, **kwargs):
+        self._streamed_tokens += 1
+        self.metrics.inc('llm_tokens_total', kind = 'completion')
+
+    def on_llm_end(self, response, **kwargs):
+        token_usage = (response.llm_output or {}).get('token_usage') or {}
+        prompt_tokens = token_usage.get('prompt_tokens', self._counted_prompt_tokens)
+        if prompt_tokens is not None:
+            self.prompt_tokens.append(prompt_tokens)
+            self.metrics.inc('llm_tokens_total', prompt_tokens, kind = 'prompt')
+        if 'completion_tokens' in token_usage and self._streamed_tokens == 0:
+            self.metrics.inc('llm_tokens_total', token_usage['completion_tokens'], kind = 'completion')
+
+    def on_llm_error(self, error, **kwargs):
+        self.metrics.inc('llm_errors_total')
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self.metrics.inc('tool_calls_total', tool = serialized.get('name', 'unknown'))
+
+@functools.lru_cache(maxsize = 8)
+def get_shared_llm(open_api_key, openai_organization = None, streaming = False):
+    """
+    `ChatOpenAI` del agente, uno por configuracion para todo el proceso. No guarda estado de
+    la conversacion y los callbacks de cada turno se pasan al ejecutar (ver `run_agent`).
+    """
+    from langchain.chat_models import ChatOpenAI
+
+    return ChatOpenAI(temperature=0.01,
+                      openai_api_key=open_api_key,
+                      openai_organization=openai_organization,
+                      model_name='gpt-3.5-turbo',
+                      streaming=streaming,
+                      verbose=True)
+
+@functools.lru_cache(maxsize = 8)
+def get_shared_agent(open_api_key, openai_organization = None, streaming = False):
+    """
+    Herramientas (llm-math, human y las de finance_tools.py sin datos) y agente con su prompt,
+    compartidos por todas las sesiones del proceso. Retorna `(agent, tools)`.
+    """
+    # las herramientas y el agente se importan recien aca, cargar langchain.agents es lento
+    from langchain.agents import ConversationalChatAgent, load_tools
+    from finance_tools import get_finance_tools
+
+    with METRICS.span('agent_shared_build', streaming = streaming):
+        llm = get_shared_llm(open_api_key, openai_organization, streaming)
+        tools = load_tools(["llm-math", "human"], llm=llm) + get_finance_tools()
+        agent = ConversationalChatAgent.from_llm_and_tools(llm,
+                                                           tools,
+                                                           system_message=SYSTEM_MESSAGE,
+                                                           input_variables=AGENT_INPUT_VARIABLES)
+    return agent, tools
+
+def clear_shared_agents():
+    get_shared_agent.cache_clear()
+    get_shared_llm.cache_clear()
+    _get_narrator_llm.cache_clear()
+
+def get_user_brief(df):
     user = df.reset_index().loc[df.reset_index().year_month.astype(int).idxmax()].to_dict()
     user['username'] = 'un usuario'
-    user_brief = f'''Te escribirá {user['username']} de Chile, tiene una renta mensual de ${user['income_median']}, además todos los meses paga ${user['loan_monthly_payments_median']} en créditos. 
+    return f'''Te escribirá {user['username']} de Chile, tiene una renta mensual de ${user['income_median']}, además todos los meses paga ${user['loan_monthly_payments_median']} en créditos. 
     Su gasto típico de ${user['spendings_median']}, de los cuales ${user['credit_card_usage_median']} son de la tarjeta de crédito y su ahorro típico es de ${user['savings_median']}'''
 
-    agent_chain = initialize_agent(tools,
-                                   llm,
-                                   agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
-                                   verbose=True,
-                                   memory=ConversationBufferMemory(return_messages=True, memory_key="chat_history"),
-                                   handle_parsing_errors=True,
-                                   max_iterations=5,
-                                   agent_kwargs={
-                                            'system_message': PREFIX +f'''\nTODAY: Jul 4rd, 2023\n{user_brief}''',
-                                            'handle_parsing_errors':True,
-                                       }
-                                   )
-
-    return agent_chain
\ No newline at end of file
+class SessionAgent:
+    """
+    Agente de una sesion: solo la memoria de la conversacion (en `executor`) y los datos del
+    usuario (el indice de `build_metrics_index` y su resumen para el mensaje de sistema). El LLM,
+    las herramientas y el prompt son los de `get_shared_agent`.
+    """
+    def __init__(self, executor, metrics, user_brief):
+        self.executor = executor
+        self.metrics = metrics
+        self.user_brief = user_brief
+
+    def count_tokens(self, messages):
+        return self.executor.agent.llm_chain.llm.get_num_tokens_from_messages(messages)
+
+    @property
+    def memory(self):
+        return self.executor.memory
+
+    def run(self, prompt, callbacks = None):
+        from finance_tools import use_finance_data
+
+        with use_finance_data(self.metrics):
+            return self.executor.run(input=prompt, user_brief=self.user_brief, callbacks=callbacks)
+
+@METRICS.timed('agent_build')
+def get_langchain_agent(df, open_api_key, streaming = False, openai_organization = None, memory = None):
+    """
+    Agente sobre la vista mensual `df`. Con `memory` (la de un agente anterior) la conversacion
+    continua con los datos nuevos, p.ej. al agregar o quitar un banco.
+    """
+    from langchain.agents import AgentExecutor
+    from finance_tools import build_metrics_index
+
+    agent, tools = get_shared_agent(open_api_key, openai_organization, streaming)
+    llm = get_shared_llm(open_api_key, openai_organization, streaming)
+    user_brief = get_user_brief(df)
+    fixed_prompt_tokens = llm.get_num_tokens(SYSTEM_MESSAGE.format(user_brief=user_brief))
+    if memory is None:
+        # con mas de una variable de entrada la memoria necesita saber cual es la pregunta
+        memory = TokenBudgetMemory(llm=llm,
+                                   max_token_limit=MEMORY_MAX_TOKEN_LIMIT,
+                                   return_messages=True,
+                                   memory_key="chat_history",
+                                   input_key="input",
+                                   fixed_prompt_tokens=fixed_prompt_tokens)
+    else:
+        memory.input_key = "input"
+        memory.fixed_prompt_tokens = fixed_prompt_tokens
+
+    executor = AgentExecutor.from_agent_and_tools(agent=agent,
+                                                  tools=tools,
+                                                  memory=memory,
+                                                  verbose=True,
+                                                  handle_parsing_errors=True,
+                                                  max_iterations=AGENT_MAX_ITERATIONS)
+    return SessionAgent(executor, build_metrics_index(df), user_brief)
+
+@functools.lru_cache(maxsize = 8)
+def _get_narrator_llm(open_api_key, openai_organization = None):
+    from langchain.chat_models import ChatOpenAI
+
+    return ChatOpenAI(temperature=0.3,
+                      openai_api_key=open_api_key,
+                      openai_organization=openai_organization,
+                      model_name='gpt-3.5-turbo',
+                      request_timeout=20,
+                      max_retries=1)
+
+def get_insight_narrator(open_api_key, openai_organization = None):
+    """
+    Funcion `prompt -> texto` con una sola llamada al LLM (sin agente), para redactar los
+    insights de insights.py. El LLM es el mismo para todas las sesiones.
+    """
+    from langchain.schema import HumanMessage
+
+    llm = _get_narrator_llm(open_api_key, openai_organization)
+
+    def narrate(prompt):
+        # un callback por llamada: las llamadas corren en paralelo y el LLM es compartido
+        return llm([HumanMessage(content=prompt)], callbacks=[MetricsCallbackHandler()]).content
+    return narrate
+
+def run_agent(agent, prompt, response_cache = None, data_fingerprint = None, context = (), callbacks = None):
+    """
+    Ejecuta `agent.run(prompt)` pasando antes por `response_cache` (un `cache.ResponseCache`), con
+    llave por los datos del usuario (`data_fingerprint`), la pregunta y los turnos previos (`context`).
+    Si la respuesta viene del cache igual se registra el turno en la memoria del agente.
+    `callbacks` (p.ej. un `StreamingAnswerHandler`) solo se usan si se llama al agente.
+    Cada turno queda como un span `agent_run` en `METRICS` (si vino del cache y los tokens del
+    prompt, sumando todas las llamadas al LLM del turno).
+    """
+    metrics_handler = MetricsCallbackHandler(count_tokens = getattr(agent, 'count_tokens', None))
+    callbacks = list(callbacks or []) + [metrics_handler]
+    with METRICS.span('agent_run') as span:
+        if response_cache is None:
+            response = agent.run(prompt, callbacks=callbacks)
+            span['cached'] = False
+        else:
+            key = response_cache.make_key(data_fingerprint, prompt, context)
+            response = response_cache.get(key)
+            span['cached'] = response is not None
+            if response is None:
+                response = agent.run(prompt, callbacks=callbacks)
+                response_cache.set(key, response)
+            elif getattr(agent, 'memory', None) is not None:
+                agent.memory.save_context({'input': prompt}, {'output': response})
+        turn_prompt_tokens = getattr(getattr(agent, 'memory', None), 'turn_prompt_tokens', None)
+        if not span['cached'] and metrics_handler.prompt_tokens:
+            span['prompt_tokens'] = sum(metrics_handler.prompt_tokens)
+            if turn_prompt_tokens:
+                turn_prompt_tokens[-1].update(prompt_tokens = span['prompt_tokens'], llm_calls = len(metrics_handler.prompt_tokens))
+        elif not span['cached'] and turn_prompt_tokens:
+            span['prompt_tokens'] = turn_prompt_tokens[-1]['prompt_tokens']
+    METRICS.inc('agent_turns_total', cached = span['cached'])
+    return response
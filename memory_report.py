@@ -0,0 +1,75 @@
+"""
+Compara el peak RSS de armar el DataFrame de movimientos fila a fila (un dict por
+movimiento + `pd.DataFrame.from_dict` + `.copy()`, como se hacia antes) contra el
+armado por columnas con tipos compactos de `build_movements_dataframe`.
+Cada modo corre en su propio proceso para que el peak RSS no se mezcle.
+
+    python memory_report.py --movements 1000000
+"""
+import argparse
+import datetime as dt
+import random
+import resource
+import subprocess
+import sys
+
+import pandas as pd
+
+from fake_fintoc import DESCRIPTIONS
+from movement_store import MOVEMENT_COLUMNS
+from process_movements import build_movements_dataframe
+
+def generate_movement_rows(n_movements, seed = 0):
+    rnd = random.Random(seed)
+    accounts = [(f'link_{n // 3}', f'Banco {n // 3}', str(12_000_000 + n // 3), rnd.choice(['checking_account', 'sight_account']), f'{n:08d}')
+                for n in range(6)]
+    for number in range(n_movements):
+        link_id, institution_name, holder_id, account_type, account_number = accounts[number % len(accounts)]
+        post_date = dt.datetime(2022, 1, 1) + dt.timedelta(days = rnd.randint(0, 545))
+        yield dict(link_id = link_id,
+                   link_institution_name = institution_name,
+                   link_holder_id = holder_id,
+                   account_type = account_type,
+                   account_number = account_number,
+                   account_holder_id = holder_id,
+                   account_holder_name = 'Juan Perez',
+                   id = f'mov_{number}',
+                   description = rnd.choice(DESCRIPTIONS),
+                   amount = rnd.choice([-1, 1]) * rnd.randint(1, 500) * 1000,
+                   currency = 'CLP',
+                   post_date = post_date,
+                   transaction_date = post_date,
+                   type = rnd.choice(['transfer', 'other']),
+                   recipient_account_holder_id = None,
+                   recipient_account_holder_name = None,
+                   comment = None)
+
+def build_by_rows(n_movements):
+    movements_df = pd.DataFrame.from_dict(list(generate_movement_rows(n_movements)))
+    return movements_df.copy()
+
+def build_by_columns(n_movements):
+    columns = {column: [] for column in MOVEMENT_COLUMNS}
+    for movement in generate_movement_rows(n_movements):
+        for column in MOVEMENT_COLUMNS:
+            columns[column].append(movement[column])
+    return build_movements_dataframe(columns)
+
+def peak_rss_mb():
+    # en linux ru_maxrss esta en KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--movements', type = int, default = 1_000_000)
+    parser.add_argument('--mode', choices = ['rows', 'columns'])
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        baseline_mb = peak_rss_mb()
+        movements_df = (build_by_rows if args.mode == 'rows' else build_by_columns)(args.movements)
+        frame_mb = movements_df.memory_usage(deep = True).sum() / 1024 ** 2
+        print(f'{args.mode:<8} peak_rss={peak_rss_mb():.0f}MB (import {baseline_mb:.0f}MB) dataframe={frame_mb:.0f}MB')
+    else:
+        for mode in ('rows', 'columns'):
+            subprocess.run([sys.executable, __file__, '--movements', str(args.movements), '--mode', mode], check = True)
@@ -6,32 +6,25 @@ The code creates a web application using Streamlit, a Python library for buildin
 """
 
 # Import necessary libraries
+# process_movements (fintoc, thefuzz) y langchain_agent (langchain, openai) se importan recien
+# al obtener los datos y al crear el agente, para que la primera pagina cargue rapido
+# (ver import_budget.py)
 import streamlit as st
-import html
+import copy
+import os
 import time
-import requests
-import numpy as np
-import plotly.graph_objects as px
-import pandasai.llm.openai as pandasai_oa
+import uuid
 from streamlit_modal import Modal
 import st_bridge as stb
 
 import streamlit.components.v1 as components
-import uuid
 
-import openai
-openai.organization = st.secrets["OPENAI_ORGANIZATION"]
-
-from langchain.chains import ConversationChain
-from langchain.chains.conversation.memory import ConversationEntityMemory
-from langchain.chains.conversation.prompt import ENTITY_MEMORY_CONVERSATION_TEMPLATE
-from langchain.llms import OpenAI
 import pandas as pd
-from pandasai import PandasAI
-
-from process_movements import get_analytical_dataframes
 
-from langchain_agent import get_langchain_agent
+from movement_store import MovementStore
+from cache import DiskLRUCache, ResponseCache, TTLCache, dataframe_fingerprint, fingerprint
+from jobs import Job, JobRunner
+from metrics import METRICS, serve_prometheus
 
 # Set Streamlit page configuration
 st.set_page_config(page_title='Radiografía Financiera', layout='wide')
@@ -51,6 +44,76 @@ if "langchain_init" not in st.session_state:
     st.session_state["langchain_init"] = None
 if "fintoc_data" not in st.session_state:
     st.session_state["fintoc_data"] = None
+if "fintoc_data_key" not in st.session_state:
+    st.session_state["fintoc_data_key"] = None
+# agregados de movimientos por link token (process_movements.MovementAggregates)
+if "link_aggregates" not in st.session_state:
+    st.session_state["link_aggregates"] = {}
+# medianas moviles de la ultima vista mensual (process_movements.make_rolling_stats), para
+# recalcular solo los meses que cambian al actualizar los datos
+if "rolling_stats" not in st.session_state:
+    st.session_state["rolling_stats"] = None
+# memoria del agente anterior, para seguir la conversacion al cambiar los datos
+if "agent_memory" not in st.session_state:
+    st.session_state["agent_memory"] = None
+if "insights" not in st.session_state:
+    st.session_state["insights"] = []
+if "insights_job" not in st.session_state:
+    st.session_state["insights_job"] = None
+if "turn_metrics" not in st.session_state:
+    st.session_state["turn_metrics"] = []
+if "retrieval_job" not in st.session_state:
+    st.session_state["retrieval_job"] = None
+# cuentas cuya descarga fallo en la ultima obtencion de datos (no estan en los indicadores)
+if "failed_accounts" not in st.session_state:
+    st.session_state["failed_accounts"] = []
+# se pide volver a obtener los datos en la siguiente ejecucion (ver remove_link)
+if "refresh_data" not in st.session_state:
+    st.session_state["refresh_data"] = False
+
+# solo se dibujan los ultimos turnos del chat, el resto se carga a pedido
+CHAT_HISTORY_PAGE_SIZE = 10
+DATAFRAME_PAGE_SIZE = 50
+if "visible_turns" not in st.session_state:
+    st.session_state["visible_turns"] = CHAT_HISTORY_PAGE_SIZE
+
+# Caches compartidos por todas las sesiones del proceso
+@st.cache_resource
+def get_analytical_cache():
+    return TTLCache(maxsize = 128, ttl = 60 * 60)
+
+@st.cache_resource
+def get_response_cache():
+    # el nivel en disco es opcional, se activa con RESPONSE_CACHE_PATH
+    disk_cache = DiskLRUCache(st.secrets["RESPONSE_CACHE_PATH"]) if "RESPONSE_CACHE_PATH" in st.secrets else None
+    return ResponseCache(disk_cache = disk_cache)
+
+@st.cache_resource
+def get_insights_cache():
+    # insights (con su redaccion) por huella de la vista mensual
+    return TTLCache(maxsize = 256, ttl = 60 * 60)
+
+@st.cache_resource
+def get_job_runner():
+    return JobRunner(max_workers = 4)
+
+@st.cache_resource
+def get_movement_store():
+    # solo se guardan movimientos en disco si se configura MOVEMENT_STORE_PATH
+    if "MOVEMENT_STORE_PATH" not in st.secrets:
+        return None
+    return MovementStore(st.secrets["MOVEMENT_STORE_PATH"])
+
+@st.cache_resource
+def get_metrics():
+    # METRICS_LOG_PATH guarda cada evento como una linea JSON, METRICS_PORT expone /metrics para Prometheus
+    if "METRICS_LOG_PATH" in st.secrets:
+        METRICS.json_log_path = st.secrets["METRICS_LOG_PATH"]
+    if "METRICS_PORT" in st.secrets:
+        serve_prometheus(METRICS, int(st.secrets["METRICS_PORT"]))
+    return METRICS
+
+metrics = get_metrics()
 
 # Define function to get user input
 def get_text():
@@ -78,6 +141,10 @@ def new_chat():
     st.session_state["generated"] = []
     st.session_state["past"] = []
     st.session_state["input"] = "" 
+    st.session_state["visible_turns"] = CHAT_HISTORY_PAGE_SIZE
+
+def show_previous_turns():
+    st.session_state["visible_turns"] += CHAT_HISTORY_PAGE_SIZE
 
 st.title("Radiografia Financiera")
 st.subheader("Conoce cómo están tus finanzas!")
@@ -90,6 +157,15 @@ st.caption('Los datos serán eliminados una vez que cierres el explorador, si qu
 
 data = stb.bridge("fintoc-bridge")
 
+# permite apuntar la app a un servidor local (fintoc_replay.py serve) en vez de api.fintoc.com
+fintoc_api_base_url = st.secrets.get("FINTOC_API_BASE_URL", "https://api.fintoc.com")
+# STREAMING_INGESTION agrega los movimientos a medida que se descargan (menos memoria, no usa el MovementStore)
+# (en secrets.toml puede venir como booleano o como texto, "false" o "0" la dejan apagada)
+streaming_ingestion = str(st.secrets.get("STREAMING_INGESTION", False)).strip().lower() in ("1", "true", "yes")
+# DEBUG (secret o variable de entorno MEMORYBOT_DEBUG) muestra los link tokens, el DataFrame, el cache y las metricas;
+# apagado por defecto porque expone datos de la sesion
+debug = str(st.secrets.get("DEBUG", os.environ.get("MEMORYBOT_DEBUG", False))).strip().lower() in ("1", "true", "yes")
+
 open_modal = st.button("Conectar mis cuentas bancarias 🔌 🏦", disabled = not agree)
 
 if open_modal:
@@ -97,7 +173,9 @@ if open_modal:
     
 if modal.is_open():
     with modal.container():
-        url = "https://api.fintoc.com/v1/link_intents"
+        from fintoc_http import get_http_client
+
+        url = f"{fintoc_api_base_url}/v1/link_intents"
 
         payload = {
             "product": "movements",
@@ -107,13 +185,21 @@ if modal.is_open():
         headers = {
             "accept": "application/json",
             "Authorization": st.secrets["FINTOC_SECRET_KEY"],
-            "content-type": "application/json"
+            "content-type": "application/json",
+            # permite reintentar el POST sin crear dos link intents
+            "Idempotency-Key": str(uuid.uuid4()),
         }
 
-        response = requests.post(url, json=payload, headers=headers)
-
-        widget_token = response.json()['widget_token']
-        components.html("""
+        try:
+            response = get_http_client().post(url, json=payload, headers=headers)
+            response.raise_for_status()
+            widget_token = response.json()['widget_token']
+        except Exception as e:
+            metrics.event('link_intent_failed', error = repr(e))
+            widget_token = None
+            st.error("No pudimos conectarnos con Fintoc, intenta nuevamente en unos minutos.")
+        if widget_token is not None:
+            components.html("""
                 <script src="https://js.fintoc.com/v1/"></script>
                 <script>
                 function waitForElm(selector) {
@@ -168,23 +254,146 @@ if data is not None:
             "exchange_token": data['exchangeToken'],
         }
 
-        url = f"https://api.fintoc.com/v1/links/exchange?exchange_token={data['exchangeToken']}"
+        url = f"{fintoc_api_base_url}/v1/links/exchange?exchange_token={data['exchangeToken']}"
         headers = {
             "accept": "application/json",
             "Authorization": st.secrets["FINTOC_SECRET_KEY"],
         }
-        response = requests.get(url, headers=headers).json()
-        st.session_state["fintoc_links"][data['id']]['link_token'] = response['link_token']
-        st.session_state["fintoc_links"][data['id']]['accounts'] = response['accounts']
-        st.session_state["fintoc_links"][data['id']]['bank'] = response['institution']['name']
-        st.session_state["fintoc_links"][data['id']]['holder_id'] = response['holder_id']
-        data = None
-        modal.close()
+        from fintoc_http import get_http_client
+
+        try:
+            response = get_http_client().get(url, headers=headers)
+            response.raise_for_status()
+            response = response.json()
+        except Exception as e:
+            metrics.event('link_exchange_failed', link_id = data['id'], error = repr(e))
+            st.session_state["fintoc_links"].pop(data['id'])
+            st.error("No pudimos obtener tu cuenta desde Fintoc, intenta conectarla nuevamente.")
+        else:
+            st.session_state["fintoc_links"][data['id']]['link_token'] = response['link_token']
+            st.session_state["fintoc_links"][data['id']]['accounts'] = response['accounts']
+            st.session_state["fintoc_links"][data['id']]['bank'] = response['institution']['name']
+            st.session_state["fintoc_links"][data['id']]['holder_id'] = response['holder_id']
+            data = None
+            modal.close()
 
     #st.session_state["fintoc_links"]
 st.write('---')
 
-debug = True
+ANALYSIS_SINCE, ANALYSIS_UNTIL = "2022-01-01", "2023-07-01"
+
+def link_data_key(link_token):
+    from process_movements import PIPELINE_VERSION
+    return fingerprint("link", link_token, ANALYSIS_SINCE, ANALYSIS_UNTIL, PIPELINE_VERSION)
+
+def analytical_data_key(link_tokens):
+    from process_movements import PIPELINE_VERSION
+    return fingerprint(sorted(link_tokens), ANALYSIS_SINCE, ANALYSIS_UNTIL, PIPELINE_VERSION)
+
+def load_insights(final_view_monthly):
+    """
+    Calcula los insights deterministicos de la vista mensual (se muestran de inmediato) y, si
+    hay un LLM configurado, lanza en segundo plano su redaccion en paralelo. Quedan en cache
+    por huella de los datos.
+    """
+    from insights import compute_insights, narrate_insights
+
+    if st.session_state["insights_job"] is not None:
+        get_job_runner().cancel(st.session_state["insights_job"])
+        st.session_state["insights_job"] = None
+    insights_key = dataframe_fingerprint(final_view_monthly)
+    insights_cache = get_insights_cache()
+    cached_insights = insights_cache.get(insights_key)
+    if cached_insights is not None:
+        st.session_state["insights"] = cached_insights
+        return
+    insights = compute_insights(final_view_monthly)
+    st.session_state["insights"] = insights
+    if "OPENAI_API_KEY" not in st.secrets:
+        insights_cache.set(insights_key, insights)
+        return
+
+    from langchain_agent import get_insight_narrator
+    narrate = get_insight_narrator(st.secrets["OPENAI_API_KEY"], st.secrets["OPENAI_ORGANIZATION"])
+
+    def insights_task(report):
+        report('narrative', 0, len(insights))
+        narrated_insights = narrate_insights(insights, narrate)
+        insights_cache.set(insights_key, narrated_insights)
+        report('narrative', len(insights), len(insights))
+        return narrated_insights
+    st.session_state["insights_job"] = get_job_runner().submit(insights_task, stages = ('narrative',))
+
+def set_analytical_data(final_view_monthly, data_key):
+    """
+    Deja los datos nuevos en la sesion y calcula sus insights. Si ya habia un agente se vuelve
+    a crear con los datos nuevos pero con su misma memoria, asi la conversacion sigue.
+    """
+    if st.session_state["langchain_init"] is not None:
+        st.session_state["agent_memory"] = st.session_state["langchain_init"].memory
+    st.session_state["fintoc_data"] = final_view_monthly
+    st.session_state["fintoc_data_key"] = data_key
+    st.session_state["langchain_init"] = None
+    load_insights(final_view_monthly)
+
+def session_link_tokens():
+    return [link["link_token"] for link in st.session_state["fintoc_links"].values() if "link_token" in link]
+
+def cancel_retrieval():
+    """
+    Cancela el job de obtencion de datos en curso y lo olvida: aunque termine igual (la
+    cancelacion solo se nota en sus reportes) su resultado ya no se aplica a la sesion.
+    """
+    if st.session_state["retrieval_job"] is not None:
+        get_job_runner().cancel(st.session_state["retrieval_job"])
+        get_job_runner().pop(st.session_state["retrieval_job"])
+        st.session_state["retrieval_job"] = None
+
+def remove_link(link_id):
+    """
+    Quita el link de la sesion, invalida todo lo calculado con sus datos y rearma la vista
+    mensual con los links restantes sin volver a descargarlos. Si a algun link restante le
+    faltan sus agregados (p.ej. fallo una de sus cuentas) se descartan los datos actuales y
+    se vuelven a obtener.
+    """
+    link = st.session_state["fintoc_links"].pop(link_id)
+    cancel_retrieval()
+    if "link_token" in link:
+        get_analytical_cache().invalidate(tag = link["link_token"])
+        st.session_state["link_aggregates"].pop(link["link_token"], None)
+    if get_movement_store() is not None:
+        get_movement_store().delete_link(link_id)
+
+    link_tokens = session_link_tokens()
+    if st.session_state["fintoc_data"] is None:
+        return
+    if len(link_tokens) == 0:
+        st.session_state["fintoc_data"] = None
+        st.session_state["fintoc_data_key"] = None
+        st.session_state["langchain_init"] = None
+        st.session_state["rolling_stats"] = None
+        st.session_state["insights"] = []
+    elif all(link_token in st.session_state["link_aggregates"] for link_token in link_tokens):
+        from process_movements import combine_movement_aggregates, make_rolling_stats
+
+        data_key = analytical_data_key(link_tokens)
+        link_aggregates = [st.session_state["link_aggregates"][link_token] for link_token in link_tokens]
+        if st.session_state["rolling_stats"] is None:
+            st.session_state["rolling_stats"] = make_rolling_stats()
+        rolling_stats = st.session_state["rolling_stats"]
+        final_view_monthly = get_analytical_cache().get_or_compute(
+            data_key, lambda: combine_movement_aggregates(link_aggregates).finalize(rolling_stats), tags = link_tokens)
+        set_analytical_data(final_view_monthly, data_key)
+    else:
+        # los datos actuales aun incluyen los movimientos del link quitado
+        if st.session_state["langchain_init"] is not None:
+            st.session_state["agent_memory"] = st.session_state["langchain_init"].memory
+        st.session_state["fintoc_data"] = None
+        st.session_state["fintoc_data_key"] = None
+        st.session_state["langchain_init"] = None
+        st.session_state["insights"] = []
+        st.session_state["refresh_data"] = True
+
 st.subheader('Cuentas Conectadas')
 col1, col2, col3= st.columns([2, 2 ,1])
 if len(st.session_state["fintoc_links"]) > 0:
@@ -199,7 +408,7 @@ if len(st.session_state["fintoc_links"]) > 0:
                 for account in link['accounts']:
                     st.write(f'📋 No: {account["number"]} ({account["name"]})') 
             with col3:
-                st.button('Eliminar ❌', key = link_id, type = 'secondary', on_click=lambda : st.session_state["fintoc_links"].pop(link_id), use_container_width=True)
+                st.button('Eliminar ❌', key = link_id, type = 'secondary', on_click=remove_link, args = (link_id,), use_container_width=True)
     except Exception as e:
         st.session_state["fintoc_links"]
         raise e
@@ -208,49 +417,211 @@ else:
 st.write('---')
 
 if st.session_state["fintoc_data"] is not None and st.session_state["langchain_init"] is None:
-    st.session_state["langchain_init"] = get_langchain_agent(st.session_state["fintoc_data"], st.secrets["OPENAI_API_KEY"])
+    from langchain_agent import get_langchain_agent
+    # el LLM, las herramientas y el prompt son compartidos por todo el proceso (ver get_shared_agent);
+    # la memoria de la conversacion es solo de esta sesion y sigue si cambiaron los datos
+    st.session_state["langchain_init"] = get_langchain_agent(st.session_state["fintoc_data"],
+                                                             st.secrets["OPENAI_API_KEY"],
+                                                             streaming = True,
+                                                             openai_organization = st.secrets["OPENAI_ORGANIZATION"],
+                                                             memory = st.session_state["agent_memory"])
+    st.session_state["agent_memory"] = None
+
+RETRIEVAL_STAGE_LABELS = {
+    'links': 'Conectando con tus bancos...',
+    'accounts': 'Descargando los movimientos de tus cuentas...',
+    'categorize': 'Categorizando tus movimientos...',
+    'aggregate': 'Calculando tus indicadores...',
+}
 
 def retrieve_data():
-    with st.chat_message("assistant"):
-        st.write("Obteniendo tu información bancaria...")
-        link_tokens_available = []
-        for link_id, link in st.session_state["fintoc_links"].items():
-            link_tokens_available.append(link["link_token"])
-        if st.session_state["fintoc_data"] is not None:
-            st.session_state["fintoc_data"]  = None
-            st.session_state["langchain_init"] = None
-            new_chat()
-        st.session_state["fintoc_data"] = get_analytical_dataframes(
-        fintoc_secret_key =  st.secrets["FINTOC_SECRET_KEY"],
-        link_tokens = link_tokens_available,
-        since="2022-01-01",
-        until="2023-07-01",
-        )
+    """
+    Lanza en segundo plano la obtencion y procesamiento de la informacion bancaria. Solo se
+    descargan y categorizan los links que aun no tienen agregados en la sesion; luego se
+    combinan con los de los demas links (cuentas propias y espejos entre todos) y se arma la
+    vista mensual. Los datos y la conversacion actuales se mantienen hasta que termine.
+    Los links con cuentas que fallaron no se guardan (ni en la sesion ni en el cache), asi se
+    reintentan la proxima vez; las cuentas quedan en `failed_accounts` para avisarle al usuario.
+    El avance se muestra en `show_retrieval_progress`.
+    """
+    from process_movements import ANALYTICAL_STAGES, combine_movement_aggregates, get_link_movement_aggregates, make_fintoc_client, make_rolling_stats
+
+    link_tokens_available = []
+    for link_id, link in st.session_state["fintoc_links"].items():
+        link_tokens_available.append(link["link_token"])
+    cancel_retrieval()
+    data_key = analytical_data_key(link_tokens_available)
+    known_aggregates = dict(st.session_state["link_aggregates"])
+    fintoc_secret_key = st.secrets["FINTOC_SECRET_KEY"]
+    movement_store = get_movement_store() if not streaming_ingestion else None
+    analytical_cache = get_analytical_cache()
+    # el job trabaja sobre una copia, la sesion se queda con ella solo si el job termina
+    rolling_stats = copy.deepcopy(st.session_state["rolling_stats"]) if st.session_state["rolling_stats"] is not None else make_rolling_stats()
+
+    def retrieval_task(report):
+        fintoc_client = make_fintoc_client(fintoc_secret_key, fintoc_api_base_url)
+        link_aggregates, failed_accounts = {}, []
+        for n_links, link_token in enumerate(link_tokens_available, start = 1):
+            aggregates = known_aggregates.get(link_token) or analytical_cache.get(link_data_key(link_token))
+            if aggregates is None:
+                aggregates = get_link_movement_aggregates(link_token, ANALYSIS_SINCE, ANALYSIS_UNTIL, fintoc_client,
+                                                          movement_store = movement_store, progress = report)
+                # si se cancelo (p.ej. se quito el link) no se vuelve a llenar el cache que se acaba de invalidar
+                if not aggregates.failed_accounts and not report.cancelled:
+                    analytical_cache.set(link_data_key(link_token), aggregates, tags = [link_token])
+            link_aggregates[link_token] = aggregates
+            failed_accounts.extend(aggregates.failed_accounts)
+            # los movimientos se categorizan a medida que se descargan, el avance se cuenta por link
+            report('categorize', n_links, len(link_tokens_available))
+        report('aggregate', 0, 1)
+        final_view_monthly = analytical_cache.get(data_key) if not failed_accounts else None
+        if final_view_monthly is None:
+            final_view_monthly = combine_movement_aggregates([link_aggregates[link_token] for link_token in link_tokens_available]).finalize(rolling_stats)
+            if not failed_accounts and not report.cancelled:
+                analytical_cache.set(data_key, final_view_monthly, tags = link_tokens_available)
+        report('aggregate', 1, 1)
+        complete_aggregates = {link_token: aggregates for link_token, aggregates in link_aggregates.items() if not aggregates.failed_accounts}
+        return dict(link_tokens = link_tokens_available, link_aggregates = complete_aggregates, final_view_monthly = final_view_monthly,
+                    rolling_stats = rolling_stats, failed_accounts = failed_accounts)
+    st.session_state["retrieval_job"] = get_job_runner().submit(retrieval_task, stages = ANALYTICAL_STAGES)
+    st.session_state["retrieval_data_key"] = data_key
+
+def show_retrieval_progress(placeholder):
+    """
+    Muestra el avance del job de obtencion de datos y vuelve a ejecutar el script hasta que termine.
+    """
+    job = get_job_runner().get(st.session_state["retrieval_job"])
+    if job is None:
+        st.session_state["retrieval_job"] = None
+        return
+    if not job.finished:
+        with placeholder.container():
+            with st.chat_message("assistant"):
+                st.write("Obteniendo tu información bancaria...")
+                st.progress(job.progress(), text = RETRIEVAL_STAGE_LABELS.get(job.current_stage, ''))
+        time.sleep(0.5)
+        st.experimental_rerun()
+    get_job_runner().pop(job.id)
+    st.session_state["retrieval_job"] = None
+    if job.status == Job.DONE and sorted(job.result["link_tokens"]) != sorted(session_link_tokens()):
+        # cambiaron los links mientras corria: el resultado incluye links que ya no estan (o le faltan)
+        metrics.event('retrieval_discarded', job_id = job.id)
+    elif job.status == Job.DONE:
+        st.session_state["link_aggregates"] = job.result["link_aggregates"]
+        st.session_state["rolling_stats"] = job.result["rolling_stats"]
+        st.session_state["failed_accounts"] = job.result["failed_accounts"]
+        set_analytical_data(job.result["final_view_monthly"], st.session_state["retrieval_data_key"])
+        st.experimental_rerun()
+    elif job.status == Job.FAILED:
+        placeholder.error(f"No pudimos obtener tu información bancaria ({job.error}), intenta nuevamente.")
+
 st.button("Terminé de agregar bancos", disabled = len(st.session_state["fintoc_links"]) == 0, on_click = retrieve_data)
+if st.session_state["refresh_data"]:
+    st.session_state["refresh_data"] = False
+    if len(st.session_state["fintoc_links"]) > 0:
+        retrieve_data()
+failed_accounts = [account for account in st.session_state["failed_accounts"] if account["link_id"] in st.session_state["fintoc_links"]]
+if failed_accounts and st.session_state["retrieval_job"] is None:
+    st.warning("No pudimos descargar los movimientos de estas cuentas y tus indicadores no las incluyen: "
+               + ", ".join(f'{st.session_state["fintoc_links"][account["link_id"]].get("bank", "")} N° {account["account_number"]}'
+                           for account in failed_accounts)
+               + ". Presiona \"Terminé de agregar bancos\" para reintentar.")
+retrieval_placeholder = st.empty()
+if debug and st.session_state["fintoc_data"] is not None:
+    # el contenido de un expander se dibuja aunque este cerrado, por eso se usa un checkbox
+    if st.checkbox("Ver DataFrame", key = "show_dataframe"):
+        fintoc_data = st.session_state["fintoc_data"]
+        n_pages = max((len(fintoc_data) - 1) // DATAFRAME_PAGE_SIZE + 1, 1)
+        page = st.number_input("Página", min_value = 1, max_value = n_pages, value = 1, key = "dataframe_page") if n_pages > 1 else 1
+        st.dataframe(fintoc_data.iloc[(page - 1) * DATAFRAME_PAGE_SIZE:page * DATAFRAME_PAGE_SIZE])
 if debug:
-    st.write("DataFrame:")
-    st.data_editor(st.session_state["fintoc_data"])
+    st.write("Cache:", dict(analytical = get_analytical_cache().stats(),
+                            responses = get_response_cache().stats()))
 with st.container():
     prompt = st.chat_input("Preguntame algo relacionado a tu situacion financiera...")
     with st.chat_message("assistant"):
         st.write("Hola 👋!, para poder entregarte asesoría financiera, primero debes agregar cuentas")
-        if st.session_state["langchain_init"] is not None:
+        if st.session_state["fintoc_data"] is not None:
             st.write("Muy bien! Ya terminé de obtener tu información desde tus bancos.")
-            st.write("Partiré con algunos datos interesantes que encontré!")
+            if len(st.session_state["insights"]) > 0:
+                st.write("Partiré con algunos datos interesantes que encontré!")
+                for insight in st.session_state["insights"]:
+                    st.markdown(f"- {insight.get('narrative', insight['text'])}")
+
+    n_turns = len(st.session_state.past)
+    first_visible_turn = max(n_turns - st.session_state["visible_turns"], 0)
+    if first_visible_turn > 0:
+        st.button(f"Ver mensajes anteriores ({first_visible_turn})", on_click = show_previous_turns)
+    for idx in range(first_visible_turn, n_turns):
+        with st.chat_message("user"):
+            st.write(st.session_state.past[idx])
+        with st.chat_message("assistant"):
+            try:
+                st.write(st.session_state.generated[idx])
+            except:
+                pass
+            #st.line_chart(np.random.randn(30, 3))
 
     if prompt and st.session_state["langchain_init"] is not None:
+        from langchain_agent import StreamingAnswerHandler, run_agent
         agent = st.session_state["langchain_init"]
-        output = agent.run(prompt)
+        with st.chat_message("user"):
+            st.write(prompt)
+        with st.chat_message("assistant"):
+            steps = st.empty()
+            answer = st.empty()
+            streaming_handler = StreamingAnswerHandler(on_answer = answer.markdown,
+                                                       on_step = steps.caption)
+            output = run_agent(agent,
+                               prompt,
+                               response_cache = get_response_cache(),
+                               data_fingerprint = dataframe_fingerprint(st.session_state["fintoc_data"]),
+                               context = list(zip(st.session_state.past, st.session_state.generated)),
+                               callbacks = [streaming_handler])
+            streaming_handler.finish()
+            steps.empty()
+            answer.write(output)
+        turn_metrics = streaming_handler.metrics()
+        # la memoria registra los tokens del prompt solo cuando el agente se ejecuta (no en hits del cache)
+        turn_prompt_tokens = getattr(agent.memory, 'turn_prompt_tokens', None)
+        if turn_metrics['llm_calls'] > 0 and turn_prompt_tokens:
+            turn_metrics.update(turn_prompt_tokens[-1])
+        st.session_state.turn_metrics.append(turn_metrics)
         st.session_state.past.append(prompt)  
         st.session_state.generated.append(output) 
 
-    if len(st.session_state.past) > 0:
-        for idx, user_message in enumerate(st.session_state.past):
-            with st.chat_message("user"):
-                st.write(user_message)
-            with st.chat_message("assistant"):
-                try:
-                    st.write(st.session_state.generated[idx])
-                except:
-                    pass
-                #st.line_chart(np.random.randn(30, 3))
\ No newline at end of file
+if debug and st.checkbox("Ver métricas", key = "show_metrics"):
+    if len(st.session_state.turn_metrics) > 0:
+        st.write("Latencia por turno (ultimos):")
+        st.dataframe(pd.DataFrame(st.session_state.turn_metrics[-CHAT_HISTORY_PAGE_SIZE:]))
+    st.write("Etapas:")
+    st.dataframe(pd.DataFrame(metrics.spans()))
+    st.write("Contadores:")
+    st.dataframe(pd.DataFrame(metrics.counters()))
+    st.write("Eventos recientes:")
+    st.dataframe(pd.DataFrame(metrics.recent_events(20)))
+    st.download_button("Descargar métricas (Prometheus)", metrics.to_prometheus(), file_name = "metrics.txt")
+
+def show_insights_progress():
+    """
+    Espera (volviendo a ejecutar el script) a que termine la redaccion de los insights; mientras
+    tanto se muestran los insights deterministicos.
+    """
+    job = get_job_runner().get(st.session_state["insights_job"])
+    if job is None:
+        st.session_state["insights_job"] = None
+        return
+    if not job.finished:
+        time.sleep(0.5)
+        st.experimental_rerun()
+    get_job_runner().pop(job.id)
+    st.session_state["insights_job"] = None
+    if job.status == Job.DONE:
+        st.session_state["insights"] = job.result
+        st.experimental_rerun()
+
+# al final, para que el resto de la pagina se dibuje mientras se espera el job
+if st.session_state["retrieval_job"] is not None:
+    show_retrieval_progress(retrieval_placeholder)
+if st.session_state["insights_job"] is not None:
+    show_insights_progress()
@@ -0,0 +1,178 @@
+"""
+Instrumentacion del proceso: tiempos por etapa (spans), contadores (filas, paginas de la API,
+llamadas al LLM, tokens) y un log de eventos en JSON. Hay una sola instancia compartida por
+todo el proceso (`METRICS`); se exporta en formato de texto de Prometheus (`to_prometheus`,
+`serve_prometheus`) y cada evento se agrega como una linea JSON a `json_log_path` si se configura.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('memorybot')
+
+# limites (en segundos) de los buckets del histograma de cada etapa
+SPAN_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(label_key, extra = ()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+class Metrics:
+    def __init__(self, prefix = 'memorybot', max_events = 1000, json_log_path = None, clock = time.perf_counter):
+        self.prefix = prefix
+        self.json_log_path = json_log_path
+        self._clock = clock
+        self._counters = {}
+        self._spans = {}
+        self._events = deque(maxlen = max_events)
+        self._lock = threading.Lock()
+
+    def inc(self, name, value = 1, **labels):
+        """
+        Suma `value` al contador `name` con las etiquetas `labels` (deben ser de baja cardinalidad).
+        """
+        with self._lock:
+            key = (name, _label_key(labels))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def event(self, name, **fields):
+        """
+        Registra un evento (reemplaza a los `print` de avance): queda en los eventos recientes, en
+        el log `memorybot` y, si hay `json_log_path`, como una linea JSON en ese archivo.
+        """
+        record = dict(ts = time.time(), event = name, **fields)
+        line = json.dumps(record, default = str, ensure_ascii = False)
+        with self._lock:
+            self._events.append(record)
+            if self.json_log_path is not None:
+                with open(self.json_log_path, 'a') as log_file:
+                    log_file.write(line + '\n')
+        logger.info(line)
+
+    def _observe(self, stage, seconds):
+        with self._lock:
+            span = self._spans.setdefault(stage, dict(count = 0, sum = 0.0, max = 0.0, errors = 0, buckets = [0] * len(SPAN_BUCKETS)))
+            span['count'] += 1
+            span['sum'] += seconds
+            span['max'] = max(span['max'], seconds)
+            for n, bound in enumerate(SPAN_BUCKETS):
+                if seconds <= bound:
+                    span['buckets'][n] += 1
+
+    @contextmanager
+    def span(self, stage, **fields):
+        """
+        Mide la duracion del bloque como la etapa `stage` y registra un evento `span` con `fields`.
+        Lo que se agregue al dict retornado (p.ej. filas procesadas) se incluye en el evento.
+        """
+        start = self._clock()
+        status = 'ok'
+        try:
+            yield fields
+        except BaseException:
+            status = 'error'
+            with self._lock:
+                self._spans.setdefault(stage, dict(count = 0, sum = 0.0, max = 0.0, errors = 0, buckets = [0] * len(SPAN_BUCKETS)))['errors'] += 1
+            raise
+        finally:
+            seconds = self._clock() - start
+            self._observe(stage, seconds)
+            self.event('span', stage = stage, seconds = round(seconds, 6), status = status, **fields)
+
+    def timed(self, stage):
+        """
+        Decorador que mide cada llamada a la funcion como la etapa `stage`.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def counters(self):
+        with self._lock:
+            return [dict(name = name, value = value, **dict(labels)) for (name, labels), value in sorted(self._counters.items())]
+
+    def spans(self):
+        with self._lock:
+            return [dict(stage = stage, count = span['count'], errors = span['errors'], total_seconds = span['sum'],
+                         mean_seconds = span['sum'] / span['count'] if span['count'] else 0.0, max_seconds = span['max'])
+                    for stage, span in sorted(self._spans.items())]
+
+    def recent_events(self, limit = 50):
+        with self._lock:
+            return list(self._events)[-limit:]
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._spans.clear()
+            self._events.clear()
+
+    def to_prometheus(self):
+        """
+        Contadores y duraciones por etapa en el formato de texto de Prometheus.
+        """
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                metric = f'{self.prefix}_{name}'
+                if metric not in typed:
+                    lines.append(f'# TYPE {metric} counter')
+                    typed.add(metric)
+                lines.append(f'{metric}{_format_labels(labels)} {value}')
+
+            metric = f'{self.prefix}_stage_seconds'
+            if self._spans:
+                lines.append(f'# TYPE {metric} histogram')
+            for stage, span in sorted(self._spans.items()):
+                labels = (('stage', stage),)
+                for bound, count in zip(SPAN_BUCKETS, span['buckets']):
+                    lines.append(f'{metric}_bucket{_format_labels(labels, [("le", bound)])} {count}')
+                lines.append(f'{metric}_bucket{_format_labels(labels, [("le", "+Inf")])} {span["count"]}')
+                lines.append(f'{metric}_sum{_format_labels(labels)} {span["sum"]}')
+                lines.append(f'{metric}_count{_format_labels(labels)} {span["count"]}')
+
+            metric = f'{self.prefix}_stage_errors'
+            if self._spans:
+                lines.append(f'# TYPE {metric} counter')
+            for stage, span in sorted(self._spans.items()):
+                lines.append(f'{metric}{_format_labels((("stage", stage),))} {span["errors"]}')
+        return '\n'.join(lines) + '\n'
+
+def serve_prometheus(metrics, port, host = '0.0.0.0'):
+    """
+    Expone `metrics.to_prometheus()` en http://host:port/metrics desde un thread en segundo plano.
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            payload = metrics.to_prometheus().encode('utf-8')
+            self.send_response(200 if self.path.startswith('/metrics') else 404)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target = server.serve_forever, name = 'metrics', daemon = True).start()
+    return server
+
+METRICS = Metrics(json_log_path = os.environ.get('MEMORYBOT_METRICS_LOG'))
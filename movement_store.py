@@ -0,0 +1,125 @@
+"""
+Almacen local (SQLite) de movimientos ya descargados desde Fintoc, para que al volver
+a obtener la informacion de un link solo se pidan los movimientos nuevos.
+
+Los movimientos se identifican por (link_id, account_number, id) y por cada cuenta se
+guarda desde que fecha se descargo (`fetched_since`), el resto sale de los movimientos
+guardados (`max(post_date)` es la marca de agua de la cuenta).
+"""
+import datetime as dt
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+MOVEMENT_COLUMNS = [
+    'link_id',
+    'link_institution_name',
+    'link_holder_id',
+    'account_type',
+    'account_number',
+    'account_holder_id',
+    'account_holder_name',
+    'id',
+    'description',
+    'amount',
+    'currency',
+    'post_date',
+    'transaction_date',
+    'type',
+    'recipient_account_holder_id',
+    'recipient_account_holder_name',
+    'comment',
+]
+
+DATE_COLUMNS = ('post_date', 'transaction_date')
+
+def _serialize_date(value):
+    return value.isoformat() if value is not None else None
+
+def _deserialize_date(value):
+    if value is None:
+        return None
+    if len(value) == 10:
+        return dt.date.fromisoformat(value)
+    return dt.datetime.fromisoformat(value)
+
+class MovementStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as connection:
+            connection.execute(f'''
+                CREATE TABLE IF NOT EXISTS movements (
+                    {", ".join(MOVEMENT_COLUMNS)},
+                    PRIMARY KEY (link_id, account_number, id)
+                )''')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS accounts (
+                    link_id,
+                    account_number,
+                    fetched_since,
+                    PRIMARY KEY (link_id, account_number)
+                )''')
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout = 30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get_fetch_since(self, link_id, account_number, since):
+        """
+        Retorna desde que fecha hay que pedir movimientos a Fintoc para cubrir `since`:
+        la marca de agua de la cuenta si ya se descargo desde `since` o antes, o `since` si no.
+        El dia de la marca de agua se vuelve a pedir, los duplicados se descartan al guardar.
+        """
+        with self._connect() as connection:
+            row = connection.execute('''
+                SELECT a.fetched_since, MAX(SUBSTR(m.post_date, 1, 10))
+                FROM accounts a
+                LEFT JOIN movements m ON m.link_id = a.link_id AND m.account_number = a.account_number
+                WHERE a.link_id = ? AND a.account_number = ?
+                GROUP BY a.fetched_since''', (link_id, account_number)).fetchone()
+        if row is None or row[0] > since or row[1] is None:
+            return since
+        return max(row[1], since)
+
+    def save_movements(self, link_id, account_number, since, movements):
+        """
+        Guarda (o reemplaza) los movimientos descargados de una cuenta desde `since`.
+        `movements` viene por columnas (dict columna -> lista).
+        """
+        columns = [[_serialize_date(value) for value in movements[column]] if column in DATE_COLUMNS else movements[column]
+                   for column in MOVEMENT_COLUMNS]
+        with self._lock, self._connect() as connection:
+            connection.executemany(f'''
+                INSERT OR REPLACE INTO movements ({", ".join(MOVEMENT_COLUMNS)})
+                VALUES ({", ".join("?" * len(MOVEMENT_COLUMNS))})''', zip(*columns))
+            connection.execute('''
+                INSERT INTO accounts (link_id, account_number, fetched_since) VALUES (?, ?, ?)
+                ON CONFLICT (link_id, account_number) DO UPDATE SET fetched_since = MIN(fetched_since, excluded.fetched_since)''',
+                               (link_id, account_number, since))
+
+    def load_movements(self, link_id, account_number, since, until):
+        """
+        Retorna por columnas los movimientos guardados de una cuenta con `post_date` entre
+        `since` y `until` (inclusive).
+        """
+        with self._connect() as connection:
+            rows = connection.execute(f'''
+                SELECT {", ".join(MOVEMENT_COLUMNS)} FROM movements
+                WHERE link_id = ? AND account_number = ? AND SUBSTR(post_date, 1, 10) BETWEEN ? AND ?
+                ORDER BY post_date, rowid''', (link_id, account_number, since, until)).fetchall()
+        columns = zip(*rows) if rows else [()] * len(MOVEMENT_COLUMNS)
+        movements = {}
+        for column, values in zip(MOVEMENT_COLUMNS, columns):
+            movements[column] = [_deserialize_date(value) for value in values] if column in DATE_COLUMNS else list(values)
+        return movements
+
+    def delete_link(self, link_id):
+        with self._lock, self._connect() as connection:
+            connection.execute('DELETE FROM movements WHERE link_id = ?', (link_id,))
+            connection.execute('DELETE FROM accounts WHERE link_id = ?', (link_id,))
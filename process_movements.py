@@ -1,88 +1,334 @@
 from fintoc import Fintoc
-import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import numpy as np
 import pandas as pd
 import re
 from thefuzz import fuzz
 from thefuzz import process
+from thefuzz import utils
+from fintoc_http import get_http_client
+from metrics import METRICS
+from movement_store import MOVEMENT_COLUMNS
+from rolling_stats import INCOME_ROLLING_PERIODS, MONTHLY_VIEW_ROLLING_PERIODS, SAVINGS_ROLLING_PERIODS, RollingStats
 
-def get_dataframe_movements_for_link_tokens(link_tokens, since, until, fintoc_client):
-    links_accounts_movements = []
-    for link_token in link_tokens:
-        link = fintoc_client.links.get(link_token)
-        print(f'| Getting accounts for link {link.id} ({link.institution.name} <{link.holder_id}>)')
-        for account in link.accounts.all():
-            print(f'|-- Gettings movements for account {account.number} <{account.type}>')
-            for movement in account.movements.all(since = since, until = until):
+# subir cuando cambie el resultado de get_analytical_dataframes, invalida los resultados cacheados
+PIPELINE_VERSION = 1
+
+FETCH_MAX_WORKERS = 4
+
+FINTOC_API_BASE_URL = 'https://api.fintoc.com'
+
+ANALYTICAL_STAGES = ('links', 'accounts', 'categorize', 'aggregate')
+
+MOVEMENT_CATEGORICAL_COLUMNS = ('link_institution_name', 'account_type', 'currency', 'type')
+MOVEMENT_DATE_COLUMNS = ('post_date', 'transaction_date')
+
+def _account_movement_chunks(link, account, since, until, chunk_size = None):
+    """
+    Recorre los movimientos de una cuenta (el SDK pide las paginas a medida que se consumen) y
+    los entrega como columnas (dict columna -> lista) en bloques de a lo mas `chunk_size`
+    movimientos; sin `chunk_size` se entrega un solo bloque con todos.
+    """
+    def new_chunk():
+        return {column: [] for column in MOVEMENT_COLUMNS}
+
+    def with_account_columns(chunk):
+        # los datos del link y la cuenta son los mismos para todos sus movimientos
+        n_movements = len(chunk['id'])
+        METRICS.inc('movements_fetched_total', n_movements)
+        chunk.update(
+            #link
+            link_id = [link.id] * n_movements,
+            link_institution_name = [link.institution.name] * n_movements,
+            link_holder_id = [link.holder_id] * n_movements,
+            #account
+            account_type = [account.type] * n_movements,
+            account_number = [account.number] * n_movements,
+            account_holder_id = [account.holder_id] * n_movements,
+            account_holder_name = [account.holder_name] * n_movements,
+        )
+        return chunk
+
+    chunk = new_chunk()
+    for movement in account.movements.all(since = since, until = until):
+        try:
+            recipient_account = movement.recipient_account
+            chunk['id'].append(movement.id)
+            chunk['description'].append(movement.description)
+            chunk['amount'].append(movement.amount)
+            chunk['currency'].append(movement.currency)
+            chunk['post_date'].append(movement.post_date)
+            chunk['transaction_date'].append(movement.transaction_date)
+            chunk['type'].append(movement.type)
+            chunk['recipient_account_holder_id'].append(recipient_account.holder_id if recipient_account is not None else None)
+            chunk['recipient_account_holder_name'].append(recipient_account.holder_name if recipient_account is not None else None)
+            chunk['comment'].append(movement.comment)
+        except Exception as e:
+            METRICS.event('movement_parse_error', link_id = link.id, account_number = account.number, movement = movement.serialize())
+            raise e
+        if chunk_size is not None and len(chunk['id']) >= chunk_size:
+            yield with_account_columns(chunk)
+            chunk = new_chunk()
+    if chunk_size is None or len(chunk['id']) > 0:
+        yield with_account_columns(chunk)
+
+def _get_account_movements(link, account, since, until, movement_store = None):
+    """
+    Descarga los movimientos de una cuenta y los retorna como columnas (dict columna -> lista).
+    """
+    fetch_since = since if movement_store is None else movement_store.get_fetch_since(link.id, account.number, since)
+    METRICS.event('fetch_account', link_id = link.id, account_number = account.number, account_type = account.type, since = fetch_since)
+    account_movements = next(_account_movement_chunks(link, account, fetch_since, until))
+    if movement_store is not None:
+        movement_store.save_movements(link.id, account.number, fetch_since, account_movements)
+        return movement_store.load_movements(link.id, account.number, since, until)
+    return account_movements
+
+def build_movements_dataframe(movements_columns):
+    """
+    Arma el DataFrame de movimientos desde sus columnas con tipos compactos: categoricos para
+    las columnas de baja cardinalidad, int64 para los montos y datetime64 para las fechas.
+    """
+    data = {}
+    for column in MOVEMENT_COLUMNS:
+        values = movements_columns[column]
+        if column in MOVEMENT_CATEGORICAL_COLUMNS:
+            data[column] = pd.Categorical(values)
+        elif column == 'amount':
+            data[column] = np.asarray(values, dtype = np.int64)
+        elif column in MOVEMENT_DATE_COLUMNS:
+            data[column] = pd.to_datetime(values)
+        else:
+            data[column] = pd.array(values, dtype = object)
+    return pd.DataFrame(data)
+
+FINTOC_ENDPOINT_PATTERNS = [(re.compile(pattern), endpoint) for pattern, endpoint in (
+    (r'/movements$', 'movements'),
+    (r'/v1/accounts$', 'accounts'),
+    (r'/v1/links/exchange$', 'exchange'),
+    (r'/v1/links/[^/]+$', 'links'),
+)]
+
+def _count_fintoc_response(response):
+    endpoint = next((endpoint for pattern, endpoint in FINTOC_ENDPOINT_PATTERNS if pattern.search(response.request.url.path)), 'other')
+    METRICS.inc('fintoc_api_requests_total', endpoint = endpoint, status = response.status_code)
+
+@functools.lru_cache(maxsize = 64)
+def _get_fintoc_client(fintoc_secret_key, api_base_url):
+    fintoc_client = Fintoc(fintoc_secret_key)
+    if api_base_url != FINTOC_API_BASE_URL:
+        fintoc_client._client.base_url = api_base_url.rstrip('/')
+    return fintoc_client
+
+def make_fintoc_client(fintoc_secret_key, api_base_url = None):
+    """
+    Cliente del SDK de Fintoc; con `api_base_url` apunta a otro servidor (p.ej. el de fintoc_replay.py).
+    Se reutiliza un mismo cliente por secret key y servidor, y todos mandan sus requests por el
+    cliente httpx compartido de `fintoc_http` (pool de conexiones, limitador y reintentos).
+    Cada request (p.ej. cada pagina de movimientos) se cuenta en `fintoc_api_requests_total`.
+    """
+    http_client = get_http_client()
+    if _count_fintoc_response not in http_client.event_hooks['response']:
+        http_client.event_hooks = dict(http_client.event_hooks, response = http_client.event_hooks['response'] + [_count_fintoc_response])
+    return _get_fintoc_client(fintoc_secret_key, api_base_url or FINTOC_API_BASE_URL)
+
+def _get_link_accounts(link):
+    METRICS.event('fetch_link', link_id = link.id, institution = link.institution.name)
+    return list(link.accounts.all())
+
+def _report_progress(progress, stage, done, total = None):
+    if progress is not None:
+        progress(stage, done, total)
+
+@METRICS.timed('fetch')
+def get_dataframe_movements_for_link_tokens(link_tokens, since, until, fintoc_client, max_workers = FETCH_MAX_WORKERS, movement_store = None, progress = None):
+    """
+    Obtiene los movimientos de todas las cuentas de los links en paralelo, con a lo mas
+    `max_workers` llamadas simultaneas a Fintoc (`max_workers=1` es secuencial).
+    El orden de las filas es siempre link -> cuenta -> movimiento, igual que el de `link_tokens`.
+    Si falla la descarga de una cuenta se omiten solo sus movimientos, y la cuenta queda
+    registrada en `df.attrs['failed_accounts']`.
+    Con un `movement_store` solo se piden a Fintoc los movimientos posteriores a los ya
+    guardados y el resto se lee desde el almacen local.
+    `progress(stage, done, total)` se llama con las etapas 'links' y 'accounts'; si lanza una
+    excepcion (p.ej. para cancelar) se cancelan las descargas pendientes.
+    """
+    links_accounts_movements = {column: [] for column in MOVEMENT_COLUMNS}
+    failed_accounts = []
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        account_futures = []
+        try:
+            _report_progress(progress, 'links', 0, len(link_tokens))
+            links = list(executor.map(fintoc_client.links.get, link_tokens))
+            links_accounts = list(executor.map(_get_link_accounts, links))
+            _report_progress(progress, 'links', len(links), len(link_tokens))
+            account_futures = [(link, account, executor.submit(_get_account_movements, link, account, since, until, movement_store))
+                               for link, accounts in zip(links, links_accounts)
+                               for account in accounts]
+            for n_accounts, (link, account, future) in enumerate(account_futures, start = 1):
                 try:
-                    links_accounts_movements.append(dict(
-                        #link
-                        link_id = link.id,
-                        link_institution_name=link.institution.name,
-                        link_holder_id = link.holder_id,
-                        
-                        #account
-                        account_type=account.type,
-                        account_number=account.number,
-                        account_holder_id=account.holder_id,
-                        account_holder_name=account.holder_name,
-                        #movement
-                        id=movement.id,
-                        description=movement.description,
-                        amount=movement.amount,
-                        currency=movement.currency,
-                        post_date=movement.post_date,
-                        transaction_date=movement.transaction_date,
-                        type=movement.type,
-                        recipient_account_holder_id=movement.recipient_account.holder_id if movement.recipient_account is not None else None,
-                        recipient_account_holder_name=movement.recipient_account.holder_name if movement.recipient_account is not None else None,
-                        comment=movement.comment,
-                    ))
+                    account_movements = future.result()
                 except Exception as e:
-                    print(movement.serialize())
-                    raise e
-        print('\t')
-    return pd.DataFrame.from_dict(links_accounts_movements)
+                    METRICS.event('fetch_account_failed', link_id = link.id, account_number = account.number, error = repr(e))
+                    METRICS.inc('fetch_failed_accounts_total')
+                    failed_accounts.append(dict(link_id = link.id, account_number = account.number, error = repr(e)))
+                    continue
+                finally:
+                    _report_progress(progress, 'accounts', n_accounts, len(account_futures))
+                for column, values in account_movements.items():
+                    links_accounts_movements[column].extend(values)
+        except BaseException:
+            for _, _, future in account_futures:
+                future.cancel()
+            raise
+    movements_df = build_movements_dataframe(links_accounts_movements)
+    movements_df.attrs['failed_accounts'] = failed_accounts
+    return movements_df
+
+MOVEMENT_CATEGORY_RULES = [(re.compile(pattern), category) for pattern, category in (
+    (r'.*SEGURO.*|.*DESGRAVAMEN.*', 'Seguros'),
+    (r'PAGO.*TAR.*CRED.*|.*T\. CRÉDITO.*|.*TARJETA DE C.*|.*DEUDA INTERNACIO.*|.*MONTO CANCELADO.*', 'Pago de Tarjeta de Crédito'),
+    (r'TRANSF.*|.*TRASPASO.*', 'Transferencias a terceros'),
+    (r'D\d{11} \d{3}/\d{3}|PAGO CUOTA CREDITO.*|PAGO.*CREDITO.*|.*HIPOTEC.*|.*L.CREDITO.*|.*CREDITO.*|.*PRESTAMO.*|.*L.*NEA.*CR.*DITO.*', 'Créditos'),
+    (r'COMPRA.*', 'Compras'),
+    (r'.*DE SERVICIOS|.*PAGO.*CUENTA.*|.*PAGO EN LINEA.*', 'Cuentas y Servicios'),
+    (r'IMPUESTO.*|.*IMPTO.*', 'Impuestos'),
+    (r'.*COMISION.*|.*INTERESES.*', 'Comisiones e Intereses'),
+    (r'P\.PROVEEDOR.*|.*PAGO RECIBIDO.*', 'Cuentas y Servicios'),
+    (r'.*MONEX.*|.*DIVI.*|INVERSION.*|.*DAP.*|.*FFMM.*|.*ACCIONES.*|.*RESCATE.*|.*DEPOSITO A PLAZO.*|.*ALCANCIA.*', 'Inversiones'),
+    (r'REMUNE.*|SALARIO.*|PAGO NOMINA.*', 'Remuneraciones'),
+    (r'GIRO.*|.*ATM.*', 'Retiros por Caja o ATM'),
+    (r'.*CHEQUE.*|.*DOCUMENTO.*|.*VALE.*VISTA.*', 'Cheque, Documento y Valevistas'),
+)]
+
+PRODUCT_CATEGORY_RULES = [(re.compile(pattern), product) for pattern, product in (
+    (r'.*PAC.*', 'PAC'),
+    (r'.*PAT.*', 'PAT'),
+    (r'TRANSF.*|.*TRASPASO.*', 'Transferencias'),
+    (r'DIVIDEN.*|.*HIPOTEC.*', 'Credito Hipotecario'),
+    (r'.*CONSUMO.*', 'Crédito de Consumo'),
+    (r'.*L.CREDITO.*|.*L.*NEA.*CR.*DITO.*', 'Línea de Crédito'),
+    (r'.*T\. CRÉDITO.*|.*TARJETA DE C.*', 'Tarjeta de Crédito'),
+    (r'.*MONEX.*|.*DIVISA.*', 'Compra y venta de divisas'),
+    (r'.*DAP.*|.*DEPOSITO A PLAZO.*', 'DAP'),
+    (r'.*ALCANCIA.*', 'Cuenta Ahorro'),
+    (r'.*FFMM.*', 'FFMM'),
+    (r'.*ATM.*', 'Cajero'),
+    (r'.*PAGO.*CAJA.*', 'Caja'),
+    (r'.*ACCIONES.*', 'ACCIONES'),
+    (r'.*CHEQUE.*|.*DOCUMENTO.*|.*VALE.*VISTA.*', 'Documentos'),
+    (r'REMUNE.*|SALARIO.*|PAGO NOMINA.*|.*P\.PROVEEDOR.*|.*PAGO RECIBIDO.*|.*DE SERVICIOS|.*PAGO.*CUENTA.*|.*PAGO EN LINEA.*', 'Pagos masivos y convenios'),
+)]
+
+INVESTMENT_TRANSFER_PATTERN = re.compile(r'.*FINTUAL.*|.*RACIONAL.*|.*ALCANCIA.*')
+OWN_ACCOUNT_TRANSFER_PATTERN = re.compile(r'.*CUENTA.*PROPIA.*')
+NON_DIGITS_PATTERN = re.compile(r'[A-z -]')
+CATEGORIZABLE_ACCOUNT_TYPES = ('checking_account', 'sight_account')
+
+def _unique_descriptions(movements_df):
+    """
+    Glosas en mayusculas factorizadas: retorna el codigo de cada fila y la serie de glosas
+    distintas. Las reglas se evaluan solo sobre las distintas (son muchas menos que las filas)
+    y el resultado se lleva a las filas con `resultado[codigos]`.
+    """
+    codes, uniques = pd.factorize(movements_df['description'].fillna('').str.upper())
+    return codes, pd.Series(uniques, dtype=object)
+
+def _match_first_rule(rules, descriptions):
+    """
+    Aplica las reglas en orden sobre una serie de glosas (ya en mayusculas),
+    la primera regla que calza gana. Retorna el array de categorias y la mascara
+    de filas que calzaron con alguna regla.
+    """
+    conditions = [descriptions.str.contains(pattern, regex=True).to_numpy(dtype=bool) for pattern, _ in rules]
+    choices = [category for _, category in rules]
+    return np.select(conditions, choices, default='Otros'), np.logical_or.reduce(conditions)
+
+def _is_own_account_transfer(link_holder_id, recipient_account_holder_id, account_holder_id, description):
+    return (link_holder_id == recipient_account_holder_id
+            or str(account_holder_id) in NON_DIGITS_PATTERN.sub(r'', description)
+            or OWN_ACCOUNT_TRANSFER_PATTERN.search(description) is not None)
 
 def categorize_movement(movement):
-    patterns = {
-        r'.*SEGURO.*|.*DESGRAVAMEN.*' : 'Seguros',
-        r'PAGO.*TAR.*CRED.*|.*T\. CRÉDITO.*|.*TARJETA DE C.*|.*DEUDA INTERNACIO.*|.*MONTO CANCELADO.*': 'Pago de Tarjeta de Crédito',
-        r'TRANSF.*|.*TRASPASO.*': 'Transferencias a terceros',
-        r'D\d{11} \d{3}/\d{3}|PAGO CUOTA CREDITO.*|PAGO.*CREDITO.*|.*HIPOTEC.*|.*L.CREDITO.*|.*CREDITO.*|.*PRESTAMO.*|.*L.*NEA.*CR.*DITO.*' : 'Créditos',
-        r'COMPRA.*' : 'Compras',
-        r'.*DE SERVICIOS|.*PAGO.*CUENTA.*|.*PAGO EN LINEA.*' : 'Cuentas y Servicios',
-        r'IMPUESTO.*|.*IMPTO.*': 'Impuestos',
-        r'.*COMISION.*|.*INTERESES.*': 'Comisiones e Intereses',
-        r'P\.PROVEEDOR.*|.*PAGO RECIBIDO.*':'Cuentas y Servicios',
-        r'.*MONEX.*|.*DIVI.*|INVERSION.*|.*DAP.*|.*FFMM.*|.*ACCIONES.*|.*RESCATE.*|.*DEPOSITO A PLAZO.*|.*ALCANCIA.*': 'Inversiones',
-        r'REMUNE.*|SALARIO.*|PAGO NOMINA.*': 'Remuneraciones',
-        r'GIRO.*|.*ATM.*': 'Retiros por Caja o ATM',
-        r'.*CHEQUE.*|.*DOCUMENTO.*|.*VALE.*VISTA.*': 'Cheque, Documento y Valevistas',
-    }
     description = movement['description'].upper()
     
     if movement['type'] == 'transfer':
-        if re.search(re.compile(r'.*FINTUAL.*|.*RACIONAL.*|.*ALCANCIA.*'), description):
+        if INVESTMENT_TRANSFER_PATTERN.search(description):
             return 'Inversiones'
-        if (movement.link_holder_id == movement.recipient_account_holder_id
-            or str(movement.account_holder_id) in re.sub(r'[A-z -]', r'', description)
-            or re.search(re.compile(r'.*CUENTA.*PROPIA.*'), description)):
-            
+        if _is_own_account_transfer(movement.link_holder_id,
+                                    movement.recipient_account_holder_id,
+                                    movement.account_holder_id,
+                                    description):
             return 'Transferencias entre cuentas propias'
         return 'Transferencias a terceros'
 
-    if movement['account_type'] in ('checking_account', 'sight_account'):
-        for pattern, category in patterns.items():
-            if re.search(re.compile(pattern), description):
+    if movement['account_type'] in CATEGORIZABLE_ACCOUNT_TYPES:
+        for pattern, category in MOVEMENT_CATEGORY_RULES:
+            if pattern.search(description):
                 return category
     return 'Otros'
 
+def categorize_movements(movements_df):
+    """
+    Version vectorizada de `categorize_movement`: evalua cada regla una sola vez sobre
+    las glosas distintas y respeta el orden (primera regla gana).
+    """
+    codes, unique_descriptions = _unique_descriptions(movements_df)
+    is_transfer = (movements_df['type'] == 'transfer').to_numpy(dtype=bool)
+    is_categorizable = movements_df['account_type'].isin(CATEGORIZABLE_ACCOUNT_TYPES).to_numpy(dtype=bool)
+
+    is_investment_transfer = unique_descriptions.str.contains(INVESTMENT_TRANSFER_PATTERN, regex=True).to_numpy(dtype=bool)[codes]
+    # solo las transferencias necesitan la comparacion de titulares, fila a fila
+    is_own_transfer = np.zeros(len(movements_df), dtype=bool)
+    transfer_rows = np.flatnonzero(is_transfer)
+    descriptions = unique_descriptions.to_numpy()[codes[transfer_rows]]
+    is_own_transfer[transfer_rows] = np.fromiter((_is_own_account_transfer(*values)
+                                                  for values in zip(movements_df['link_holder_id'].to_numpy()[transfer_rows],
+                                                                    movements_df['recipient_account_holder_id'].to_numpy()[transfer_rows],
+                                                                    movements_df['account_holder_id'].to_numpy()[transfer_rows],
+                                                                    descriptions)),
+                                                 dtype=bool, count=len(transfer_rows))
+    by_description = _match_first_rule(MOVEMENT_CATEGORY_RULES, unique_descriptions)[0][codes]
+
+    categories = np.select([is_transfer & is_investment_transfer,
+                            is_transfer & is_own_transfer,
+                            is_transfer,
+                            is_categorizable],
+                           ['Inversiones',
+                            'Transferencias entre cuentas propias',
+                            'Transferencias a terceros',
+                            by_description],
+                           default='Otros')
+    return pd.Series(categories, index=movements_df.index, dtype=object)
+
+NON_LETTERS_PATTERN = re.compile(r'[^A-z ]+')
+
+def _ratio_upper_bound(len_a, len_b):
+    """
+    Cota superior de `fuzz.ratio` para dos strings de largo `len_a` y `len_b`
+    (ratio = 2 * coincidencias / (len_a + len_b) y las coincidencias son a lo mas el menor largo).
+    """
+    if len_a + len_b == 0:
+        return 100
+    return 200 * min(len_a, len_b) / (len_a + len_b)
+
+def _normalize_holder_name(holder_name):
+    return NON_LETTERS_PATTERN.sub(r'', holder_name).upper().strip()
+
+def _normalize_glosa(glosa):
+    return NON_LETTERS_PATTERN.sub(r'', glosa).upper().strip().replace('TRANSF', '').replace("TEF", '')
+
 def get_own_account_desc_for_holder_name(holder_names, glosas):
+    normalized_glosas = [(glosa, _normalize_glosa(glosa)) for glosa in glosas]
     own_account_descriptions = []
     for holder_name in holder_names:
-        for glosa in glosas:
-            result = fuzz.ratio(re.sub(r'[^A-z ]+', r'', holder_name).upper().strip(),
-                       re.sub(r'[^A-z ]+', r'', glosa).upper().strip().replace('TRANSF', '').replace("TEF", ''))
+        normalized_holder_name = _normalize_holder_name(holder_name)
+        for glosa, normalized_glosa in normalized_glosas:
+            # el ratio se redondea, con una cota bajo 50 no puede superar el umbral
+            if _ratio_upper_bound(len(normalized_holder_name), len(normalized_glosa)) < 50:
+                continue
+            result = fuzz.ratio(normalized_holder_name, normalized_glosa)
             if result > 50:
                 own_account_descriptions.append(glosa.upper())
     return list(set(own_account_descriptions))
@@ -97,31 +343,68 @@ def is_own_account_description(description, compare_list):
         return True
     return False
 
+class OwnAccountMatcher:
+    """
+    Equivalente a `is_own_account_description` para muchas glosas: normaliza la lista de
+    comparacion una sola vez, evalua cada glosa distinta una sola vez y descarta por largo
+    los candidatos que no pueden llegar al umbral antes de calcular el ratio exacto.
+    """
+    def __init__(self, compare_list, score_cutoff = 80):
+        self.score_cutoff = score_cutoff
+        self._candidates_by_length = {}
+        for candidate in compare_list:
+            self._candidates_by_length.setdefault(len(utils.full_process(candidate)), []).append(candidate)
+        self._results = {}
+
+    def _get_candidates(self, query_length):
+        # margen de 1 punto por el redondeo del ratio
+        return [candidate
+                for length, candidates in self._candidates_by_length.items()
+                if _ratio_upper_bound(query_length, length) >= self.score_cutoff - 1
+                for candidate in candidates]
+
+    def is_own_account(self, description):
+        query = description.upper()
+        if query not in self._results:
+            candidates = self._get_candidates(len(utils.full_process(query)))
+            self._results[query] = len(candidates) > 0 and len(process.extractBests(query,
+                                                                                   candidates,
+                                                                                   score_cutoff=self.score_cutoff,
+                                                                                   limit = 1,
+                                                                                   scorer=fuzz.ratio)) > 0
+        return self._results[query]
+
+    def match(self, descriptions):
+        """
+        Retorna una serie booleana (mismo indice que `descriptions`) que indica que glosas son de cuentas propias.
+        """
+        return descriptions.map({description: self.is_own_account(description) for description in descriptions.unique()}).astype(bool)
+
+def get_mirror_transfers_index(movements_df, holder_ids):
+    """
+    Retorna el indice de las transferencias "espejo": pares del mismo dia y monto con un
+    movimiento de entrada y otro de salida en categorias distintas, donde alguno tiene como
+    destinatario a uno de los `holder_ids` del usuario o ninguno tiene destinatario.
+    Se resuelve con agregaciones por grupo (sin una funcion Python por grupo).
+    """
+    transfers = movements_df.loc[movements_df['product'] == 'Transferencias', ['post_date', 'amount', 'flow', 'category']]
+    recipient_ids = movements_df.loc[transfers.index, 'recipient_account_holder_id']
+    transfers = transfers.assign(is_own_recipient = recipient_ids.isin(holder_ids),
+                                 has_recipient = recipient_ids.fillna('').astype(bool))
+    groups = transfers.groupby(['post_date', 'amount'], sort = False)
+    is_mirror = ((groups['flow'].transform('size') == 2)
+                 & (groups['flow'].transform('nunique') == 2)
+                 & (groups['category'].transform('nunique') == 2)
+                 & (groups['is_own_recipient'].transform('any') | ~groups['has_recipient'].transform('any')))
+    return transfers.index[is_mirror.to_numpy(dtype = bool)]
+
 def categorize_product_movement(movement):
-    patterns = {
-        r'.*PAC.*' : 'PAC',
-        r'.*PAT.*' : 'PAT',
-        r'TRANSF.*|.*TRASPASO.*': 'Transferencias',
-        r'DIVIDEN.*|.*HIPOTEC.*': 'Credito Hipotecario',
-        r'.*CONSUMO.*': 'Crédito de Consumo',
-        r'.*L.CREDITO.*|.*L.*NEA.*CR.*DITO.*': 'Línea de Crédito',
-        r'.*T\. CRÉDITO.*|.*TARJETA DE C.*': 'Tarjeta de Crédito',
-        r'.*MONEX.*|.*DIVISA.*': 'Compra y venta de divisas',
-        r'.*DAP.*|.*DEPOSITO A PLAZO.*': 'DAP',
-        r'.*ALCANCIA.*': 'Cuenta Ahorro',
-        r'.*FFMM.*': 'FFMM',
-        r'.*ATM.*': 'Cajero',
-        r'.*PAGO.*CAJA.*': 'Caja',
-        r'.*ACCIONES.*': 'ACCIONES',
-        r'.*CHEQUE.*|.*DOCUMENTO.*|.*VALE.*VISTA.*': 'Documentos',
-        r'REMUNE.*|SALARIO.*|PAGO NOMINA.*|.*P\.PROVEEDOR.*|.*PAGO RECIBIDO.*|.*DE SERVICIOS|.*PAGO.*CUENTA.*|.*PAGO EN LINEA.*': 'Pagos masivos y convenios',
-    }
     description = movement['description'].upper()
         
-    if movement['account_type'] in ('checking_account', 'sight_account'):
-        for pattern, category in patterns.items():
-            if re.search(re.compile(pattern), description):
-                return category
+    if movement['account_type'] in CATEGORIZABLE_ACCOUNT_TYPES:
+        for pattern, product in PRODUCT_CATEGORY_RULES:
+            if pattern.search(description):
+                return product
 
     if movement['type'] == 'transfer':
         return 'Transferencias'
@@ -131,21 +414,43 @@ def categorize_product_movement(movement):
     
     return 'Otros'
 
-def get_monthly_income_df(movements_df):
-    renta = movements_df[movements_df.category == 'Remuneraciones'][['post_date', 'year_month', 'amount']].copy()
-    observations = len(renta.groupby(['year_month']).amount.sum())
-    estimated_rolling = max(min(12, round(observations/12)*3), 1)
-    
-    print(f"Found {observations} observations, using {estimated_rolling} periods for rolling window.")
-    
-    idx = pd.date_range(renta.post_date.min(), dt.date.today(), freq = 'D')
-    renta.index = pd.DatetimeIndex(renta.post_date)
-    renta.reindex(idx, fill_value=0)
-    renta = renta[['amount']]
-    renta['year_month'] = renta.index.to_series().apply(lambda x: x.strftime('%Y%m'))
-    monthly_income_df = pd.DataFrame(renta.groupby(['year_month']).amount.sum())
-    monthly_income_df['median_amount'] = monthly_income_df['amount'].rolling(estimated_rolling).median()
-    monthly_income_df['median_amount_diff'] = abs(monthly_income_df['median_amount'].diff(-1))
+def categorize_product_movements(movements_df):
+    """
+    Version vectorizada de `categorize_product_movement`.
+    """
+    codes, unique_descriptions = _unique_descriptions(movements_df)
+    is_categorizable = movements_df['account_type'].isin(CATEGORIZABLE_ACCOUNT_TYPES).to_numpy(dtype=bool)
+    by_description, has_match = _match_first_rule(PRODUCT_CATEGORY_RULES, unique_descriptions)
+    by_description, has_match = by_description[codes], has_match[codes]
+
+    products = np.select([is_categorizable & has_match,
+                          (movements_df['type'] == 'transfer').to_numpy(dtype=bool),
+                          (movements_df['account_type'] == 'credit_card').to_numpy(dtype=bool)],
+                         [by_description,
+                          'Transferencias',
+                          'Tarjeta de Crédito'],
+                         default='Otros')
+    return pd.Series(products, index=movements_df.index, dtype=object)
+
+def get_monthly_income_df(movements_df, rolling_stats = None):
+    """
+    Renta mensual (`Remuneraciones`) con su mediana movil. Si se entrega `rolling_stats`
+    (un `RollingStats` de periodos anteriores) solo se recalculan los meses que cambiaron.
+    """
+    renta = movements_df[movements_df.category == 'Remuneraciones']
+    return get_monthly_income_from_amounts(renta.groupby(['year_month']).amount.sum(), rolling_stats)
+
+def get_monthly_income_from_amounts(monthly_amounts, rolling_stats = None):
+    """
+    Igual que `get_monthly_income_df` pero desde la renta ya sumada por year_month.
+    """
+    monthly_income_df = pd.DataFrame(monthly_amounts)
+
+    rolling_stats = rolling_stats if rolling_stats is not None else RollingStats(INCOME_ROLLING_PERIODS)
+    monthly_income_df['median_amount'] = rolling_stats.update(monthly_income_df[['amount']], complete = True)['amount']
+    monthly_income_df['median_amount_diff'] = rolling_stats.diffs()['amount']
+
+    METRICS.event('rolling_window', series = 'income', observations = len(rolling_stats.values), window = rolling_stats.window)
     
     return monthly_income_df.dropna(subset=["median_amount"])
 
@@ -175,172 +480,436 @@ def analyze_income_raise_events(_income_df):
     income_df['median_amount'] = income_df['median_amount'].fillna(0).astype(int)
     income_df['median_amount_diff'] = income_df['median_amount_diff'].fillna(0).astype(int)
     
-    print(f"Detected {max(income_df.event_id.max(), 0)} raise events")
+    METRICS.event('income_raise_events', events = int(max(income_df.event_id.max(), 0)))
     
     return income_df
 
-def get_pivoted_data(df, add_grand_total = True):
-    res = df.groupby(['year_month', 'category']).sum().pivot_table(index=['year_month'],
-                                                                columns='category',
-                                                                values='amount',
-                                                                aggfunc='first').reset_index().fillna(0)
-    if add_grand_total:
-        res['Total'] = res.sum(numeric_only = True, axis=1)
-        
-    return res
-
-def get_df_with_numerics_rolling_median(df):
-    numerics = ['int16', 'int32', 'int64', 'float16', 'float32', 'float64']
-    estimated_rolling = max(min(4, round(len(df)/4)*3), 1)
-
-    selected_df = df.select_dtypes(include=numerics)
-    renamed_cols = []
-    for col in selected_df.columns:
-        renamed_cols.append(col+ '_rolling_median')
-    result_df = selected_df.rolling(estimated_rolling).median().fillna(0)
-    result_df.columns = renamed_cols
-    return df.join(result_df)
-
-def get_monthly_savings_df(movements_df):
+def get_monthly_savings_df(movements_df, rolling_stats = None):
     df_savings = movements_df[(movements_df.category.isin(['Inversiones']))][['amount',
                                                                    'year_month',
                                                                    'post_date',
-                                                                   'description',
-                                                                   'category',
-                                                                   'product',
                                                                    'flow']]
-    df_savings['amount_sign'] = df_savings.apply(lambda x: -int(x['amount']) if x['flow'] == 'IN' else int(x['amount']), axis = 1)
+    df_savings['amount_sign'] = np.where(df_savings['flow'] == 'IN', -df_savings['amount'], df_savings['amount'])
     
     df_savings = df_savings.groupby(['post_date', 'year_month']).amount_sign.sum().reset_index()
-    
     observations = len(df_savings)
-    estimated_rolling = max(min(6, round(observations/6)*3), 1)
-    
-    print(f"Found {observations} observations, using {estimated_rolling} periods for rolling window.")
     
-    idx = pd.date_range(df_savings.post_date.min(), dt.date.today(), freq = 'D')
-    df_savings.index = pd.DatetimeIndex(df_savings.post_date)
-    df_savings.reindex(idx, fill_value=0)
-    
-    df_savings = pd.DataFrame(df_savings.groupby(['year_month']).amount_sign.sum())
-    df_savings['amount_sign'] =  df_savings['amount_sign'].apply(lambda x: 0 if x < 0 else x)
-    df_savings['median_amount'] = df_savings['amount_sign'].rolling(estimated_rolling).median()
-    df_savings['median_amount_diff'] = abs(df_savings['median_amount'].diff(-1))
-    return df_savings.reset_index().copy()
+    return get_monthly_savings_from_amounts(df_savings.groupby(['year_month']).amount_sign.sum(), observations, rolling_stats)
 
-def get_analytical_dataframes(fintoc_secret_key, link_tokens, since, until):
-    fintoc_client = Fintoc(fintoc_secret_key)
+def get_monthly_savings_from_amounts(monthly_amount_sign, observations, rolling_stats = None):
+    """
+    Igual que `get_monthly_savings_df` pero desde el ahorro (inversiones netas de rescates) ya
+    sumado por year_month; `observations` es la cantidad de dias con inversiones.
+    """
+    df_savings = pd.DataFrame(monthly_amount_sign)
+    df_savings['amount_sign'] = df_savings['amount_sign'].clip(lower=0)
 
-    movements_df = get_dataframe_movements_for_link_tokens(link_tokens,
-                                                        since=since,
-                                                        until=until,
-                                                        fintoc_client=fintoc_client)
-    final_movements_df = movements_df.copy()
-    final_movements_df['category'] = final_movements_df.apply(categorize_movement, axis = 1)
-    final_movements_df['product'] = final_movements_df.apply(categorize_product_movement, axis = 1)
-    final_movements_df['flow'] = final_movements_df.amount.apply(lambda x: 'IN' if x > 0 else 'OUT')
-    final_movements_df['amount'] = final_movements_df.amount.apply(abs)
-    final_movements_df['year_month'] = final_movements_df['post_date'].apply(lambda x: x.strftime('%Y%m'))
+    # la ventana se estima con la cantidad de dias con movimientos, no de meses
+    rolling_stats = rolling_stats if rolling_stats is not None else RollingStats(SAVINGS_ROLLING_PERIODS)
+    df_savings['median_amount'] = rolling_stats.update(df_savings[['amount_sign']], observations = observations, complete = True)['amount_sign']
+    df_savings['median_amount_diff'] = rolling_stats.diffs()['amount_sign']
+
+    METRICS.event('rolling_window', series = 'savings', observations = observations, window = rolling_stats.window)
+
+    return df_savings.reset_index()
+
+OWN_TRANSFERS_CATEGORIES = ['Transferencias entre cuentas propias']
+SPENDINGS_EXCLUDED_CATEGORIES = ['Transferencias entre cuentas propias', 'Inversiones', 'Créditos']
+LOANS_CATEGORIES = ['Créditos', 'Pago de Tarjeta de Crédito']
+
+def get_monthly_category_cube(movements_df):
+    """
+    Suma los montos por (year_month, category, flow) en una sola pasada sobre los movimientos.
+    """
+    return movements_df.groupby(['year_month', 'category', 'flow'], observed=True).amount.sum()
+
+def get_cube_view(cube, flow, categories = None, excluded_categories = None, rolling_stats = None):
+    """
+    Pivotea desde el cubo mensual los movimientos de un `flow` filtrados por categoria: una fila
+    por year_month, una columna por categoria, `Total` y sus medianas moviles (`<columna>_rolling_median`).
+    Con `rolling_stats` (el de la actualizacion anterior) solo se recalculan los meses que cambiaron.
+    """
+    view = cube.xs(flow, level='flow')
+    view_categories = view.index.get_level_values('category')
+    mask = np.ones(len(view), dtype=bool)
+    if categories is not None:
+        mask &= view_categories.isin(categories)
+    if excluded_categories is not None:
+        mask &= ~view_categories.isin(excluded_categories)
+    res = view[mask].unstack('category', fill_value=0).sort_index()
+    res.columns = list(res.columns)
+    res['Total'] = res.sum(axis=1)
+
+    rolling_stats = rolling_stats if rolling_stats is not None else RollingStats(MONTHLY_VIEW_ROLLING_PERIODS)
+    rolling_df = rolling_stats.update(res, complete = True).fillna(0)
+    rolling_df.columns = [col + '_rolling_median' for col in res.columns]
+    return res.join(rolling_df)
+
+def get_monthly_views(movements_df, rolling_stats = None):
+    """
+    Vistas mensuales por categoria (ingresos, egresos, gastos y creditos) desde el cubo mensual.
+    """
+    return get_cube_views(get_monthly_category_cube(movements_df), rolling_stats)
+
+def get_cube_views(cube, rolling_stats = None):
+    rolling_stats = rolling_stats or {}
+    return dict(ingress = get_cube_view(cube, 'IN', excluded_categories=OWN_TRANSFERS_CATEGORIES, rolling_stats=rolling_stats.get('ingress')),
+                egress = get_cube_view(cube, 'OUT', excluded_categories=OWN_TRANSFERS_CATEGORIES, rolling_stats=rolling_stats.get('egress')),
+                spendings = get_cube_view(cube, 'OUT', excluded_categories=SPENDINGS_EXCLUDED_CATEGORIES, rolling_stats=rolling_stats.get('spendings')),
+                loans = get_cube_view(cube, 'OUT', categories=LOANS_CATEGORIES, rolling_stats=rolling_stats.get('loans')))
+
+def make_rolling_stats():
+    """
+    Estado de todas las medianas moviles de la vista mensual (renta, ahorro y las cuatro vistas
+    por categoria). Se guarda entre actualizaciones (p.ej. en la sesion) y se pasa a
+    `process_movements_dataframe` o `MovementAggregates.finalize`, asi al llegar un mes nuevo
+    solo se recalculan las medianas desde ese mes.
+    """
+    return dict(income = RollingStats(INCOME_ROLLING_PERIODS),
+                savings = RollingStats(SAVINGS_ROLLING_PERIODS),
+                **{view: RollingStats(MONTHLY_VIEW_ROLLING_PERIODS) for view in ('ingress', 'egress', 'spendings', 'loans')})
+
+# meses (los ultimos) sobre los que se promedia el gasto por categoria de `attrs['spending_categories']`
+INSIGHT_RECENT_MONTHS = 6
+
+def merge_monthly_views(monthly_views, final_df_income, final_df_savings):
+    final_df_ingress = monthly_views['ingress']
+    final_df_egress = monthly_views['egress']
+    final_df_spendings = monthly_views['spendings']
+    final_df_loans = monthly_views['loans']
 
+    final_view_monthly = pd.DataFrame({
+            'ingress': final_df_ingress['Total'],
+        })\
+        .join(final_df_egress['Total'].rename('egress'), how='inner')\
+        .join(final_df_spendings[['Total', 'Total_rolling_median']].set_axis(['spendings', 'spendings_median'], axis=1), how='inner')\
+        .join(final_df_savings.set_index('year_month')['median_amount'].rename('savings_median'), how='inner')\
+        .join(final_df_income.set_index('year_month')['median_amount'].rename('income_median'), how='inner')\
+        .join(final_df_loans['Créditos_rolling_median'].rename('loan_monthly_payments_median'), how='inner')\
+        .join(final_df_spendings['Pago de Tarjeta de Crédito_rolling_median'].rename('credit_card_usage_median'), how='inner')
+
+    final_view_monthly = final_view_monthly.fillna(0).astype(int)
+    final_view_monthly.index = final_view_monthly.index.astype(str)
+    final_view_monthly.index.name = 'year_month'
+
+    # datos que no estan en las columnas de la vista pero usan los insights (insights.py), en tipos de JSON
+    spending_categories = [column for column in final_df_spendings.columns if column != 'Total' and not column.endswith('_rolling_median')]
+    recent_spendings = final_df_spendings[spending_categories].sort_index().tail(INSIGHT_RECENT_MONTHS).mean()
+    final_view_monthly.attrs['spending_categories'] = {category: float(amount) for category, amount in recent_spendings.sort_values(ascending=False).items()}
+    final_view_monthly.attrs['income_events'] = [dict(year_month = str(row.year_month), median_amount = int(row.median_amount), raise_event_amount = int(row.raise_event_amount))
+                                                 for row in final_df_income.itertuples() if row.raise_event_amount != 0]
+
+    return final_view_monthly
+
+def get_final_view_monthly(movements_df, final_df_income, final_df_savings, rolling_stats = None):
+    return merge_monthly_views(get_monthly_views(movements_df, rolling_stats), final_df_income, final_df_savings)
+
+def add_flow_columns(movements_df):
+    """
+    Agrega `flow` (IN/OUT segun el signo), `year_month` y deja `amount` en valor absoluto.
+    """
+    movements_df['flow'] = np.where(movements_df.amount > 0, 'IN', 'OUT')
+    movements_df['amount'] = movements_df.amount.abs()
+    movements_df['year_month'] = movements_df['post_date'].dt.strftime('%Y%m')
+    return movements_df
+
+def fix_own_account_transfers(movements_df, holder_names = None, own_account_glosas = None):
+    """
+    Marca como cuentas propias las transferencias a terceros cuya glosa se parece (fuzzy) al
+    nombre del titular o a las glosas ya marcadas como cuentas propias. `holder_names` y
+    `own_account_glosas` se sacan de `movements_df` si no se entregan (ver `MovementAggregates`).
+    """
     ## fix para algunas tx que no quedan marcadas de cuentas propias
-    best_holder_name =  max(list(final_movements_df.account_holder_name.unique()), key=len) ## se asume que es el mismo
-    glosas = list(final_movements_df[final_movements_df.category == 'Transferencias entre cuentas propias'].description.unique())
+    if holder_names is None:
+        holder_names = list(movements_df.account_holder_name.unique())
+    if own_account_glosas is None:
+        own_account_glosas = list(movements_df[movements_df.category == 'Transferencias entre cuentas propias'].description.unique())
+    best_holder_name =  max(holder_names, key=len) ## se asume que es el mismo
+    glosas = list(own_account_glosas)
     compare_list = get_own_account_desc_for_holder_name([best_holder_name], glosas) + [best_holder_name]
 
-    final_movements_df.loc[final_movements_df.category == 'Transferencias a terceros', 'category'] =\
-        final_movements_df.loc[final_movements_df.category == 'Transferencias a terceros'].apply(lambda x:'Transferencias entre cuentas propias' if is_own_account_description(x['description'], compare_list) else x['category'], axis =1)
-    
+    third_party_descriptions = movements_df.loc[movements_df.category == 'Transferencias a terceros', 'description']
+    is_own_account = OwnAccountMatcher(compare_list).match(third_party_descriptions)
+    movements_df.loc[is_own_account[is_own_account].index, 'category'] = 'Transferencias entre cuentas propias'
+    METRICS.inc('own_account_reclassified_total', int(is_own_account.sum()))
+    return movements_df
+
+def fix_mirror_transfers(movements_df, holder_ids = None):
+    """
+    Marca como cuentas propias las transferencias espejo (`get_mirror_transfers_index`) y deja
+    `category`, `product` y `flow` como categoricas.
+    """
     # buscamos los espejos de movimientos realizados en un mismo dia y si resulta que nos cuadra por (monto,fecha,flow)
     # que existe un movimiento entre cuenta propia y otro a terceros, imputamos el de tercero a cuenta propia
-    final_movements_df.loc[final_movements_df[(final_movements_df['product'].isin(['Transferencias']))]\
-                    .groupby(['post_date', 'amount']).filter(lambda x: x['flow'].count() == 2
-                                                                and len(list(x['flow'].unique())) == 2
-                                                                and len(list(x['category'].unique())) == 2
-                                                                and ('180257578' in list(x['recipient_account_holder_id'])
-                                                                    or not x['recipient_account_holder_id'].any())
-                                                            ).index, 'category']\
-    = 'Transferencias entre cuentas propias'
-    
-    income_df = get_monthly_income_df(final_movements_df)
+    if holder_ids is None:
+        holder_ids = set(movements_df.link_holder_id.dropna().unique())
+    mirror_index = get_mirror_transfers_index(movements_df, holder_ids)
+    movements_df.loc[mirror_index, 'category'] = 'Transferencias entre cuentas propias'
+    METRICS.inc('mirror_transfers_total', len(mirror_index))
+
+    # una vez fijadas las categorias se guardan como categoricas
+    for column in ('category', 'product', 'flow'):
+        movements_df[column] = movements_df[column].astype('category')
+    return movements_df
+
+def get_income_and_savings(movements_df, rolling_stats = None):
+    """
+    Retorna la renta mensual (con los eventos de alza) y el ahorro mensual, con sus medianas
+    moviles. `rolling_stats` es el de `make_rolling_stats`.
+    """
+    rolling_stats = rolling_stats or {}
+    return _get_income_and_savings(get_monthly_income_df(movements_df, rolling_stats.get('income')),
+                                   get_monthly_savings_df(movements_df, rolling_stats.get('savings')))
+
+def _get_income_and_savings(income_df, savings_df):
     income_events_df = analyze_income_raise_events(income_df)
 
-    df_ingress = final_movements_df[(final_movements_df.flow == 'IN')&
-                                ~(final_movements_df.category.isin(['Transferencias entre cuentas propias']))
-                               ][['amount',
-                                                              'year_month',
-                                                               'post_date',
-                                                               'description',
-                                                               'category',
-                                                               'product',
-                                                               'flow']].sort_values(by=['category', 'flow'])
-
-    df_egress = final_movements_df[(final_movements_df.flow == 'OUT')&
-                        ~(final_movements_df.category.isin(['Transferencias entre cuentas propias']))][['amount',
-                                                                'year_month',
-                                                                'post_date',
-                                                                'description',
-                                                                'category',
-                                                                'product',
-                                                                'flow']].sort_values(by=['category', 'flow'])
-    df_ingress_income = final_movements_df[(final_movements_df.flow == 'IN')&
-                   (final_movements_df.category.isin(['Transferencias a terceros', 'Remuneraciones']))][['amount',
-                                                              'year_month',
-                                                               'post_date',
-                                                               'description',
-                                                               'category',
-                                                               'product',
-                                                               'flow']].sort_values(by=['category', 'flow'])
-
-    df_spendings = final_movements_df[(final_movements_df.flow == 'OUT')&
-                    ~(final_movements_df.category.isin(['Transferencias entre cuentas propias', 'Inversiones', 'Créditos']))][['amount',
-                                                                'year_month',
-                                                                'post_date',
-                                                                'description',
-                                                                'category',
-                                                                'product',
-                                                                'flow']].sort_values(by=['category', 'flow'])
-    df_loans = final_movements_df[(final_movements_df.flow == 'OUT')&
-                   (final_movements_df.category.isin(['Créditos', 'Pago de Tarjeta de Crédito']))][['amount',
-                                                               'year_month',
-                                                               'post_date',
-                                                               'description',
-                                                               'category',
-                                                               'product',
-                                                               'flow']].sort_values(by=['category', 'flow'])
-    final_df_savings = get_monthly_savings_df(final_movements_df)[['year_month', 'amount_sign', 'median_amount']]
+    final_df_savings = savings_df[['year_month', 'amount_sign', 'median_amount']]
 
     final_df_income = income_events_df[['amount', 'median_amount', 'raise_event_amount']].reset_index(False)
+    return final_df_income, final_df_savings
 
-    final_df_loans = get_df_with_numerics_rolling_median(get_pivoted_data(df_loans))
+STREAMING_CHUNK_SIZE = 5000
 
-    final_df_spendings = get_df_with_numerics_rolling_median(get_pivoted_data(df_spendings))
+# los fixes de cuentas propias y espejos solo cambian la categoria de estas filas, el resto se suma al bajar
+RETAINED_MOVEMENT_COLUMNS = ['post_date', 'year_month', 'amount', 'flow', 'category', 'product', 'description', 'recipient_account_holder_id']
 
-    final_df_ingress_income = get_df_with_numerics_rolling_median(get_pivoted_data(df_ingress_income))
+class MovementAggregates:
+    """
+    Acumula bloques de movimientos en los agregados que necesita la vista mensual, sin guardar
+    todos los movimientos: cada bloque se categoriza al llegar y se suma al cubo
+    (year_month, category, flow) y al ahorro mensual. Solo se guardan las filas cuya categoria
+    pueden cambiar `fix_own_account_transfers` y `fix_mirror_transfers` (transferencias a
+    terceros y productos `Transferencias`), que se corrigen y suman en `finalize`.
+    El resultado es el mismo que el de `process_movements_dataframe` sobre todos los movimientos.
+    """
+    def __init__(self):
+        self.rows = 0
+        self.cube = None
+        self.savings = None
+        self.savings_dates = set()
+        self.own_account_glosas = set()
+        self.holder_ids = set()
+        # nombres de titulares por `order_key` (link, cuenta) para respetar el orden de las filas al elegir el mas largo
+        self.holder_names = {}
+        self.retained = []
+        self.failed_accounts = []
 
-    final_df_ingress = get_df_with_numerics_rolling_median(get_pivoted_data(df_ingress))
-    final_df_egress = get_df_with_numerics_rolling_median(get_pivoted_data(df_egress))
-    
-    final_view_monthly = final_df_ingress[['year_month', 'Total']]\
-        .merge(final_df_egress[['year_month', 'Total']], on = 'year_month')\
-        .merge(final_df_spendings[['year_month', 'Total', 'Total_rolling_median']], on = 'year_month')\
-        .merge(final_df_savings[['year_month', 'median_amount']], on = 'year_month')\
-        .merge(final_df_income[['year_month', 'median_amount']], on = 'year_month')\
-        .merge(final_df_loans[['year_month', 'Créditos_rolling_median']], on = 'year_month')\
-        .merge(final_df_spendings[['year_month', 'Pago de Tarjeta de Crédito_rolling_median']], on = 'year_month')
-    
-    final_view_monthly.columns = [
-        'year_month',
-        'ingress',
-        'egress',
-        'spendings',
-        'spendings_median',
-        'savings_median',
-        'income_median',
-        'loan_monthly_payments_median',
-        'credit_card_usage_median',
-    ]
-    
-    final_view_monthly = final_view_monthly.fillna(0).astype(int)
-    final_view_monthly['year_month'] = final_view_monthly['year_month'].astype(str)
+    def add_chunk(self, movements_columns, order_key = 0):
+        """
+        Categoriza un bloque de movimientos (columnas, como las de `build_movements_dataframe`) y
+        lo incorpora a los agregados.
+        """
+        self.add_dataframe(build_movements_dataframe(movements_columns), order_key)
+
+    def add_dataframe(self, chunk_df, order_key = 0):
+        """
+        Igual que `add_chunk` pero desde un DataFrame de movimientos sin categorizar (se modifica).
+        """
+        if len(chunk_df) == 0:
+            return
+        self.rows += len(chunk_df)
+        chunk_df['category'] = categorize_movements(chunk_df)
+        chunk_df['product'] = categorize_product_movements(chunk_df)
+        add_flow_columns(chunk_df)
+
+        holder_names = self.holder_names.setdefault(order_key, [])
+        holder_names.extend(name for name in chunk_df.account_holder_name.unique() if name not in holder_names)
+        self.own_account_glosas.update(chunk_df.loc[chunk_df.category == 'Transferencias entre cuentas propias', 'description'].unique())
+        self.holder_ids.update(chunk_df.link_holder_id.dropna().unique())
+
+        is_retained = ((chunk_df['product'] == 'Transferencias') | (chunk_df['category'] == 'Transferencias a terceros')).to_numpy(dtype = bool)
+        self.retained.append(chunk_df.loc[is_retained, RETAINED_MOVEMENT_COLUMNS])
+        self._fold(chunk_df.loc[~is_retained])
+
+    def _fold(self, movements_df):
+        cube = movements_df.groupby(['year_month', 'category', 'flow'], observed = True).amount.sum()
+        self.cube = cube if self.cube is None else self.cube.add(cube, fill_value = 0)
+
+        investments = movements_df[movements_df.category == 'Inversiones']
+        amount_sign = pd.Series(np.where(investments['flow'] == 'IN', -investments['amount'], investments['amount']), index = investments.index)
+        savings = amount_sign.groupby(investments['year_month']).sum()
+        self.savings = savings if self.savings is None else self.savings.add(savings, fill_value = 0)
+        self.savings_dates.update(investments.post_date.unique())
+
+    def merge(self, other, order_key = None):
+        """
+        Incorpora los agregados de `other` (p.ej. los de otra cuenta descargada en paralelo) sin
+        modificarlo. Con `order_key` sus titulares quedan ordenados bajo esa llave (p.ej. la
+        posicion de su link).
+        """
+        self.rows += other.rows
+        for name in ('cube', 'savings'):
+            mine, theirs = getattr(self, name), getattr(other, name)
+            setattr(self, name, theirs if mine is None else mine if theirs is None else mine.add(theirs, fill_value = 0))
+        self.savings_dates |= other.savings_dates
+        self.own_account_glosas |= other.own_account_glosas
+        self.holder_ids |= other.holder_ids
+        for other_key, names in other.holder_names.items():
+            holder_names = self.holder_names.setdefault(other_key if order_key is None else (order_key, other_key), [])
+            holder_names.extend(name for name in names if name not in holder_names)
+        self.retained.extend(other.retained)
+        self.failed_accounts.extend(other.failed_accounts)
+        return self
+
+    def finalize(self, rolling_stats = None):
+        """
+        Corrige las categorias de las filas guardadas, las suma a los agregados y retorna la
+        vista mensual (`final_view_monthly`). `rolling_stats` es el de `make_rolling_stats`.
+        """
+        rolling_stats = rolling_stats or {}
+        retained_df = pd.concat(self.retained, ignore_index = True)
+        self.retained = []
+        holder_names = [name for _, names in sorted(self.holder_names.items()) for name in names]
+        with METRICS.span('own_account', rows = len(retained_df)):
+            fix_own_account_transfers(retained_df, holder_names = holder_names, own_account_glosas = self.own_account_glosas)
+        with METRICS.span('mirrors', rows = len(retained_df)):
+            fix_mirror_transfers(retained_df, holder_ids = self.holder_ids)
+        self._fold(retained_df)
+        del retained_df
+
+        with METRICS.span('income_savings'):
+            cube = self.cube.astype(np.int64).sort_index()
+            is_income = cube.index.get_level_values('category') == 'Remuneraciones'
+            income_amounts = cube[is_income].groupby(level = 'year_month').sum().rename('amount')
+            savings_amounts = self.savings.astype(np.int64).sort_index().rename('amount_sign')
+            final_df_income, final_df_savings = _get_income_and_savings(get_monthly_income_from_amounts(income_amounts, rolling_stats.get('income')),
+                                                                        get_monthly_savings_from_amounts(savings_amounts, len(self.savings_dates),
+                                                                                                         rolling_stats.get('savings')).reset_index())
+        with METRICS.span('aggregate') as span:
+            final_view_monthly = merge_monthly_views(get_cube_views(cube, rolling_stats), final_df_income, final_df_savings)
+            span['months'] = len(final_view_monthly)
+        return final_view_monthly
+
+def _aggregate_account_movements(link, account, since, until, chunk_size, order_key):
+    METRICS.event('fetch_account', link_id = link.id, account_number = account.number, account_type = account.type, since = since, streaming = True)
+    aggregates = MovementAggregates()
+    for movements_columns in _account_movement_chunks(link, account, since, until, chunk_size):
+        with METRICS.span('categorize_chunk', rows = len(movements_columns['id'])):
+            aggregates.add_chunk(movements_columns, order_key)
+    return aggregates
 
-    return final_view_monthly.set_index('year_month')
\ No newline at end of file
+@METRICS.timed('fetch')
+def get_movement_aggregates_for_link_tokens(link_tokens, since, until, fintoc_client, chunk_size = STREAMING_CHUNK_SIZE, max_workers = FETCH_MAX_WORKERS, progress = None):
+    """
+    Version en streaming de `get_dataframe_movements_for_link_tokens`: cada cuenta se recorre
+    en bloques de `chunk_size` movimientos que se categorizan y suman a un `MovementAggregates`
+    apenas llegan, asi la memoria depende del tamaño del bloque (y de las transferencias que
+    se guardan para los fixes) y no de la cantidad de movimientos.
+    Si falla una cuenta no se suma nada de ella y queda en `aggregates.failed_accounts`.
+    """
+    aggregates = MovementAggregates()
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        account_futures = []
+        try:
+            _report_progress(progress, 'links', 0, len(link_tokens))
+            links = list(executor.map(fintoc_client.links.get, link_tokens))
+            links_accounts = list(executor.map(_get_link_accounts, links))
+            _report_progress(progress, 'links', len(links), len(link_tokens))
+            account_futures = [(link, account, executor.submit(_aggregate_account_movements, link, account, since, until, chunk_size, (n_link, n_account)))
+                               for n_link, (link, accounts) in enumerate(zip(links, links_accounts))
+                               for n_account, account in enumerate(accounts)]
+            for n_accounts, (link, account, future) in enumerate(account_futures, start = 1):
+                try:
+                    aggregates.merge(future.result())
+                except Exception as e:
+                    METRICS.event('fetch_account_failed', link_id = link.id, account_number = account.number, error = repr(e))
+                    METRICS.inc('fetch_failed_accounts_total')
+                    aggregates.failed_accounts.append(dict(link_id = link.id, account_number = account.number, error = repr(e)))
+                finally:
+                    _report_progress(progress, 'accounts', n_accounts, len(account_futures))
+        except BaseException:
+            for _, _, future in account_futures:
+                future.cancel()
+            raise
+    return aggregates
+
+def get_link_movement_aggregates(link_token, since, until, fintoc_client, movement_store = None, progress = None):
+    """
+    Agregados (`MovementAggregates`) de los movimientos de un solo link, para guardarlos por
+    link y al agregar o quitar uno solo descargar y categorizar ese link (ver
+    `combine_movement_aggregates`). Con `movement_store` se descarga solo lo nuevo y se
+    agrega desde el DataFrame completo del link; sin el se agrega en streaming.
+    """
+    if movement_store is None:
+        return get_movement_aggregates_for_link_tokens([link_token], since = since, until = until,
+                                                       fintoc_client = fintoc_client, progress = progress)
+    movements_df = get_dataframe_movements_for_link_tokens([link_token], since = since, until = until, fintoc_client = fintoc_client,
+                                                           movement_store = movement_store, progress = progress)
+    aggregates = MovementAggregates()
+    aggregates.failed_accounts = movements_df.attrs['failed_accounts']
+    aggregates.add_dataframe(movements_df)
+    return aggregates
+
+def combine_movement_aggregates(link_aggregates):
+    """
+    Une los agregados de varios links (en el orden de los links) en uno nuevo sin modificarlos;
+    `finalize()` sobre el resultado corrige cuentas propias y espejos entre todos los links y
+    arma la vista mensual, igual que `get_analytical_dataframes` sobre todos los links.
+    """
+    combined = MovementAggregates()
+    for n_link, aggregates in enumerate(link_aggregates):
+        combined.merge(aggregates, order_key = n_link)
+    return combined
+
+def process_movements_dataframe(final_movements_df, progress = None, rolling_stats = None):
+    """
+    Categoriza los movimientos y arma la vista mensual (`final_view_monthly`). Cada etapa es
+    una funcion separada para poder medirlas por separado (ver benchmark.py) y cada una queda
+    registrada como un span en `METRICS`. `rolling_stats` (de `make_rolling_stats`) guarda las
+    medianas moviles entre llamadas para recalcular solo los meses que cambiaron.
+    """
+    n_rows = len(final_movements_df)
+    METRICS.inc('movements_processed_total', n_rows)
+    _report_progress(progress, 'categorize', 0, n_rows)
+    with METRICS.span('categorize', rows = n_rows):
+        final_movements_df['category'] = categorize_movements(final_movements_df)
+    with METRICS.span('product', rows = n_rows):
+        final_movements_df['product'] = categorize_product_movements(final_movements_df)
+        add_flow_columns(final_movements_df)
+    with METRICS.span('own_account', rows = n_rows):
+        fix_own_account_transfers(final_movements_df)
+    with METRICS.span('mirrors', rows = n_rows):
+        fix_mirror_transfers(final_movements_df)
+    _report_progress(progress, 'categorize', n_rows, n_rows)
+
+    _report_progress(progress, 'aggregate', 0, 1)
+    with METRICS.span('income_savings'):
+        final_df_income, final_df_savings = get_income_and_savings(final_movements_df, rolling_stats)
+    with METRICS.span('aggregate') as span:
+        final_view_monthly = get_final_view_monthly(final_movements_df, final_df_income, final_df_savings, rolling_stats)
+        span['months'] = len(final_view_monthly)
+    _report_progress(progress, 'aggregate', 1, 1)
+    return final_view_monthly
+
+def get_analytical_dataframes(fintoc_secret_key, link_tokens, since, until, movement_store = None, progress = None, api_base_url = None, streaming = False,
+                              rolling_stats = None):
+    """
+    Obtiene los movimientos de los links y arma la vista mensual (`final_view_monthly`).
+    `progress(stage, done, total)` se llama al avanzar cada una de las `ANALYTICAL_STAGES`.
+    Con `streaming` los movimientos se agregan a medida que se descargan sin armar el
+    DataFrame completo (ver `MovementAggregates`); no se puede usar con `movement_store`.
+    `rolling_stats` (de `make_rolling_stats`) es el estado de las medianas moviles de la
+    llamada anterior para los mismos links.
+    """
+    fintoc_client = make_fintoc_client(fintoc_secret_key, api_base_url)
+
+    if streaming:
+        if movement_store is not None:
+            raise ValueError('streaming no soporta movement_store')
+        aggregates = get_movement_aggregates_for_link_tokens(link_tokens, since = since, until = until,
+                                                             fintoc_client = fintoc_client, progress = progress)
+        METRICS.inc('movements_processed_total', aggregates.rows)
+        _report_progress(progress, 'categorize', aggregates.rows, aggregates.rows)
+        _report_progress(progress, 'aggregate', 0, 1)
+        final_view_monthly = aggregates.finalize(rolling_stats)
+        _report_progress(progress, 'aggregate', 1, 1)
+        return final_view_monthly
+
+    movements_df = get_dataframe_movements_for_link_tokens(link_tokens,
+                                                        since=since,
+                                                        until=until,
+                                                        fintoc_client=fintoc_client,
+                                                        movement_store=movement_store,
+                                                        progress=progress)
+    return process_movements_dataframe(movements_df, progress=progress, rolling_stats=rolling_stats)
@@ -0,0 +1,75 @@
+"""
+Medianas moviles por periodo (year_month) para las series del analisis: renta, ahorro y las
+columnas de las vistas mensuales. Todas usan la misma heuristica de ventana
+(`estimate_rolling_window`), cada una con su propio numero de periodos.
+"""
+import pandas as pd
+
+INCOME_ROLLING_PERIODS = 12
+SAVINGS_ROLLING_PERIODS = 6
+MONTHLY_VIEW_ROLLING_PERIODS = 4
+
+def estimate_rolling_window(observations, periods):
+    """
+    Ventana de la mediana movil segun la cantidad de observaciones: `round(observations/periods)*3`
+    acotada entre 1 y `periods`.
+    """
+    return max(min(periods, round(observations/periods)*3), 1)
+
+class RollingStats:
+    """
+    Mantiene los valores y medianas moviles de un conjunto de series (columnas de un DataFrame
+    indexado por periodo). Al llegar periodos nuevos o actualizados solo se recalculan las medianas
+    desde el primer periodo que cambio, a menos que cambie la ventana o las columnas, en cuyo
+    caso se recalcula todo.
+    """
+    def __init__(self, periods):
+        self.periods = periods
+        self.window = None
+        self.values = None
+        self.medians = None
+
+    def _changed_periods(self, values):
+        # periodos de `values` que no estaban guardados o cuyo valor cambio
+        if self.values is None:
+            return values.index
+        previous = self.values.reindex(index = values.index, columns = values.columns)
+        unchanged = ((values == previous) | (values.isna() & previous.isna())).all(axis = 1)
+        return values.index[~unchanged.to_numpy(dtype = bool)]
+
+    def update(self, values, observations = None, complete = False):
+        """
+        Incorpora `values` (periodos nuevos o que reemplazan a los ya guardados) y retorna las
+        medianas moviles de todas las series. `observations` es la cantidad de observaciones
+        para estimar la ventana, por defecto la cantidad de periodos. Con `complete` `values`
+        es la serie completa: se compara con lo guardado para recalcular solo desde el primer
+        periodo que cambio, y si falta algun periodo guardado se recalcula todo.
+        """
+        values = values.sort_index()
+        if complete and self.values is not None and not self.values.index.isin(values.index).all():
+            self.values = self.medians = None
+        changed = self._changed_periods(values)
+        if self.values is None:
+            merged = values
+        else:
+            merged = values.combine_first(self.values)
+        window = estimate_rolling_window(len(merged) if observations is None else observations, self.periods)
+
+        if self.medians is None or window != self.window or list(merged.columns) != list(self.medians.columns):
+            medians = merged.rolling(window).median()
+        elif len(changed) == 0:
+            medians = self.medians
+        else:
+            first_changed = merged.index.get_loc(changed[0])
+            start = max(first_changed - window + 1, 0)
+            changed_medians = merged.iloc[start:].rolling(window).median().iloc[first_changed - start:]
+            medians = pd.concat([self.medians.iloc[:first_changed], changed_medians])
+
+        self.values, self.medians, self.window = merged, medians, window
+        return medians
+
+    def diffs(self):
+        """
+        Diferencia absoluta de cada mediana con la del periodo siguiente.
+        """
+        return self.medians.diff(-1).abs()
@@ -0,0 +1,171 @@
+"""
+Generador (con semilla) de movimientos con la forma de los de Fintoc, para medir
+process_movements sin credenciales: glosas chilenas tipicas (TRANSF, COMPRA, PAGO TAR CRED,
+REMUNERACION, DAP, MONEX, ...), varios links y tipos de cuenta, una remuneracion mensual con
+alzas y transferencias espejo entre cuentas propias. Escala de miles a decenas de millones de
+filas: todo se arma con operaciones vectorizadas de numpy.
+
+    python synthetic_movements.py --movements 100000
+"""
+import argparse
+
+import numpy as np
+
+from movement_store import MOVEMENT_COLUMNS
+
+HOLDER_NAME = 'Juan Andrés Pérez Soto'
+HOLDER_ID = '180257578'
+
+INSTITUTIONS = ['Banco de Chile', 'Banco Santander', 'BancoEstado', 'Banco BCI', 'Scotiabank']
+ACCOUNT_TYPES = ['checking_account', 'sight_account', 'credit_card', 'savings_account']
+
+THIRD_PARTY_NAMES = ['MARIA GONZALEZ', 'PEDRO MUÑOZ ROJAS', 'CAMILA DIAZ', 'JOSE LUIS SOTO', 'CONSTANZA REYES',
+                     'FELIPE CONTRERAS', 'VALENTINA SILVA', 'DIEGO MORALES', 'CATALINA LOPEZ', 'SEBASTIAN FUENTES',
+                     'COMUNIDAD EDIFICIO LOS ALERCES', 'JARDIN INFANTIL PEQUEÑOS PASOS']
+OWN_ACCOUNT_GLOSAS = ['JUAN PEREZ', 'JUAN A PEREZ SOTO', 'JUAN ANDRES PEREZ', 'PEREZ SOTO JUAN', '18025757-8 CUENTA PROPIA']
+MERCHANTS = ['SUPERMERCADO LIDER', 'JUMBO COSTANERA', 'UNIMARC', 'FARMACIAS CRUZ VERDE', 'COPEC', 'SHELL',
+             'FALABELLA', 'RIPLEY', 'PARIS', 'MERCADOPAGO*RAPPI', 'UBER *TRIP', 'STARBUCKS', 'SODIMAC', 'NETFLIX.COM',
+             'SPOTIFY', 'PEDIDOSYA', 'CINEPLANET', 'SALCOBRAND', 'TOTTUS', 'EASY']
+SERVICES = ['ENEL', 'AGUAS ANDINAS', 'METROGAS', 'ENTEL', 'MOVISTAR', 'VTR', 'WOM', 'AUTOPISTA CENTRAL']
+EMPLOYERS = ['ACME CHILE SPA', 'SERVICIOS FINANCIEROS LTDA']
+BANKS = ['BCO CHILE', 'SANTANDER', 'BCI', 'ITAU', 'SCOTIABANK']
+ATMS = ['PROVIDENCIA', 'LAS CONDES', 'SANTIAGO CENTRO', 'ÑUÑOA', 'MAIPU']
+INSURANCES = ['VIDA', 'AUTO', 'HOGAR', 'DESGRAVAMEN']
+
+# (plantilla, valores del placeholder, signo, tipo, monto tipico en CLP, peso relativo, a cuenta propia)
+# signo 1 ingreso, -1 egreso, 0 cualquiera
+MOVEMENT_TEMPLATES = [
+    ('COMPRA {} ', MERCHANTS, -1, 'other', 25_000, 30, False),
+    ('TRANSF A {}', THIRD_PARTY_NAMES, -1, 'transfer', 80_000, 10, False),
+    ('TRANSF DE {}', THIRD_PARTY_NAMES, 1, 'transfer', 60_000, 6, False),
+    ('TEF A {}', OWN_ACCOUNT_GLOSAS, -1, 'transfer', 150_000, 3, True),
+    ('TRANSF A {}', OWN_ACCOUNT_GLOSAS, -1, 'transfer', 150_000, 3, True),
+    ('PAGO TAR CRED {}', BANKS, -1, 'other', 350_000, 4, False),
+    ('PAGO EN LINEA {}', SERVICES, -1, 'other', 30_000, 6, False),
+    ('PAC {}', SERVICES, -1, 'other', 25_000, 4, False),
+    ('DAP {:05d}', range(1000), 0, 'other', 1_000_000, 2, False),
+    ('MONEX {}', ['COMPRA USD', 'VENTA USD', 'COMPRA EUR'], 0, 'other', 400_000, 1, False),
+    ('FINTUAL {}', ['APORTE', 'RESCATE'], -1, 'transfer', 200_000, 2, False),
+    ('GIRO ATM {}', ATMS, -1, 'other', 40_000, 4, False),
+    ('COMISION {}', ['MANTENCION', 'ADMINISTRACION PLAN'], -1, 'other', 5_000, 2, False),
+    ('INTERESES {}', ['L.CREDITO', 'SOBREGIRO'], -1, 'other', 8_000, 2, False),
+    ('IMPTO {}', ['TIMBRES', 'TIMBRES Y ESTAMPILLAS'], -1, 'other', 2_000, 1, False),
+    ('PAGO CUOTA CREDITO {}', ['CONSUMO', 'AUTOMOTRIZ'], -1, 'other', 180_000, 1, False),
+    ('DIVIDENDO {}', ['HIPOTECARIO'], -1, 'other', 550_000, 1, False),
+    ('SEGURO {}', INSURANCES, -1, 'other', 15_000, 2, False),
+    ('CHEQUE {:06d}', range(1000), -1, 'other', 120_000, 1, False),
+    ('DEPOSITO {}', ['EN EFECTIVO', 'CHEQUE'], 1, 'other', 100_000, 1, False),
+]
+
+def _make_vocabulary():
+    """
+    Todas las glosas posibles (plantilla x valores) en un solo array, con el rango de cada plantilla.
+    """
+    vocabulary, offsets = [], []
+    for template, values, *_ in MOVEMENT_TEMPLATES:
+        offsets.append((len(vocabulary), len(values)))
+        vocabulary.extend(template.format(value).strip() for value in values)
+    return np.array(vocabulary, dtype = object), offsets
+
+def _month_starts(since, n_months):
+    return np.datetime64(since, 'M') + np.arange(n_months)
+
+def generate_movements(n_movements, n_links = 2, n_accounts = 3, n_months = 18, since = '2022-01-01', mirror_rate = 0.01, seed = 0):
+    """
+    Retorna cerca de `n_movements` movimientos como columnas (dict columna -> array, con las
+    columnas de `MOVEMENT_COLUMNS`), listos para `build_movements_dataframe`.
+    Hay `n_links` links con `n_accounts` cuentas cada uno (tipos en el orden de `ACCOUNT_TYPES`),
+    una remuneracion mensual en la primera cuenta y `mirror_rate` de los movimientos son pares
+    espejo (salida y entrada del mismo dia y monto entre dos cuentas propias).
+    Las filas quedan ordenadas por link -> cuenta -> fecha, como las entrega el fetch.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary, offsets = _make_vocabulary()
+    n_total_accounts = n_links * n_accounts
+    first_month = np.datetime64(since, 'D')
+    n_days = int((_month_starts(since, n_months + 1)[-1].astype('datetime64[D]') - first_month).astype(int))
+
+    n_salaries = n_months
+    n_mirrors = int(n_movements * mirror_rate) // 2
+    n_random = max(n_movements - n_salaries - 2 * n_mirrors, 0)
+
+    # movimientos comunes: plantilla ponderada y un valor al azar de su placeholder
+    weights = np.array([template[5] for template in MOVEMENT_TEMPLATES], dtype = float)
+    template_ids = rng.choice(len(MOVEMENT_TEMPLATES), size = n_random, p = weights / weights.sum())
+    starts = np.array([start for start, _ in offsets])
+    sizes = np.array([size for _, size in offsets])
+    descriptions = vocabulary[starts[template_ids] + (rng.random(n_random) * sizes[template_ids]).astype(np.int64)]
+
+    signs = np.array([template[2] for template in MOVEMENT_TEMPLATES])[template_ids]
+    signs = np.where(signs == 0, rng.choice([-1, 1], size = n_random), signs)
+    scales = np.array([template[4] for template in MOVEMENT_TEMPLATES], dtype = float)[template_ids]
+    amounts = signs * np.maximum(np.round(scales * rng.lognormal(0, 0.6, n_random), -1), 10).astype(np.int64)
+    types = np.array([template[3] for template in MOVEMENT_TEMPLATES], dtype = object)[template_ids]
+    is_own = np.array([template[6] for template in MOVEMENT_TEMPLATES])[template_ids]
+    accounts = rng.integers(0, n_total_accounts, n_random)
+    dates = first_month + rng.integers(0, n_days, n_random).astype('timedelta64[D]')
+
+    third_party_ids = np.array([str(10_000_000 + 7_919 * n) for n in range(50)], dtype = object)
+    # la mitad de las transferencias propias viene sin destinatario, solo con la glosa
+    own_recipients = np.where(rng.random(n_random) < 0.5, HOLDER_ID, None)
+    recipients = np.where(is_own, own_recipients, third_party_ids[rng.integers(0, len(third_party_ids), n_random)])
+    recipients = np.where(types == 'transfer', recipients, None)
+
+    # remuneracion mensual en la primera cuenta, con alzas cada ~6 meses
+    salary_base = 1_800_000 * (1 + 0.08 * (np.arange(n_salaries) // 6))
+    salary_amounts = np.round(salary_base * rng.normal(1, 0.01, n_salaries), -3).astype(np.int64)
+    salary_dates = _month_starts(since, n_salaries).astype('datetime64[D]') + np.timedelta64(27, 'D')
+    salary_descriptions = np.array([f'REMUNERACION {EMPLOYERS[0]}'] * n_salaries, dtype = object)
+
+    # pares espejo: mismo dia y monto, sale de una cuenta propia y entra en otra
+    mirror_dates = first_month + rng.integers(0, n_days, n_mirrors).astype('timedelta64[D]')
+    mirror_amounts = np.round(rng.lognormal(12, 0.5, n_mirrors), -3).astype(np.int64)
+    mirror_from = rng.integers(0, n_total_accounts, n_mirrors)
+    mirror_to = (mirror_from + 1 + rng.integers(0, max(n_total_accounts - 1, 1), n_mirrors)) % n_total_accounts
+    mirror_out_descriptions = vocabulary[offsets[1][0] + rng.integers(0, offsets[1][1], n_mirrors)]
+    mirror_in_descriptions = np.array([f'TRANSF DE {HOLDER_ID[:-1]}-{HOLDER_ID[-1]}'] * n_mirrors, dtype = object)
+
+    account_index = np.concatenate([accounts, np.zeros(n_salaries, dtype = np.int64), mirror_from, mirror_to])
+    post_date = np.concatenate([dates, salary_dates, mirror_dates, mirror_dates])
+    columns = dict(
+        description = np.concatenate([descriptions, salary_descriptions, mirror_out_descriptions, mirror_in_descriptions]),
+        amount = np.concatenate([amounts, salary_amounts, -mirror_amounts, mirror_amounts]),
+        type = np.concatenate([types, np.full(n_salaries, 'other', dtype = object), np.full(2 * n_mirrors, 'transfer', dtype = object)]),
+        recipient_account_holder_id = np.concatenate([recipients, np.full(n_salaries + 2 * n_mirrors, None, dtype = object)]),
+    )
+    columns['recipient_account_holder_name'] = np.where(columns['recipient_account_holder_id'] == HOLDER_ID, HOLDER_NAME, None)
+
+    order = np.lexsort((post_date, account_index))
+    account_index = account_index[order]
+    columns = {column: values[order] for column, values in columns.items()}
+    columns['post_date'] = post_date[order]
+    columns['transaction_date'] = columns['post_date']
+    n_rows = len(order)
+    columns['id'] = np.array([f'mov_{seed}_{number}' for number in range(n_rows)], dtype = object)
+    columns['currency'] = np.full(n_rows, 'CLP', dtype = object)
+    columns['comment'] = np.full(n_rows, None, dtype = object)
+
+    # datos del link y la cuenta de cada fila
+    link_index = account_index // n_accounts
+    columns['link_id'] = np.array([f'link_{seed}_{link}' for link in range(n_links)], dtype = object)[link_index]
+    columns['link_institution_name'] = np.array([INSTITUTIONS[link % len(INSTITUTIONS)] for link in range(n_links)], dtype = object)[link_index]
+    columns['link_holder_id'] = np.full(n_rows, HOLDER_ID, dtype = object)
+    columns['account_type'] = np.array([ACCOUNT_TYPES[account % n_accounts % len(ACCOUNT_TYPES)] for account in range(n_total_accounts)], dtype = object)[account_index]
+    columns['account_number'] = np.array([f'{account:08d}' for account in range(n_total_accounts)], dtype = object)[account_index]
+    columns['account_holder_id'] = np.full(n_rows, HOLDER_ID, dtype = object)
+    columns['account_holder_name'] = np.full(n_rows, HOLDER_NAME, dtype = object)
+    return {column: columns[column] for column in MOVEMENT_COLUMNS}
+
+if __name__ == '__main__':
+    from process_movements import build_movements_dataframe, categorize_movements
+
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--movements', type = int, default = 10_000)
+    parser.add_argument('--links', type = int, default = 2)
+    parser.add_argument('--accounts', type = int, default = 3)
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args()
+
+    movements_df = build_movements_dataframe(generate_movements(args.movements, args.links, args.accounts, seed = args.seed))
+    print(movements_df.head(10).to_string())
+    print(categorize_movements(movements_df).value_counts().to_string())
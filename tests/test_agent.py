@@ -0,0 +1,82 @@
+from typing import Any, List
+
+import pytest
+
+pytest.importorskip('langchain')
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, ChatGeneration, ChatResult
+
+from langchain_agent import StreamingAnswerHandler, clear_shared_agents, get_langchain_agent, run_agent
+from process_movements import build_movements_dataframe, process_movements_dataframe
+from synthetic_movements import generate_movements
+
+TOOL_REPLY = '```json\n{"action": "SavingsRate", "action_input": ""}\n```'
+FINAL_REPLY = '```json\n{"action": "Final Answer", "action_input": "Ahorras bien"}\n```'
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model de prueba: responde `replies` en orden y cuenta tokens por palabras (sin tiktoken).
+    Acepta (e ignora) los mismos argumentos que `ChatOpenAI`.
+    """
+    replies: List[str] = []
+    calls: List[Any] = []
+
+    def __init__(self, **kwargs):
+        super().__init__(replies = [TOOL_REPLY, FINAL_REPLY] * 10, calls = [])
+
+    def _generate(self, messages, stop = None, run_manager = None):
+        self.calls.append(messages)
+        return ChatResult(generations = [ChatGeneration(message = AIMessage(content = self.replies[len(self.calls) - 1]))])
+
+    async def _agenerate(self, messages, stop = None, run_manager = None):
+        return self._generate(messages, stop)
+
+    @property
+    def _llm_type(self):
+        return 'fake-chat'
+
+    def get_num_tokens(self, text):
+        return len(text.split())
+
+    def get_num_tokens_from_messages(self, messages):
+        return sum(self.get_num_tokens(message.content) for message in messages)
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    monkeypatch.setattr('langchain.chat_models.ChatOpenAI', FakeChatModel)
+    clear_shared_agents()
+    yield
+    clear_shared_agents()
+
+def monthly_view(seed):
+    return process_movements_dataframe(build_movements_dataframe(generate_movements(3000, seed = seed)))
+
+def test_logged_prompt_tokens_count_the_formatted_messages(fake_llm):
+    agent = get_langchain_agent(monthly_view(0), 'sk-test')
+    response = run_agent(agent, '¿Cuánto ahorro?')
+
+    llm = agent.executor.agent.llm_chain.llm
+    assert response == 'Ahorras bien'
+    assert len(llm.calls) == 2
+    turn = agent.memory.turn_prompt_tokens[-1]
+    # lo enviado incluye herramientas, instrucciones de formato y (en la segunda llamada) el scratchpad
+    assert turn['prompt_tokens'] == sum(llm.get_num_tokens_from_messages(messages) for messages in llm.calls)
+    assert turn['prompt_tokens'] > turn['fixed_prompt_tokens'] + turn['history_tokens'] + turn['input_tokens']
+    assert turn['llm_calls'] == 2
+
+def test_sessions_share_the_agent_but_not_memory_or_data(fake_llm):
+    views = [monthly_view(0), monthly_view(1)]
+    agents = [get_langchain_agent(view, 'sk-test') for view in views]
+    # pydantic copia (superficialmente) el agente al armar cada AgentExecutor, la cadena con el prompt y el LLM es la misma
+    assert agents[0].executor.agent.llm_chain is agents[1].executor.agent.llm_chain
+    assert agents[0].memory is not agents[1].memory
+
+    observations = []
+    for agent in agents:
+        steps = []
+        run_agent(agent, '¿Cuánto ahorro?', callbacks = [StreamingAnswerHandler(on_step = steps.append)])
+        observations.append([step for step in steps if step.startswith('📎')])
+    # la herramienta compartida respondio con los datos de cada sesion
+    assert observations[0] != observations[1]
+    assert len(agents[0].memory.chat_memory.messages) == 2
+    assert len(agents[1].memory.chat_memory.messages) == 2
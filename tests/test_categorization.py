@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+
+from process_movements import (build_movements_dataframe, categorize_movement, categorize_movements,
+                               categorize_product_movement, categorize_product_movements)
+from synthetic_movements import HOLDER_ID, generate_movements
+
+# casos borde: orden de las reglas, transferencias a inversiones y a cuentas propias, tipos de cuenta no categorizables
+EDGE_CASES = [
+    ('transfer', 'checking_account', 'TRANSF A FINTUAL', None),
+    ('transfer', 'checking_account', 'TRANSF A JUAN PEREZ', HOLDER_ID),
+    ('transfer', 'sight_account', 'TRASPASO A CUENTA PROPIA', None),
+    ('transfer', 'sight_account', f'TRANSF {HOLDER_ID}', None),
+    ('transfer', 'credit_card', 'TRANSF A MARIA GONZALEZ', '111111111'),
+    ('other', 'checking_account', 'pago seguro desgravamen credito', None),
+    ('other', 'checking_account', 'PAGO TAR CRED', None),
+    ('other', 'checking_account', 'D12345678901 001/012', None),
+    ('other', 'checking_account', 'PAC ENEL', None),
+    ('other', 'sight_account', 'DAP RENOVACION', None),
+    ('other', 'sight_account', 'DEPOSITO ALCANCIA', None),
+    ('other', 'credit_card', 'COMPRA JUMBO', None),
+    ('other', 'savings_account', 'REMUNERACION', None),
+    ('other', 'checking_account', 'ABC', None),
+    ('other', 'checking_account', '', None),
+]
+
+def edge_case_movements():
+    rows = [dict(link_id = 'link_0', link_institution_name = 'Banco de Chile', link_holder_id = HOLDER_ID,
+                 account_type = account_type, account_number = '00000001', account_holder_id = HOLDER_ID,
+                 account_holder_name = 'Juan Pérez', id = f'mov_{number}', description = description,
+                 amount = -1000, currency = 'CLP', post_date = pd.Timestamp('2023-01-01'),
+                 transaction_date = pd.Timestamp('2023-01-01'), type = movement_type,
+                 recipient_account_holder_id = recipient, recipient_account_holder_name = None, comment = None)
+            for number, (movement_type, account_type, description, recipient) in enumerate(EDGE_CASES)]
+    return pd.DataFrame(rows)
+
+@pytest.fixture(params = ['synthetic', 'edge_cases'])
+def movements_df(request):
+    if request.param == 'synthetic':
+        return build_movements_dataframe(generate_movements(5000, n_links = 2, n_accounts = 4, seed = 1))
+    return edge_case_movements()
+
+def test_categorize_movements_matches_row_by_row(movements_df):
+    expected = movements_df.apply(categorize_movement, axis = 1)
+    pd.testing.assert_series_equal(categorize_movements(movements_df), expected, check_names = False, check_dtype = False)
+
+def test_categorize_product_movements_matches_row_by_row(movements_df):
+    expected = movements_df.apply(categorize_product_movement, axis = 1)
+    pd.testing.assert_series_equal(categorize_product_movements(movements_df), expected, check_names = False, check_dtype = False)
+
+def test_categorize_empty_dataframe():
+    movements_df = edge_case_movements().iloc[:0]
+    assert len(categorize_movements(movements_df)) == 0
+    assert len(categorize_product_movements(movements_df)) == 0
@@ -0,0 +1,43 @@
+from fake_fintoc import FakeFintoc
+from process_movements import get_dataframe_movements_for_link_tokens
+
+def fetch(fintoc_client, max_workers):
+    return get_dataframe_movements_for_link_tokens(fintoc_client.link_tokens, since = '2022-01-01', until = '2023-07-01',
+                                                   fintoc_client = fintoc_client, max_workers = max_workers)
+
+def get_accounts(fintoc_client, link_token):
+    return fintoc_client.links._links[link_token].accounts._accounts
+
+def account_order(movements_df):
+    return list(dict.fromkeys(zip(movements_df['link_id'], movements_df['account_number'])))
+
+def test_results_keep_account_order():
+    fintoc_client = FakeFintoc(n_links = 3, n_accounts = 2, n_movements = 50, latency = 0)
+    # la primera cuenta es la mas lenta, asi en paralelo termina al final
+    get_accounts(fintoc_client, fintoc_client.link_tokens[0])[0].movements._latency = 0.05
+    expected_order = [(f'link_{n_link}', account.number)
+                      for n_link, link_token in enumerate(fintoc_client.link_tokens)
+                      for account in get_accounts(fintoc_client, link_token)]
+
+    sequential_df = fetch(fintoc_client, max_workers = 1)
+    concurrent_df = fetch(fintoc_client, max_workers = 8)
+    assert account_order(sequential_df) == expected_order
+    assert concurrent_df.equals(sequential_df)
+
+def test_failing_account_does_not_drop_the_others():
+    fintoc_client = FakeFintoc(n_links = 2, n_accounts = 2, n_movements = 50, latency = 0)
+    reference_df = fetch(fintoc_client, max_workers = 4)
+    failing_account = get_accounts(fintoc_client, fintoc_client.link_tokens[1])[0]
+
+    def fail(since = None, until = None):
+        raise ConnectionError('fintoc no responde')
+
+    failing_account.movements.all = fail
+    movements_df = fetch(fintoc_client, max_workers = 4)
+
+    expected_df = reference_df[reference_df['account_number'] != failing_account.number]
+    assert account_order(movements_df) == account_order(expected_df)
+    assert list(movements_df['id']) == list(expected_df['id'])
+    assert movements_df.attrs['failed_accounts'] == [dict(link_id = 'link_1', account_number = failing_account.number,
+                                                          error = repr(ConnectionError('fintoc no responde')))]
+    assert reference_df.attrs['failed_accounts'] == []
@@ -0,0 +1,87 @@
+import email.utils
+
+import httpx
+
+from fintoc_http import BACKOFF_MAX, RetryingTransport, TokenBucket, make_http_client, parse_retry_after
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+def make_client(statuses, max_retries = 4, headers = None):
+    calls, sleeps = [], []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(statuses[min(len(calls), len(statuses)) - 1], headers = headers or {}, json = {})
+
+    transport = RetryingTransport(httpx.MockTransport(handler), max_retries = max_retries, sleep = sleeps.append, rng = lambda: 1.0)
+    return httpx.Client(transport = transport, base_url = 'https://api.fintoc.test'), calls, sleeps
+
+def test_429_then_200_is_retried():
+    client, calls, sleeps = make_client([429, 200], headers = {'Retry-After': '2'})
+    response = client.get('/v1/links')
+    assert response.status_code == 200
+    assert len(calls) == 2
+    # se respeta Retry-After por sobre el backoff (0.5s en el primer intento)
+    assert sleeps == [2.0]
+
+def test_stops_after_max_retries():
+    client, calls, sleeps = make_client([503], max_retries = 2)
+    response = client.get('/v1/links')
+    assert response.status_code == 503
+    assert len(calls) == 3
+    assert sleeps == [0.5, 1.0]
+
+def test_post_without_idempotency_key_is_not_retried_on_5xx():
+    client, calls, sleeps = make_client([503, 200])
+    assert client.post('/v1/links/exchange').status_code == 503
+    assert len(calls) == 1
+
+def test_parse_retry_after_seconds():
+    assert parse_retry_after('3') == 3.0
+    assert parse_retry_after('-1') == 0.0
+    assert parse_retry_after('') is None
+    assert parse_retry_after('mañana') is None
+
+def test_parse_retry_after_http_date():
+    now = 1_700_000_000
+    value = email.utils.formatdate(now + 7, usegmt = True)
+    assert parse_retry_after(value, now = now) == 7.0
+    # una fecha pasada no pide esperar
+    assert parse_retry_after(value, now = now + 60) == 0.0
+
+def test_retry_after_is_capped():
+    client, calls, sleeps = make_client([429, 200], headers = {'Retry-After': '3600'})
+    assert client.get('/v1/links').status_code == 200
+    assert sleeps == [BACKOFF_MAX]
+
+def test_token_bucket_refills_at_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate = 5, burst = 2, clock = clock, sleep = clock.sleep)
+    # la rafaga no espera
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    # luego un token cada 1/rate segundos
+    assert bucket.acquire() == 0.2
+    assert bucket.acquire() == 0.2
+    assert clock.now == 0.4
+    # tras 1s sin uso se recupera la rafaga completa, pero no mas
+    clock.now += 1
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0.2
+
+def test_make_http_client_uses_limiter():
+    clock = FakeClock()
+    bucket = TokenBucket(rate = 10, burst = 1, clock = clock, sleep = clock.sleep)
+    client = make_http_client(httpx.MockTransport(lambda request: httpx.Response(200)), limiter = bucket)
+    for _ in range(3):
+        client.get('https://api.fintoc.test/v1/links')
+    assert abs(clock.now - 0.2) < 1e-9
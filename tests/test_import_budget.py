@@ -0,0 +1,21 @@
+import pytest
+
+from import_budget import IMPORT_BUDGET, find_deferred, get_top_level_imports, measure_imports
+
+def test_find_deferred_uses_top_level_package():
+    modules = ['json', 'pandas', 'langchain.agents', 'fintoc', 'thefuzz.process', 'streamlit']
+    assert find_deferred(modules) == ['fintoc', 'langchain', 'thefuzz']
+
+def test_top_level_imports_do_not_name_deferred_modules():
+    imports = get_top_level_imports()
+    assert imports
+    names = [statement.split()[1] for statement in imports]
+    assert find_deferred(names) == []
+
+def test_top_level_imports_within_budget():
+    pytest.importorskip("streamlit")
+    imports = get_top_level_imports()
+    # el mejor de tres, como el script
+    runs = [measure_imports(imports) for _ in range(3)]
+    assert min(run['seconds'] for run in runs) <= IMPORT_BUDGET
+    assert find_deferred(runs[0]['modules']) == []
@@ -0,0 +1,69 @@
+import threading
+
+from jobs import Job, JobRunner
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def wait(runner, job_id):
+    job = runner.get(job_id)
+    while not job.finished or job.finished_at is None:
+        threading.Event().wait(0.01)
+    return job
+
+def test_finished_jobs_are_evicted_after_ttl():
+    clock = FakeClock()
+    runner = JobRunner(max_workers = 1, finished_ttl = 60, clock = clock)
+    job_id = runner.submit(lambda report: 'resultado')
+    assert wait(runner, job_id).status == Job.DONE
+
+    clock.now += 30
+    assert runner.get(job_id) is not None
+    clock.now += 31
+    assert runner.get(job_id) is None
+
+def test_running_jobs_are_not_evicted():
+    clock = FakeClock()
+    runner = JobRunner(max_workers = 1, finished_ttl = 0, max_jobs = 1, clock = clock)
+    release = threading.Event()
+    running_id = runner.submit(lambda report: release.wait(5))
+    clock.now += 100
+    assert runner.get(running_id) is not None
+    release.set()
+    wait(runner, running_id)
+
+def test_registry_is_bounded():
+    clock = FakeClock()
+    runner = JobRunner(max_workers = 1, finished_ttl = 3600, max_jobs = 3, clock = clock)
+    job_ids = []
+    for n in range(6):
+        job_ids.append(runner.submit(lambda report, n = n: n))
+        wait(runner, job_ids[-1])
+        clock.now += 1
+    # los terminados mas antiguos se descartan primero
+    assert [runner.get(job_id) is not None for job_id in job_ids] == [False, False, False, True, True, True]
+    assert runner.get(job_ids[-1]).result == 5
+
+def test_task_sees_cancellation_without_reporting():
+    # una tarea cancelada que no vuelve a reportar igual puede evitar sus efectos (p.ej. escribir en un cache)
+    runner = JobRunner(max_workers = 1)
+    started, release = threading.Event(), threading.Event()
+    writes = []
+
+    def task(report):
+        started.set()
+        release.wait(5)
+        if not report.cancelled:
+            writes.append('cache')
+        return 'resultado'
+
+    job_id = runner.submit(task)
+    started.wait(5)
+    runner.cancel(job_id)
+    release.set()
+    wait(runner, job_id)
+    assert writes == []
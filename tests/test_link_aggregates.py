@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+
+from fake_fintoc import FakeFintoc
+from movement_store import MovementStore
+from process_movements import (combine_movement_aggregates, get_dataframe_movements_for_link_tokens, get_link_movement_aggregates,
+                               process_movements_dataframe)
+
+SINCE, UNTIL = '2022-01-01', '2023-07-01'
+
+@pytest.fixture(params = ['streaming', 'movement_store'])
+def movement_store(request, tmp_path):
+    return MovementStore(str(tmp_path / 'movements.db')) if request.param == 'movement_store' else None
+
+def test_combine_remaining_links_matches_fresh_run(movement_store):
+    fintoc_client = FakeFintoc(n_links = 3, n_accounts = 2, n_movements = 400, latency = 0)
+    link_aggregates = {link_token: get_link_movement_aggregates(link_token, SINCE, UNTIL, fintoc_client, movement_store = movement_store)
+                       for link_token in fintoc_client.link_tokens}
+    combine_movement_aggregates(link_aggregates.values()).finalize()
+
+    # se quita el link del medio: se combinan los agregados guardados de los que quedan
+    remaining = [fintoc_client.link_tokens[0], fintoc_client.link_tokens[2]]
+    expected = process_movements_dataframe(get_dataframe_movements_for_link_tokens(remaining, SINCE, UNTIL, fintoc_client))
+    # dos veces: combinar y finalizar no modifica los agregados por link
+    for _ in range(2):
+        result = combine_movement_aggregates([link_aggregates[link_token] for link_token in remaining]).finalize()
+        assert len(expected) > 0
+        pd.testing.assert_frame_equal(result, expected)
+        assert result.attrs == expected.attrs
@@ -0,0 +1,45 @@
+import pandas as pd
+
+from process_movements import fix_mirror_transfers, get_mirror_transfers_index
+from synthetic_movements import HOLDER_ID
+
+def transfer(link_id, post_date, amount, flow, category, recipient = None, product = 'Transferencias'):
+    # ya con `add_flow_columns` aplicado: monto absoluto y `flow`
+    return dict(link_id = link_id, link_holder_id = HOLDER_ID, post_date = pd.Timestamp(post_date), amount = amount,
+                flow = flow, category = category, product = product, recipient_account_holder_id = recipient)
+
+def make_movements_df():
+    rows = [
+        # par espejo entre dos links: sale de uno y entra al otro el mismo dia por el mismo monto
+        transfer('link_0', '2023-03-10', 500000, 'OUT', 'Transferencias a terceros', recipient = HOLDER_ID),
+        transfer('link_1', '2023-03-10', 500000, 'IN', 'Otros'),
+        # transferencia a un tercero con un ingreso del mismo monto ese dia: no es espejo
+        transfer('link_0', '2023-03-11', 80000, 'OUT', 'Transferencias a terceros', recipient = '111111111'),
+        transfer('link_1', '2023-03-11', 80000, 'IN', 'Otros', recipient = '222222222'),
+        # mismo monto y sentidos opuestos pero en dias distintos
+        transfer('link_0', '2023-03-12', 120000, 'OUT', 'Transferencias a terceros'),
+        transfer('link_1', '2023-03-20', 120000, 'IN', 'Otros'),
+        # transferencia sola
+        transfer('link_0', '2023-03-13', 45000, 'OUT', 'Transferencias a terceros'),
+        # el mismo par pero fuera de las transferencias
+        transfer('link_0', '2023-03-14', 9990, 'OUT', 'Compras', product = 'Otros'),
+        transfer('link_1', '2023-03-14', 9990, 'IN', 'Otros', product = 'Otros'),
+    ]
+    return pd.DataFrame(rows, index = range(10, 10 + len(rows)))
+
+def test_mirror_pair_across_links_is_found():
+    movements_df = make_movements_df()
+    mirror_index = get_mirror_transfers_index(movements_df, {HOLDER_ID})
+    assert list(mirror_index) == [10, 11]
+
+def test_non_mirror_transfers_are_kept():
+    movements_df = fix_mirror_transfers(make_movements_df(), {HOLDER_ID})
+    own_account = movements_df['category'] == 'Transferencias entre cuentas propias'
+    assert list(movements_df.index[own_account]) == [10, 11]
+    assert list(movements_df.loc[[12, 14, 16], 'category']) == ['Transferencias a terceros'] * 3
+
+def test_pair_with_third_party_recipient_is_not_mirror():
+    movements_df = make_movements_df()
+    # si la salida del 10 de marzo va a un tercero el par deja de ser espejo
+    movements_df.loc[10, 'recipient_account_holder_id'] = '333333333'
+    assert list(get_mirror_transfers_index(movements_df, {HOLDER_ID})) == []
@@ -0,0 +1,22 @@
+import pandas as pd
+import pytest
+
+from benchmark import legacy_final_view_monthly
+from process_movements import (add_flow_columns, build_movements_dataframe, categorize_movements, categorize_product_movements,
+                               fix_mirror_transfers, fix_own_account_transfers, get_final_view_monthly, get_income_and_savings)
+from synthetic_movements import generate_movements
+
+@pytest.mark.parametrize('n_movements, seed', [(3000, 0), (20000, 1)])
+def test_cube_view_matches_legacy_view(n_movements, seed):
+    movements_df = build_movements_dataframe(generate_movements(n_movements, n_links = 2, n_accounts = 3, seed = seed))
+    movements_df['category'] = categorize_movements(movements_df)
+    movements_df['product'] = categorize_product_movements(movements_df)
+    add_flow_columns(movements_df)
+    fix_own_account_transfers(movements_df)
+    fix_mirror_transfers(movements_df)
+    income_df, savings_df = get_income_and_savings(movements_df)
+
+    expected = legacy_final_view_monthly(movements_df, income_df, savings_df)
+    result = get_final_view_monthly(movements_df, income_df, savings_df)
+    assert len(result) > 0
+    pd.testing.assert_frame_equal(result, expected)
@@ -0,0 +1,72 @@
+import datetime as dt
+
+import pytest
+
+from fake_fintoc import FakeFintoc, FakeMovementsManager
+from movement_store import MOVEMENT_COLUMNS, MovementStore
+from process_movements import get_dataframe_movements_for_link_tokens
+
+@pytest.fixture
+def fetched_since(monkeypatch):
+    # registra el `since` de cada descarga de movimientos a Fintoc
+    calls = []
+    original_all = FakeMovementsManager.all
+
+    def all(self, since = None, until = None):
+        calls.append(since)
+        return original_all(self, since = since, until = until)
+
+    monkeypatch.setattr(FakeMovementsManager, 'all', all)
+    return calls
+
+def fetch(fintoc_client, since, until, movement_store = None):
+    return get_dataframe_movements_for_link_tokens(fintoc_client.link_tokens, since = since, until = until,
+                                                   fintoc_client = fintoc_client, movement_store = movement_store)
+
+def test_warm_run_fetches_from_watermark(tmp_path, fetched_since):
+    fintoc_client = FakeFintoc(n_links = 1, n_accounts = 1, n_movements = 200, latency = 0)
+    store = MovementStore(str(tmp_path / 'movements.db'))
+
+    cold_df = fetch(fintoc_client, '2022-01-01', '2022-12-31', store)
+    assert fetched_since == ['2022-01-01']
+
+    # la segunda ventana se traslapa con la primera: solo se pide desde la marca de agua
+    warm_df = fetch(fintoc_client, '2022-06-01', '2023-07-01', store)
+    watermark = cold_df['post_date'].max().strftime('%Y-%m-%d')
+    assert fetched_since == ['2022-01-01', watermark]
+
+    expected_df = fetch(fintoc_client, '2022-06-01', '2023-07-01')
+    assert sorted(warm_df['id']) == sorted(expected_df['id'])
+    assert warm_df['id'].is_unique
+
+def test_window_before_fetched_since_is_fetched_again(tmp_path, fetched_since):
+    fintoc_client = FakeFintoc(n_links = 1, n_accounts = 1, n_movements = 50, latency = 0)
+    store = MovementStore(str(tmp_path / 'movements.db'))
+    fetch(fintoc_client, '2022-06-01', '2022-12-31', store)
+    fetch(fintoc_client, '2022-01-01', '2022-12-31', store)
+    assert fetched_since == ['2022-06-01', '2022-01-01']
+
+def make_movements(ids, post_date = dt.date(2022, 3, 1), link_id = 'link_0', account_number = '001'):
+    movements = {column: [None] * len(ids) for column in MOVEMENT_COLUMNS}
+    movements.update(link_id = [link_id] * len(ids), account_number = [account_number] * len(ids), id = list(ids),
+                     amount = [1000] * len(ids), post_date = [post_date] * len(ids))
+    return movements
+
+def test_duplicate_movements_are_not_inserted_twice(tmp_path):
+    store = MovementStore(str(tmp_path / 'movements.db'))
+    store.save_movements('link_0', '001', '2022-01-01', make_movements(['a', 'b']))
+    store.save_movements('link_0', '001', '2022-03-01', make_movements(['b', 'c']))
+    movements = store.load_movements('link_0', '001', '2022-01-01', '2022-12-31')
+    assert sorted(movements['id']) == ['a', 'b', 'c']
+
+def test_delete_link_removes_movements_and_watermarks(tmp_path):
+    store = MovementStore(str(tmp_path / 'movements.db'))
+    store.save_movements('link_0', '001', '2022-01-01', make_movements(['a', 'b'], post_date = dt.date(2022, 5, 1)))
+    store.save_movements('link_1', '002', '2022-01-01', make_movements(['c'], dt.date(2022, 5, 1), 'link_1', '002'))
+    assert store.get_fetch_since('link_0', '001', '2022-01-01') == '2022-05-01'
+
+    store.delete_link('link_0')
+    assert store.load_movements('link_0', '001', '2022-01-01', '2022-12-31')['id'] == []
+    assert store.get_fetch_since('link_0', '001', '2022-01-01') == '2022-01-01'
+    # los demas links no se tocan
+    assert store.load_movements('link_1', '002', '2022-01-01', '2022-12-31')['id'] == ['c']
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+from process_movements import OwnAccountMatcher, get_own_account_desc_for_holder_name, is_own_account_description
+
+HOLDER_NAME = 'Juan Pérez González'
+OWN_ACCOUNT_GLOSAS = ['TRANSF A JUAN PEREZ', 'TEF JUAN PEREZ G', 'TRANSF CTA PROPIA 12345678-9']
+# como la arma fix_own_account_transfers
+COMPARE_LIST = get_own_account_desc_for_holder_name([HOLDER_NAME], OWN_ACCOUNT_GLOSAS) + [HOLDER_NAME]
+
+DESCRIPTIONS = [
+    # variantes del nombre del titular
+    'Juan Pérez González',
+    'JUAN PEREZ GONZALEZ',
+    'JUAN  PEREZ  GONZALEZ',
+    'juan perez gonzales',
+    'JUAN P GONZALEZ',
+    'JUAN PEREZ',
+    # con RUT
+    'TRANSF A JUAN PEREZ 12.345.678-9',
+    'TRANSF JUAN PEREZ 123456789',
+    '12.345.678-9',
+    # errores de tipeo cerca del umbral (80)
+    'TRANSF A JUAN PERES',
+    'TRANSF A JUAN PRZ',
+    'TEF JUAN PERE G',
+    'JUAN PERES GONZALES',
+    'JUAN PEDRO GONZALEZ',
+    # no son cuentas propias
+    'TRANSF A MARIA SOTO',
+    'COMPRA SUPERMERCADO LIDER',
+    'PAGO TAR CRED',
+    '',
+]
+
+@pytest.mark.parametrize('description', DESCRIPTIONS)
+def test_matcher_matches_reference(description):
+    assert OwnAccountMatcher(COMPARE_LIST).is_own_account(description) == is_own_account_description(description, COMPARE_LIST)
+
+def test_match_series_matches_reference():
+    descriptions = pd.Series(DESCRIPTIONS * 2, index = range(100, 100 + 2 * len(DESCRIPTIONS)))
+    expected = descriptions.map(lambda description: is_own_account_description(description, COMPARE_LIST))
+    result = OwnAccountMatcher(COMPARE_LIST).match(descriptions)
+    pd.testing.assert_series_equal(result, expected.astype(bool))
+
+def test_cases_straddle_threshold():
+    # si todas las glosas dieran lo mismo la paridad no probaria nada
+    results = {description: is_own_account_description(description, COMPARE_LIST) for description in DESCRIPTIONS}
+    assert results['JUAN P GONZALEZ'] and not results['JUAN PERES GONZALES']
+    assert not results['TRANSF A MARIA SOTO']
@@ -0,0 +1,69 @@
+import pytest
+
+from cache import DiskLRUCache, ResponseCache
+
+pytest.importorskip('langchain')
+from langchain_agent import run_agent
+
+class FakeMemory:
+    def __init__(self):
+        self.turns = []
+
+    def save_context(self, inputs, outputs):
+        self.turns.append((inputs['input'], outputs['output']))
+
+class FakeAgent:
+    """
+    Hace de agente (y de LLM): responde con un contador y guarda el turno en su memoria, como
+    lo hace el `AgentExecutor` de langchain.
+    """
+    def __init__(self):
+        self.calls = []
+        self.memory = FakeMemory()
+
+    def run(self, prompt, callbacks = None):
+        self.calls.append(prompt)
+        response = f'respuesta {len(self.calls)}'
+        self.memory.save_context({'input': prompt}, {'output': response})
+        return response
+
+@pytest.fixture
+def disk_path(tmp_path):
+    return str(tmp_path / 'responses.sqlite')
+
+def test_miss_calls_the_agent_and_caches_the_answer(disk_path):
+    response_cache, agent = ResponseCache(disk_cache = DiskLRUCache(disk_path)), FakeAgent()
+    response = run_agent(agent, '¿Cuánto gasto?', response_cache = response_cache, data_fingerprint = 'datos')
+    assert response == 'respuesta 1'
+    assert agent.calls == ['¿Cuánto gasto?']
+    assert response_cache.stats()['misses'] == 1
+
+def test_memory_hit_does_not_call_the_agent_but_records_the_turn(disk_path):
+    response_cache, agent = ResponseCache(disk_cache = DiskLRUCache(disk_path)), FakeAgent()
+    run_agent(agent, '¿Cuánto gasto?', response_cache = response_cache, data_fingerprint = 'datos')
+    # variacion trivial de la misma pregunta
+    response = run_agent(agent, 'cuanto gasto', response_cache = response_cache, data_fingerprint = 'datos')
+    assert response == 'respuesta 1'
+    assert len(agent.calls) == 1
+    assert response_cache.stats()['memory_hits'] == 1
+    assert agent.memory.turns == [('¿Cuánto gasto?', 'respuesta 1'), ('cuanto gasto', 'respuesta 1')]
+
+def test_disk_hit_survives_a_new_process(disk_path):
+    run_agent(FakeAgent(), '¿Cuánto ahorro?', response_cache = ResponseCache(disk_cache = DiskLRUCache(disk_path)), data_fingerprint = 'datos')
+
+    # otro proceso: cache en memoria vacio, mismo archivo en disco
+    response_cache, agent = ResponseCache(disk_cache = DiskLRUCache(disk_path)), FakeAgent()
+    response = run_agent(agent, '¿Cuánto ahorro?', response_cache = response_cache, data_fingerprint = 'datos')
+    assert response == 'respuesta 1'
+    assert agent.calls == []
+    assert response_cache.stats()['disk_hits'] == 1
+    assert agent.memory.turns == [('¿Cuánto ahorro?', 'respuesta 1')]
+
+def test_other_data_or_context_is_a_miss(disk_path):
+    response_cache, agent = ResponseCache(disk_cache = DiskLRUCache(disk_path)), FakeAgent()
+    run_agent(agent, '¿Cuánto gasto?', response_cache = response_cache, data_fingerprint = 'datos')
+    run_agent(agent, '¿Cuánto gasto?', response_cache = response_cache, data_fingerprint = 'otros datos')
+    run_agent(agent, '¿Cuánto gasto?', response_cache = response_cache, data_fingerprint = 'datos',
+              context = [('hola', 'hola!')])
+    assert len(agent.calls) == 3
+    assert response_cache.stats()['misses'] == 3
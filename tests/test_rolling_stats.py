@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from process_movements import build_movements_dataframe, make_rolling_stats, process_movements_dataframe
+from rolling_stats import RollingStats
+from synthetic_movements import generate_movements
+
+def monthly_values(n_months = 18, seed = 0):
+    rnd = np.random.default_rng(seed)
+    index = pd.Index([f'{2022 + month // 12}{month % 12 + 1:02d}' for month in range(n_months)], name = 'year_month')
+    return pd.DataFrame(dict(a = rnd.integers(0, 1000, n_months), b = rnd.integers(0, 1000, n_months)), index = index)
+
+@pytest.mark.parametrize('change', ['new_month', 'last_month', 'middle_month', 'removed_month', 'nothing'])
+def test_update_with_kept_state_matches_full_recompute(change):
+    values = monthly_values()
+    rolling_stats = RollingStats(4)
+    rolling_stats.update(values.iloc[:-1] if change == 'new_month' else values, complete = True)
+
+    updated = values.copy()
+    if change == 'last_month':
+        updated.iloc[-1, 0] += 500
+    elif change == 'middle_month':
+        updated.iloc[8, 1] -= 300
+    elif change == 'removed_month':
+        updated = updated.drop(updated.index[5])
+    medians = rolling_stats.update(updated, complete = True)
+    pd.testing.assert_frame_equal(medians, RollingStats(4).update(updated), check_dtype = False)
+
+def test_process_movements_with_kept_state_matches_fresh():
+    movements = build_movements_dataframe(generate_movements(20000, seed = 3))
+    last_month = movements.post_date.max().strftime('%Y-%m')
+    rolling_stats = make_rolling_stats()
+    process_movements_dataframe(movements[movements.post_date < last_month].copy(), rolling_stats = rolling_stats)
+
+    incremental = process_movements_dataframe(movements.copy(), rolling_stats = rolling_stats)
+    fresh = process_movements_dataframe(movements.copy())
+    pd.testing.assert_frame_equal(incremental, fresh)
@@ -0,0 +1,59 @@
+import itertools
+
+import pytest
+
+pytest.importorskip('langchain')
+from langchain_agent import StreamingAnswerHandler, extract_partial_final_answer
+
+FINAL_ANSWER = '```json\n{\n    "action": "Final Answer",\n    "action_input": "Tu renta es de \\"$1.500.000\\"\\ny ahorras 10%"\n}\n```'
+TOOL_ACTION = '```json\n{\n    "action": "PeriodTotal",\n    "action_input": "spendings 202301 202306"\n}\n```'
+EXPECTED_ANSWER = 'Tu renta es de "$1.500.000"\ny ahorras 10%'
+
+def split_tokens(text, size):
+    return [text[start:start + size] for start in range(0, len(text), size)]
+
+def stream(handler, tokens):
+    handler.on_llm_start({}, [])
+    for token in tokens:
+        handler.on_llm_new_token(token)
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 8, 1000])
+def test_partial_final_answer_across_token_boundaries(size):
+    answers = []
+    handler = StreamingAnswerHandler(on_answer = answers.append, clock = itertools.count().__next__)
+    stream(handler, split_tokens(FINAL_ANSWER, size))
+
+    assert answers[-1] == EXPECTED_ANSWER
+    # cada entrega extiende la anterior (nunca se muestra un escape a medias)
+    for previous, current in zip(answers, answers[1:]):
+        assert current.startswith(previous)
+    assert all('\\' not in answer for answer in answers)
+
+def test_no_answer_for_tool_actions():
+    answers, steps = [], []
+    handler = StreamingAnswerHandler(on_answer = answers.append, on_step = steps.append)
+    stream(handler, split_tokens(TOOL_ACTION, 3))
+    assert answers == []
+    assert extract_partial_final_answer(TOOL_ACTION) is None
+
+def test_answer_buffer_restarts_on_each_llm_call():
+    answers = []
+    handler = StreamingAnswerHandler(on_answer = answers.append, clock = itertools.count().__next__)
+    stream(handler, split_tokens(TOOL_ACTION, 4))
+    stream(handler, split_tokens(FINAL_ANSWER, 4))
+    handler.finish()
+
+    metrics = handler.metrics()
+    assert answers[-1] == EXPECTED_ANSWER
+    assert metrics['llm_calls'] == 2
+    assert metrics['time_to_first_token'] < metrics['time_to_first_answer_token'] < metrics['total_latency']
+
+@pytest.mark.parametrize('text, expected', [
+    ('{"action": "Final Answer", "action_input": "', None),
+    ('{"action": "Final Answer", "action_input": "Hola', 'Hola'),
+    ('{"action": "Final Answer", "action_input": "Hola \\', 'Hola '),
+    ('{"action": "Final Answer", "action_input": "Hola"}', 'Hola'),
+    ('{"action": "Final', None),
+])
+def test_extract_partial_final_answer(text, expected):
+    assert (extract_partial_final_answer(text) or None) == expected
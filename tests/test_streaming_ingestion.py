@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from fake_fintoc import FakeFintoc
+from process_movements import (MovementAggregates, build_movements_dataframe, get_dataframe_movements_for_link_tokens,
+                               get_movement_aggregates_for_link_tokens, process_movements_dataframe)
+from synthetic_movements import generate_movements
+
+def assert_same_view(result, expected):
+    assert len(expected) > 0
+    pd.testing.assert_frame_equal(result, expected)
+    assert result.attrs == expected.attrs
+
+def split_columns(columns, chunk_size):
+    n_rows = len(columns['id'])
+    for start in range(0, n_rows, chunk_size):
+        yield {column: values[start:start + chunk_size] for column, values in columns.items()}
+
+@pytest.mark.parametrize('chunk_size', [997, 5000, 100_000])
+def test_chunked_aggregates_match_dataframe_pipeline(chunk_size):
+    columns = generate_movements(20000, n_links = 2, n_accounts = 3, seed = 2)
+    expected = process_movements_dataframe(build_movements_dataframe(columns))
+
+    aggregates = MovementAggregates()
+    for chunk in split_columns(columns, chunk_size):
+        aggregates.add_chunk(chunk)
+    assert aggregates.rows == len(columns['id'])
+    assert_same_view(aggregates.finalize(), expected)
+
+def test_streaming_fetch_matches_dataframe_fetch():
+    fintoc_client = FakeFintoc(n_links = 2, n_accounts = 2, n_movements = 600, latency = 0)
+    fetch_args = dict(since = '2022-01-01', until = '2023-07-01', fintoc_client = fintoc_client)
+    expected = process_movements_dataframe(get_dataframe_movements_for_link_tokens(fintoc_client.link_tokens, **fetch_args))
+    aggregates = get_movement_aggregates_for_link_tokens(fintoc_client.link_tokens, chunk_size = 97, **fetch_args)
+    assert_same_view(aggregates.finalize(), expected)